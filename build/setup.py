@@ -40,6 +40,10 @@ shutil.copytree(SRC, DEST)
 for file in os.listdir(DEST):
     if file.endswith(".so"):
         abspath = os.path.join(DEST, file)
+        if file.startswith("_native"):
+            # Built by build_ext below.
+            os.remove(abspath)
+            continue
         with open(abspath, "w"):
             pass
 
@@ -61,6 +65,13 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     include_package_data=True,
+    ext_modules=[
+        setuptools.Extension(
+            "csanim._native",
+            sources=["csanim/_native.cpp", "csanim/draw.cpp", "csanim/interp.cpp"],
+            extra_compile_args=["-O3"],
+        ),
+    ],
 )
 
 shutil.rmtree(DEST)
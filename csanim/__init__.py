@@ -26,12 +26,16 @@ Available environment variables:
 * ``CSANIM_QUIET``: Don't print info about missing libs to stdout.
 * ``CSANIM_COMPILE``: If libs missing, compile without asking.
 * ``CSANIM_NO_COMPILE``: Never compile libs if missing.
-* ``CSANIM_IGNORE_FFMPEG``: Don't raise error if FFmpeg missing.
+
+Importing is fast and never prompts unless stdin is a terminal.
+OpenCV and Pillow are imported when first needed, and FFmpeg is only
+looked up when a video is rendered.
 """
 
 __version__ = "0.0.5"
 
 import os
+import sys
 import subprocess
 
 PARENT = os.path.dirname(os.path.realpath(__file__))
@@ -50,7 +54,7 @@ def check_libs():
     """
     Checks that all required Shared Object files are present.
     If some are missing, the user will be prompted from stdin
-    to compile them.
+    to compile them (only if stdin is a terminal).
 
     If the compilation fails (either error or user says no),
     the module will be empty (no useful attributes).
@@ -60,14 +64,14 @@ def check_libs():
     missing = False
     for lib in REQUIRED_LIBS:
         path = os.path.join(PARENT, lib)
-        if not os.path.isfile(path):
+        # Wheels ship empty placeholder files, so check the size too.
+        try:
+            present = os.stat(path).st_size >= 10
+        except OSError:
+            present = False
+        if not present:
             verbose(f"csanim: {lib} missing")
             missing = True
-        else:
-            with open(path, "rb") as file:
-                if len(file.read(10)) < 10:
-                    verbose(f"csanim: {lib} missing")
-                    missing = True
 
     if missing:
         verbose("csanim: some libraries missing.")
@@ -77,7 +81,7 @@ def check_libs():
         else:
             env = "CSANIM_COMPILE" in os.environ
             inp = False
-            if not env:
+            if not env and sys.stdin is not None and sys.stdin.isatty():
                 try:
                     inp = input("csanim: compile libraries? [y/N] ").lower().strip() == "y"
                 except EOFError:
@@ -98,18 +102,42 @@ def check_libs():
     return True
 
 
-if check_libs():
+def has_native():
+    """
+    Checks whether the compiled extension module is available.
+    If it is, the Shared Object files aren't needed.
+    """
+    try:
+        from . import _native
+        return True
+    except ImportError:
+        return False
+
+
+if has_native() or check_libs():
     from .constants import *
+    from .effects import *
     from .elements import *
+    from .structures import *
+    from .encoder import Output
     from .lib import draw
+    from . import bake
+    from . import batch
+    from . import easing
+    from . import progress
     from . import props
+    from . import rawstore
+    from . import serialize
     from .scene import *
+    from .transform import Transform
     from .utils import empty, getres
     from .video import Video
 else:
     verbose("csanim: module empty because libraries missing")
 
 del os
+del sys
 del subprocess
 del PARENT
 del check_libs
+del has_native
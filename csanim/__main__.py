@@ -0,0 +1,127 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Command line interface. Run ``python -m csanim --help`` for usage.
+"""
+
+import re
+import argparse
+from . import distributed
+from . import rawstore
+from . import watch as watch_mode
+from .encoder import Output
+from .progress import JSONLinesSink, TerminalSink
+
+PROGRESS = {
+    "terminal": TerminalSink,
+    "json": JSONLinesSink,
+}
+
+
+def parse_output(spec):
+    """
+    Parses ``PATH[:VENCODE[:WxH[:BITRATE]]]``. Paths may contain colons
+    (e.g. ``C:\\video.mp4``): the most trailing fields that are valid options
+    are used, and the rest is the path. End a path that could be mistaken
+    for options with ``:::``.
+    """
+    fields = (r"[\w-]*", r"(\d+[xX]\d+)?", r"(\d+(\.\d+)?[kKmMgG]?)?")
+    for count in range(3, 0, -1):
+        path, *rest = spec.rsplit(":", count)
+        if path and len(rest) == count and all(re.fullmatch(f, r) for f, r in zip(fields, rest)):
+            break
+    else:
+        path, rest = spec, []
+
+    kwargs = {}
+    if len(rest) > 0 and rest[0]:
+        kwargs["vencode"] = rest[0]
+    if len(rest) > 1 and rest[1]:
+        kwargs["resolution"] = tuple(map(int, rest[1].lower().split("x")))
+    if len(rest) > 2 and rest[2]:
+        kwargs["bitrate"] = rest[2]
+    return Output(path, **kwargs)
+
+
+def encode(args):
+    store = rawstore.RawStore.open(args.store)
+    rawstore.encode(store, args.output, PROGRESS[args.progress]())
+
+
+def render(args):
+    distributed.render_distributed(args.script, args.output, args.workers, args.chunk, args.vencode,
+        args.video, args.retries, args.worker_cmd, PROGRESS[args.progress](), args.timeout)
+
+
+def watch(args):
+    watch_mode.watch(args.script, args.output, args.video, args.vencode, args.interval, PROGRESS[args.progress]())
+
+
+def worker(args):
+    distributed.worker()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m csanim", description="CS Animation tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_encode = subparsers.add_parser("encode", help="Encode a raw frame store into videos.")
+    parser_encode.add_argument("store", help="Path to raw frame store written by Video.render(raw_path=...)")
+    parser_encode.add_argument("-o", "--output", type=parse_output, action="append", required=True,
+        metavar="PATH[:VENCODE[:WxH[:BITRATE]]]", help="Output video. Can be given multiple times.")
+    parser_encode.add_argument("--progress", choices=PROGRESS, default="terminal",
+        help="Progress format. \"json\" writes one JSON object per line.")
+    parser_encode.set_defaults(func=encode)
+
+    parser_render = subparsers.add_parser("render", help="Render a video script with several worker processes.")
+    parser_render.add_argument("script", help="Script that builds the video.")
+    parser_render.add_argument("output", help="Output video file path.")
+    parser_render.add_argument("--video", help="Name of the video variable in the script.")
+    parser_render.add_argument("-v", "--vencode", default="libx265", help="Video encoding.")
+    parser_render.add_argument("-j", "--workers", type=int, help="Number of local workers.")
+    parser_render.add_argument("--chunk", type=int, help="Frames per range.")
+    parser_render.add_argument("--retries", type=int, default=2, help="Times a failed range is retried.")
+    parser_render.add_argument("--timeout", type=float, help="Seconds a range may take before its worker is killed.")
+    parser_render.add_argument("--worker-cmd", action="append",
+        help="Command that starts a worker, e.g. \"ssh host python3 -m csanim worker\". "
+        "Can be given multiple times, one per worker.")
+    parser_render.add_argument("--progress", choices=PROGRESS, default="terminal",
+        help="Progress format. \"json\" writes one JSON object per line.")
+    parser_render.set_defaults(func=render)
+
+    parser_watch = subparsers.add_parser("watch",
+        help="Render a video script, and re-render the scenes that change whenever it is saved.")
+    parser_watch.add_argument("script", help="Script that builds the video.")
+    parser_watch.add_argument("output", help="Preview video file path. Scene segments are kept in OUTPUT_watch.")
+    parser_watch.add_argument("--video", help="Name of the video variable in the script.")
+    parser_watch.add_argument("-v", "--vencode", default="libx264", help="Video encoding.")
+    parser_watch.add_argument("--interval", type=float, default=0.5, help="Seconds between checks for changes.")
+    parser_watch.add_argument("--progress", choices=PROGRESS, default="terminal",
+        help="Progress format. \"json\" writes one JSON object per line.")
+    parser_watch.set_defaults(func=watch)
+
+    parser_worker = subparsers.add_parser("worker", help="Run a render worker on stdin/stdout.")
+    parser_worker.set_defaults(func=worker)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+main()
@@ -0,0 +1,332 @@
+//
+//  CS Animation
+//  A tool for creating computer science explanatory videos.
+//  Copyright Patrick Huang 2021
+//
+//  This program is free software: you can redistribute it and/or modify
+//  it under the terms of the GNU General Public License as published by
+//  the Free Software Foundation, either version 3 of the License, or
+//  (at your option) any later version.
+//
+//  This program is distributed in the hope that it will be useful,
+//  but WITHOUT ANY WARRANTY; without even the implied warranty of
+//  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+//  GNU General Public License for more details.
+//
+//  You should have received a copy of the GNU General Public License
+//  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+//
+
+/*
+CPython extension exposing the functions in draw.cpp and interp.cpp.
+Images are taken through the buffer protocol, and the GIL is released
+while pixels are drawn.
+Compiled with draw.cpp and interp.cpp (see setup.py and Makefile).
+*/
+
+#define  PY_SSIZE_T_CLEAN
+
+#include <Python.h>
+
+typedef  unsigned char  UCH;
+typedef  unsigned int   UINT;
+typedef  const double   CD;
+
+extern "C" {
+    void fill(UCH*, const UINT, const UINT, CD, CD, CD, CD);
+    void line(UCH*, const UINT, const UINT, CD, CD, CD, CD, CD, CD, CD, CD, CD);
+    void circle(UCH*, const UINT, const UINT, CD, CD, CD, CD, CD, CD, CD, CD);
+    void rect(UCH*, const UINT, const UINT, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD);
+    void arrow(UCH*, const UINT, const UINT, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD, CD);
+    void circles(UCH*, const UINT, const UINT, const double*, const UINT, const double*);
+    void rects(UCH*, const UINT, const UINT, const double*, const UINT, const double*);
+    void polylines(UCH*, const UINT, const UINT, const double*, const UINT*, const UINT, CD, const UINT,
+        const UINT, const UINT, CD, CD, const UINT, const double*, const double*);
+    double linear(CD, CD, CD, CD, CD);
+    double sine(CD, CD, CD, CD, CD);
+    double ease(const double*, const UINT, CD, CD, CD, CD, CD);
+}
+
+
+static bool check_image(Py_buffer* buf, const UINT width, const UINT height) {
+    /*
+    Checks that the buffer is large enough for an image. Sets an exception if not.
+
+    :param buf: Image buffer.
+    :param width: Image width.
+    :param height: Image height.
+    */
+    if (buf->len < (Py_ssize_t)width * height * 3) {
+        PyBuffer_Release(buf);
+        PyErr_SetString(PyExc_ValueError, "Image buffer smaller than width*height*3.");
+        return false;
+    }
+    return true;
+}
+
+static PyObject* py_fill(PyObject* self, PyObject* args) {
+    Py_buffer buf;
+    UINT width, height;
+    double r, g, b, a;
+    if (!PyArg_ParseTuple(args, "w*IIdddd", &buf, &width, &height, &r, &g, &b, &a))
+        return NULL;
+    if (!check_image(&buf, width, height))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    fill((UCH*)buf.buf, width, height, r, g, b, a);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static PyObject* py_line(PyObject* self, PyObject* args) {
+    Py_buffer buf;
+    UINT width, height;
+    double x1, y1, x2, y2, thick, r, g, b, a;
+    if (!PyArg_ParseTuple(args, "w*IIddddddddd", &buf, &width, &height, &x1, &y1, &x2, &y2,
+            &thick, &r, &g, &b, &a))
+        return NULL;
+    if (!check_image(&buf, width, height))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    line((UCH*)buf.buf, width, height, x1, y1, x2, y2, thick, r, g, b, a);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static PyObject* py_circle(PyObject* self, PyObject* args) {
+    Py_buffer buf;
+    UINT width, height;
+    double cx, cy, rad, border, r, g, b, a;
+    if (!PyArg_ParseTuple(args, "w*IIdddddddd", &buf, &width, &height, &cx, &cy, &rad, &border,
+            &r, &g, &b, &a))
+        return NULL;
+    if (!check_image(&buf, width, height))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    circle((UCH*)buf.buf, width, height, cx, cy, rad, border, r, g, b, a);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static PyObject* py_rect(PyObject* self, PyObject* args) {
+    Py_buffer buf;
+    UINT width, height;
+    double dx, dy, dw, dh, border, border_rad, tl_rad, tr_rad, bl_rad, br_rad, r, g, b, a;
+    if (!PyArg_ParseTuple(args, "w*IIdddddddddddddd", &buf, &width, &height, &dx, &dy, &dw, &dh,
+            &border, &border_rad, &tl_rad, &tr_rad, &bl_rad, &br_rad, &r, &g, &b, &a))
+        return NULL;
+    if (!check_image(&buf, width, height))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    rect((UCH*)buf.buf, width, height, dx, dy, dw, dh, border, border_rad, tl_rad, tr_rad, bl_rad, br_rad,
+        r, g, b, a);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static PyObject* py_arrow(PyObject* self, PyObject* args) {
+    Py_buffer buf;
+    UINT width, height;
+    double x1, y1, x2, y2, angle, side_len_fac, thick, r, g, b, a;
+    if (!PyArg_ParseTuple(args, "w*IIddddddddddd", &buf, &width, &height, &x1, &y1, &x2, &y2,
+            &angle, &side_len_fac, &thick, &r, &g, &b, &a))
+        return NULL;
+    if (!check_image(&buf, width, height))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    arrow((UCH*)buf.buf, width, height, x1, y1, x2, y2, angle, side_len_fac, thick, r, g, b, a);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static PyObject* py_shapes(PyObject* args, const Py_ssize_t row,
+        void (*draw)(UCH*, const UINT, const UINT, const double*, const UINT, const double*)) {
+    /*
+    Parses (img, width, height, data, count, transform) and draws count rows of shape data.
+
+    :param args: Arguments.
+    :param row: Doubles per shape.
+    :param draw: Drawing function.
+    */
+    Py_buffer buf, data, tf;
+    UINT width, height, count;
+    if (!PyArg_ParseTuple(args, "w*IIy*Iy*", &buf, &width, &height, &data, &count, &tf))
+        return NULL;
+    if (data.len < (Py_ssize_t)(count * row * sizeof(double)) || tf.len < (Py_ssize_t)(6 * sizeof(double))) {
+        PyBuffer_Release(&tf);
+        PyBuffer_Release(&data);
+        PyBuffer_Release(&buf);
+        PyErr_SetString(PyExc_ValueError, "Shape or transform buffer too small.");
+        return NULL;
+    }
+    if (!check_image(&buf, width, height)) {
+        PyBuffer_Release(&tf);
+        PyBuffer_Release(&data);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    draw((UCH*)buf.buf, width, height, (const double*)data.buf, count, (const double*)tf.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&tf);
+    PyBuffer_Release(&data);
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static PyObject* py_circles(PyObject* self, PyObject* args) {
+    return py_shapes(args, 8, circles);
+}
+
+static PyObject* py_rects(PyObject* self, PyObject* args) {
+    return py_shapes(args, 10, rects);
+}
+
+static PyObject* py_polylines(PyObject* self, PyObject* args) {
+    Py_buffer buf, points, counts, colors, tf;
+    UINT width, height, paths, cap_style, join_style, closed, heads;
+    double thick, head_len, head_width;
+    if (!PyArg_ParseTuple(args, "w*IIy*y*IdIIIddIy*y*", &buf, &width, &height, &points, &counts, &paths,
+            &thick, &cap_style, &join_style, &closed, &head_len, &head_width, &heads, &colors, &tf))
+        return NULL;
+
+    // Check the point, count and color arrays cover all paths.
+    unsigned long long total = 0;
+    bool ok = counts.len >= (Py_ssize_t)(paths * sizeof(UINT));
+    for (UINT i = 0; ok && i < paths; i++)
+        total += ((const UINT*)counts.buf)[i];
+    ok = ok && points.len >= (Py_ssize_t)(total * 2 * sizeof(double));
+    ok = ok && colors.len >= (Py_ssize_t)(paths * 4 * sizeof(double));
+    ok = ok && tf.len >= (Py_ssize_t)(6 * sizeof(double));
+    if (!ok) {
+        PyBuffer_Release(&tf);
+        PyBuffer_Release(&counts);
+        PyBuffer_Release(&colors);
+        PyBuffer_Release(&points);
+        PyBuffer_Release(&buf);
+        PyErr_SetString(PyExc_ValueError, "Points, counts, colors or transform buffer too small.");
+        return NULL;
+    }
+    if (!check_image(&buf, width, height)) {
+        PyBuffer_Release(&tf);
+        PyBuffer_Release(&counts);
+        PyBuffer_Release(&colors);
+        PyBuffer_Release(&points);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    polylines((UCH*)buf.buf, width, height, (const double*)points.buf, (const UINT*)counts.buf, paths, thick,
+        cap_style, join_style, closed, head_len, head_width, heads, (const double*)colors.buf, (const double*)tf.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&tf);
+    PyBuffer_Release(&counts);
+    PyBuffer_Release(&colors);
+    PyBuffer_Release(&points);
+    PyBuffer_Release(&buf);
+    Py_RETURN_NONE;
+}
+
+static bool parse_doubles(PyObject* const* args, const Py_ssize_t nargs, double* out, const Py_ssize_t count) {
+    /*
+    Converts fastcall arguments to doubles. Sets an exception on failure.
+
+    :param args: Arguments.
+    :param nargs: Number of arguments given.
+    :param out: Output array.
+    :param count: Number of arguments expected.
+    */
+    if (nargs != count) {
+        PyErr_Format(PyExc_TypeError, "expected %zd arguments, got %zd", count, nargs);
+        return false;
+    }
+    for (Py_ssize_t i = 0; i < count; i++) {
+        out[i] = PyFloat_AsDouble(args[i]);
+        if (out[i] == -1 && PyErr_Occurred())
+            return false;
+    }
+    return true;
+}
+
+static PyObject* py_linear(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    double v[5];
+    if (!parse_doubles(args, nargs, v, 5))
+        return NULL;
+    return PyFloat_FromDouble(linear(v[0], v[1], v[2], v[3], v[4]));
+}
+
+static PyObject* py_sine(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    double v[5];
+    if (!parse_doubles(args, nargs, v, 5))
+        return NULL;
+    return PyFloat_FromDouble(sine(v[0], v[1], v[2], v[3], v[4]));
+}
+
+static PyObject* py_ease(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    /*
+    The table is a bytes object of float64 samples, so it can be bound once
+    with functools.partial and read without the buffer protocol.
+    */
+    if (nargs < 1 || !PyBytes_Check(args[0])) {
+        PyErr_SetString(PyExc_TypeError, "table must be bytes");
+        return NULL;
+    }
+    const Py_ssize_t size = PyBytes_GET_SIZE(args[0]) / (Py_ssize_t)sizeof(double);
+    if (size < 2) {
+        PyErr_SetString(PyExc_ValueError, "table needs at least 2 samples");
+        return NULL;
+    }
+    double v[5];
+    if (!parse_doubles(args+1, nargs-1, v, 5))
+        return NULL;
+    return PyFloat_FromDouble(ease((const double*)PyBytes_AS_STRING(args[0]), (UINT)size,
+        v[0], v[1], v[2], v[3], v[4]));
+}
+
+
+static PyMethodDef methods[] = {
+    {"fill", py_fill, METH_VARARGS, "fill(img, width, height, r, g, b, a)"},
+    {"line", py_line, METH_VARARGS, "line(img, width, height, x1, y1, x2, y2, thick, r, g, b, a)"},
+    {"circle", py_circle, METH_VARARGS, "circle(img, width, height, cx, cy, rad, border, r, g, b, a)"},
+    {"rect", py_rect, METH_VARARGS, "rect(img, width, height, dx, dy, dw, dh, border, border_rad, "
+        "tl_rad, tr_rad, bl_rad, br_rad, r, g, b, a)"},
+    {"arrow", py_arrow, METH_VARARGS, "arrow(img, width, height, x1, y1, x2, y2, angle, side_len_fac, "
+        "thick, r, g, b, a)"},
+    {"circles", py_circles, METH_VARARGS, "circles(img, width, height, data, count, transform)"},
+    {"rects", py_rects, METH_VARARGS, "rects(img, width, height, data, count, transform)"},
+    {"polylines", py_polylines, METH_VARARGS, "polylines(img, width, height, points, counts, paths, thick, "
+        "cap_style, join_style, closed, head_len, head_width, heads, colors, transform)"},
+    {"linear", (PyCFunction)(void(*)(void))py_linear, METH_FASTCALL, "linear(f1, f2, v1, v2, frame)"},
+    {"sine", (PyCFunction)(void(*)(void))py_sine, METH_FASTCALL, "sine(f1, f2, v1, v2, frame)"},
+    {"ease", (PyCFunction)(void(*)(void))py_ease, METH_FASTCALL, "ease(table, f1, f2, v1, v2, frame)"},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT,
+    "_native",
+    "Native drawing and interpolation functions.",
+    -1,
+    methods,
+};
+
+PyMODINIT_FUNC PyInit__native(void) {
+    return PyModule_Create(&module);
+}
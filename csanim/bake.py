@@ -0,0 +1,213 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Pre-baked animation timelines.
+
+Baking evaluates every animated numeric property of every element of a
+scene at each of the scene's frames, into one contiguous array. Once a
+bake is attached, properties read their values from it by index instead
+of interpolating keyframes.
+
+The array can live in shared memory, so worker processes attach to it
+by name instead of re-evaluating keyframes, and it can be saved to disk
+and loaded later.
+"""
+
+__all__ = (
+    "Bake",
+)
+
+import sys
+import numpy as np
+from typing import List, Tuple, TYPE_CHECKING
+from .props import BoolProp, FloatProp, Property
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory
+
+
+def baked_props(scene) -> List[Property]:
+    """
+    Props of a scene that are baked, in a stable order: float and bool props
+    with at least two keyframes. Other props are cheap to evaluate, or not numeric.
+
+    :param scene: The scene.
+    """
+    props = []
+    for element in getattr(scene, "elements", []):
+        for name, prop in element.props():
+            if isinstance(prop, (FloatProp, BoolProp)) and len(prop.keyframes) >= 2:
+                props.append(prop)
+    return props
+
+
+def _attach_shm(name: str) -> "shared_memory.SharedMemory":
+    """
+    Internal function.
+    Attaches to existing shared memory without letting this process's
+    resource tracker free it on exit; only the creator should.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+
+    # Before Python 3.13, attaching registers the memory with the resource
+    # tracker, which unlinks it when this process exits, while the creator
+    # may still use it. Unregistering may also drop the creator's own
+    # registration if the tracker is shared (multiprocessing children), so
+    # the creator registers again before unlinking, see ``Bake.close``.
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class Bake:
+    """
+    A baked scene timeline: a (frames, props) float64 array and the number of
+    keyframes each prop had, used to check it is attached to the same scene.
+
+    Pickling a bake that is in shared memory only sends its name, so it is
+    cheap to pass to worker processes.
+    """
+    values: np.ndarray
+    layout: Tuple[int, ...]
+
+    def __init__(self, values: np.ndarray, layout: Tuple[int, ...], shm: "shared_memory.SharedMemory" = None) -> None:
+        self.values = values
+        self.layout = tuple(layout)
+        self._shm = shm
+        self._owner = False
+        self._attached = []
+
+    @classmethod
+    def bake(cls, scene, fps: float, shared: bool = False) -> "Bake":
+        """
+        Evaluates the scene's props at every frame. Doesn't attach the bake.
+
+        :param scene: The scene.
+        :param fps: Frames per second the scene will be rendered at.
+        :param shared: Whether to put the values in shared memory.
+        """
+        props = baked_props(scene)
+        for prop in props:
+            prop._baked = None
+        frames = int(scene.length*fps)
+        shape = (frames, len(props))
+
+        shm = None
+        if shared and frames*len(props) > 0:
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(create=True, size=frames*len(props)*8)
+            values = np.ndarray(shape, np.float64, shm.buf)
+        else:
+            values = np.empty(shape, np.float64)
+
+        for i, prop in enumerate(props):
+            values[:, i] = prop.values(np.arange(frames))
+
+        bake = cls(values, [len(prop.keyframes) for prop in props], shm)
+        bake._owner = shm is not None
+        return bake
+
+    @property
+    def name(self) -> str:
+        """
+        Shared memory name, or None if not shared.
+        """
+        return None if self._shm is None else self._shm.name
+
+    def attach(self, scene) -> None:
+        """
+        Makes the scene's props read from this bake.
+        Adding a keyframe to a prop detaches it again.
+
+        :param scene: The scene. Must be built the same way as the baked one.
+        """
+        props = baked_props(scene)
+        if tuple(len(prop.keyframes) for prop in props) != self.layout:
+            raise ValueError("Bake doesn't match the scene's props.")
+        for i, prop in enumerate(props):
+            prop._baked = self.values[:, i]
+        self._attached.extend(props)
+
+    @staticmethod
+    def detach(scene) -> None:
+        """
+        Makes the scene's props interpolate keyframes again.
+
+        :param scene: The scene.
+        """
+        for prop in baked_props(scene):
+            prop._baked = None
+
+    def save(self, path: str) -> None:
+        """
+        Saves to a ``.npz`` file.
+
+        :param path: File path.
+        """
+        np.savez(path, values=self.values, layout=np.array(self.layout, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str) -> "Bake":
+        """
+        Loads a bake saved with ``save``.
+
+        :param path: File path.
+        """
+        with np.load(path) as data:
+            return cls(data["values"], data["layout"].tolist())
+
+    def __getstate__(self):
+        if self._shm is None:
+            return {"values": self.values, "layout": self.layout}
+        return {"name": self._shm.name, "shape": self.values.shape, "layout": self.layout}
+
+    def __setstate__(self, state):
+        self.layout = state["layout"]
+        self._owner = False
+        self._attached = []
+        if "name" in state:
+            self._shm = _attach_shm(state["name"])
+            self.values = np.ndarray(state["shape"], np.float64, self._shm.buf)
+        else:
+            self._shm = None
+            self.values = state["values"]
+
+    def close(self) -> None:
+        """
+        Detaches from all props and releases shared memory.
+        The creator also frees the memory.
+        """
+        for prop in self._attached:
+            if prop._baked is not None and prop._baked.base is self.values:
+                prop._baked = None
+        self._attached = []
+
+        if self._shm is not None:
+            self.values = None
+            self._shm.close()
+            if self._owner:
+                if sys.version_info < (3, 13):
+                    from multiprocessing import resource_tracker
+                    # Workers may have dropped the registration that unlink() removes.
+                    resource_tracker.register(self._shm._name, "shared_memory")
+                self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,298 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Batch rendering of many variants of one template video.
+
+Each variant is the template with some props overridden, e.g. a label's
+text or a color. The overrides of all variants are compared first to
+find the work they share:
+
+* Scenes that no variant changes are rendered and encoded once, and
+  every variant's video reuses the encoded segment.
+* In a scene where variants only change later elements, the elements
+  below the first changed one are rendered once into a raw frame store,
+  and each variant only draws the layers from there up.
+* Scenes whose own props change, that define their own ``render``, or
+  that have effects, are rendered whole for each variant.
+
+Variants are spread across a process pool, and each variant's segments
+are joined with FFmpeg without re-encoding.
+"""
+
+__all__ = (
+    "Variant",
+    "render_batch",
+)
+
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Sequence, Tuple, Union
+from .elements import Element
+from .encoder import EncoderSet, Output, concat, find_ffmpeg
+from .progress import ProgressSink, ProgressTracker
+from .props import Property, VectorProp
+from .rawstore import RawStore
+from .scene import Scene
+from .utils import empty
+from .video import Video, _render_into
+
+# (scene index, element index or -1 for the scene itself, prop name, value)
+Override = Tuple[int, int, str, Any]
+
+
+class Variant:
+    """
+    One video of a batch render.
+
+    * ``path``: Output video file path. Overwritten if it exists.
+    * ``overrides``: ``{(element or scene, prop name): value}``, where the
+      element or scene is part of the template video. The value is either a
+      ``Property`` (or ``VectorProp``) that replaces the prop, or a constant
+      the prop holds for the whole video.
+    """
+    path: str
+    overrides: Dict[Tuple[Union[Element, Scene], str], Any]
+
+    def __init__(self, path: str, overrides: Dict[Tuple[Union[Element, Scene], str], Any] = None) -> None:
+        self.path = path
+        self.overrides = {} if overrides is None else overrides
+
+
+def _resolve(template: Video, variant: Variant) -> List[Override]:
+    """
+    Internal function.
+    Finds where each override is in the template, so it can be sent to
+    worker processes (which have their own copy of the template).
+    """
+    positions = {}
+    for si, scene in enumerate(template.scenes):
+        positions.setdefault(id(scene), []).append((si, -1))
+        for ei, element in enumerate(getattr(scene, "elements", ())):
+            positions.setdefault(id(element), []).append((si, ei))
+
+    overrides = []
+    for (obj, name), value in variant.overrides.items():
+        if id(obj) not in positions:
+            raise ValueError(f"{type(obj).__name__} in {variant.path} overrides is not in the template video.")
+        if not isinstance(getattr(obj, name, None), (Property, VectorProp)):
+            raise ValueError(f"{type(obj).__name__} has no prop {name}.")
+        overrides.extend((si, ei, name, value) for si, ei in positions[id(obj)])
+    return overrides
+
+
+def _layered(scene: Scene) -> bool:
+    """
+    Internal function.
+    Whether a scene is drawn as a stack of its elements, so the bottom ones can be cached.
+    Effects on the whole scene need every element drawn first.
+    """
+    return type(scene).render is Scene.render and not scene.effects
+
+
+def _override_prop(prop: Union[Property, VectorProp], value: Any) -> Union[Property, VectorProp]:
+    if isinstance(value, (Property, VectorProp)):
+        return value
+    if isinstance(prop, VectorProp):
+        return VectorProp(prop.type, prop.length, tuple(value))
+    return type(prop)(value)
+
+
+# The template, sent once to each worker process.
+_template: Video = None
+
+
+def _init_worker(template: Video) -> None:
+    global _template
+    _template = template
+
+
+def _apply(video: Video, overrides: Sequence[Override]) -> List[Tuple[Any, str, Any]]:
+    """
+    Internal function.
+    Applies overrides in place, and returns what is needed to undo them.
+    """
+    saved = []
+    for si, ei, name, value in overrides:
+        scene = video.scenes[si]
+        obj = scene if ei == -1 else scene.elements[ei]
+        prop = getattr(obj, name)
+        saved.append((obj, name, prop))
+        setattr(obj, name, _override_prop(prop, value))
+    return saved
+
+
+def _restore(video: Video, saved: List[Tuple[Any, str, Any]]) -> None:
+    for obj, name, prop in reversed(saved):
+        setattr(obj, name, prop)
+
+
+def _render_background(path: str, scene_index: int, end: int) -> int:
+    """
+    Internal function.
+    Renders the elements below ``end`` of a template scene into a raw frame store.
+    """
+    video = _template
+    scene = video.scenes[scene_index]
+    frames = int(scene.length*video.fps)
+    store = RawStore.create(path, video.resolution, video.fps, [0, frames])
+    buf = empty(video.resolution)
+    for frame in range(frames):
+        buf.fill(0)
+        store[frame] = scene.render_over(buf, frame, video.fps, 0, end)
+    store.flush()
+    return frames
+
+
+def _render_segment(video: Video, path: str, vencode: str, scene_index: int, start: int = 0,
+        background: str = None) -> int:
+    """
+    Internal function.
+    Renders and encodes one scene. If ``background`` is given, elements from
+    ``start`` are drawn over the frames in that raw frame store.
+    """
+    scene = video.scenes[scene_index]
+    frames = int(scene.length*video.fps)
+    store = None if background is None else RawStore.open(background)
+    buf = empty(video.resolution)
+
+    encoders = EncoderSet([Output(path, vencode)], video.resolution, video.fps)
+    done = False
+    try:
+        for frame in range(frames):
+            if store is None:
+                img = _render_into(scene, video.resolution, frame, video.fps, buf)
+            else:
+                buf[:] = store[frame]
+                img = scene.render_over(buf, frame, video.fps, start)
+            encoders.write(img)
+        done = True
+    finally:
+        encoders.close(check=done)
+    return frames
+
+
+def _render_shared(path: str, vencode: str, scene_index: int) -> int:
+    return _render_segment(_template, path, vencode, scene_index)
+
+
+def _render_variant(path: str, vencode: str, overrides: List[Override], plan: List[tuple],
+        tmp_dir: str, index: int) -> int:
+    """
+    Internal function.
+    Renders the varying scenes of one variant and joins all its segments.
+
+    ``plan`` has one entry per scene (with frames): ``("shared", segment path)``
+    or ``("render", first element to draw, background store path or None)``.
+    """
+    video = _template
+    ext = os.path.splitext(path)[1]
+    saved = _apply(video, overrides)
+    try:
+        segments = []
+        frames = 0
+        for scene_index, entry in plan:
+            if entry[0] == "shared":
+                segments.append(entry[1])
+            else:
+                segment = os.path.join(tmp_dir, f"variant{index}_scene{scene_index}{ext}")
+                frames += _render_segment(video, segment, vencode, scene_index, *entry[1:])
+                segments.append(segment)
+    finally:
+        _restore(video, saved)
+
+    concat(segments, path)
+    return frames
+
+
+def render_batch(template: Video, variants: Sequence[Variant], vencode: str = "libx265",
+        workers: int = None, tmp_dir: str = None, progress: ProgressSink = None) -> None:
+    """
+    Renders one video per variant of a template, sharing the frames that
+    don't differ between variants. See the module docstring.
+
+    Props are overridden by replacing them, so changing a prop's keyframes
+    in place doesn't count as an override.
+
+    :param template: The template video.
+    :param variants: The variants.
+    :param vencode: Video encoding. All segments use it, so they can be joined without re-encoding,
+        and all variants should use the same file extension.
+    :param workers: Number of worker processes. Defaults to ``os.cpu_count()``.
+    :param tmp_dir: Where to put segments and cached frames while rendering.
+        Defaults to the system's temporary directory.
+    :param progress: Where to report progress. Defaults to a ``csanim.progress.TerminalSink``.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # Look for FFmpeg before rendering anything.
+    find_ffmpeg()
+    fps = template.fps
+    overrides = [_resolve(template, variant) for variant in variants]
+
+    # First element of each scene that some variant changes. 0 = the whole scene.
+    starts = {}
+    for si, ei, name, value in (o for variant in overrides for o in variant):
+        start = ei if ei >= 0 and _layered(template.scenes[si]) else 0
+        starts[si] = min(starts.get(si, start), start)
+
+    scenes = [si for si, scene in enumerate(template.scenes) if int(scene.length*fps) > 0]
+    shared = [si for si in scenes if si not in starts]
+    varying = [si for si in scenes if si in starts]
+    frames = {si: int(template.scenes[si].length*fps) for si in scenes}
+    total = sum(frames[si] for si in shared) + sum(frames[si] for si in varying)*len(variants) + \
+        sum(frames[si] for si in varying if starts[si] > 0)
+
+    tmp_dir = tempfile.mkdtemp(prefix="csanim_batch_", dir=tmp_dir)
+    ext = os.path.splitext(variants[0].path)[1] if variants else ".mp4"
+    plan = []
+    try:
+        tracker = ProgressTracker(progress, "Rendering", total)
+        done = 0
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(template,)) as executor:
+            # Shared work first, since every variant needs it.
+            futures = []
+            for si in scenes:
+                if si in starts and starts[si] == 0:
+                    plan.append((si, ("render", 0, None)))
+                elif si in starts:
+                    background = os.path.join(tmp_dir, f"scene{si}.csraw")
+                    futures.append(executor.submit(_render_background, background, si, starts[si]))
+                    plan.append((si, ("render", starts[si], background)))
+                else:
+                    segment = os.path.join(tmp_dir, f"scene{si}{ext}")
+                    futures.append(executor.submit(_render_shared, segment, vencode, si))
+                    plan.append((si, ("shared", segment)))
+            for future in as_completed(futures):
+                done += future.result()
+                tracker.update(done)
+
+            futures = [executor.submit(_render_variant, os.path.realpath(variant.path), vencode,
+                variant_overrides, plan, tmp_dir, i) for i, (variant, variant_overrides)
+                in enumerate(zip(variants, overrides))]
+            for future in as_completed(futures):
+                done += future.result()
+                tracker.update(done)
+        tracker.finish()
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    tracker.log(f"Finished exporting {len(variants)} videos.")
@@ -26,6 +26,16 @@ __all__ = [
     "T_CUT",
     "T_FADE",
     "T_FADEIO",
+    "I_EASE_IN",
+    "I_EASE_OUT",
+    "I_EASE_IN_OUT",
+    "I_ELASTIC",
+    "CAP_BUTT",
+    "CAP_ROUND",
+    "CAP_SQUARE",
+    "JOIN_ROUND",
+    "JOIN_BEVEL",
+    "JOIN_MITER",
 ]
 
 F_CODE: int = 0
@@ -36,3 +46,13 @@ I_BOUNCE: int = 4
 T_CUT: int = 5
 T_FADE: int = 6
 T_FADEIO: int = 7
+I_EASE_IN: int = 8
+I_EASE_OUT: int = 9
+I_EASE_IN_OUT: int = 10
+I_ELASTIC: int = 11
+CAP_BUTT: int = 12
+CAP_ROUND: int = 13
+CAP_SQUARE: int = 14
+JOIN_ROUND: int = 15
+JOIN_BEVEL: int = 16
+JOIN_MITER: int = 17
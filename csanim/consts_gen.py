@@ -36,6 +36,20 @@ CONSTS = [
     "T_CUT",
     "T_FADE",
     "T_FADEIO",
+
+    # Added later. Appended so saved values of older constants stay valid.
+    "I_EASE_IN",
+    "I_EASE_OUT",
+    "I_EASE_IN_OUT",
+    "I_ELASTIC",
+
+    "CAP_BUTT",
+    "CAP_ROUND",
+    "CAP_SQUARE",
+
+    "JOIN_ROUND",
+    "JOIN_BEVEL",
+    "JOIN_MITER",
 ]
 
 
@@ -0,0 +1,327 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Distributed rendering.
+
+A coordinator splits a video into frame ranges and hands them to worker
+processes. Workers render and encode each range into a segment file, and
+the coordinator concatenates the segments with FFmpeg.
+
+Workers talk to the coordinator over stdin/stdout with one JSON object
+per line, so they can be started locally (the default) or through any
+command that forwards stdio, e.g. ``ssh host python3 -m csanim worker``.
+Remote workers must see the script and segment paths at the same paths.
+
+Coordinator to worker (one job at a time; EOF to quit)::
+
+    {"script": ..., "video": ..., "start": ..., "end": ..., "output": ..., "vencode": ...}
+
+Worker to coordinator::
+
+    {"progress": <frames done in this job>}
+    {"done": true}
+    {"error": <traceback>}
+"""
+
+__all__ = (
+    "load_video",
+    "render_distributed",
+    "worker",
+)
+
+import sys
+import os
+import time
+import json
+import queue
+import shlex
+import shutil
+import threading
+import traceback
+import runpy
+from subprocess import Popen, PIPE, DEVNULL
+from typing import Sequence, TextIO
+from .encoder import EncoderSet, Output, concat, find_ffmpeg
+from .progress import ProgressSink, ProgressTracker
+from .video import Video
+
+
+def load_video(script: str, name: str = None) -> Video:
+    """
+    Runs a script and returns the video it builds.
+    The script is run with ``__name__ == "__csanim__"``, so rendering
+    guarded by ``if __name__ == "__main__"`` doesn't run.
+
+    :param script: Path to script.
+    :param name: Name of the global variable holding the video.
+        Defaults to the only ``Video`` in the script's globals.
+    """
+    scope = runpy.run_path(script, run_name="__csanim__")
+    if name is not None:
+        video = scope.get(name)
+        if not isinstance(video, Video):
+            raise ValueError(f"{script} has no Video named {name}.")
+        return video
+
+    videos = [v for v in scope.values() if isinstance(v, Video)]
+    if len(videos) != 1:
+        raise ValueError(f"{script} defines {len(videos)} videos; pass the name of one.")
+    return videos[0]
+
+
+def worker(stdin: TextIO = None, stdout: TextIO = None) -> None:
+    """
+    Runs a worker: reads jobs from stdin until EOF, and reports on stdout.
+    Anything else printed (e.g. by the script) goes to stderr.
+
+    :param stdin: Job input. Defaults to ``sys.stdin``.
+    :param stdout: Report output. Defaults to ``sys.stdout``.
+    """
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    sys.stdout = sys.stderr
+    videos = {}
+
+    def send(msg):
+        stdout.write(json.dumps(msg) + "\n")
+        stdout.flush()
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            key = (job["script"], job.get("video"))
+            if key not in videos:
+                videos[key] = load_video(*key)
+            video = videos[key]
+
+            encoders = EncoderSet([Output(job["output"], job["vencode"])], video.resolution, video.fps)
+            start = job["start"]
+            step = max((job["end"]-start) // 20, 1)
+
+            def progress(frame):
+                if frame > start and (frame-start) % step == 0:
+                    send({"progress": frame-start})
+
+            done = False
+            try:
+                video.render_frames(lambda frame, img: encoders.write(img), start, job["end"], progress=progress)
+                done = True
+            finally:
+                encoders.close(check=done)
+            send({"done": True})
+        except Exception:
+            send({"error": traceback.format_exc()})
+
+
+class _Worker:
+    """
+    Internal class.
+    Coordinator side of one worker process.
+    """
+
+    def __init__(self, cmd: Sequence[str]) -> None:
+        self.cmd = cmd
+        self.proc = None
+        self.lines = None
+
+    def run(self, job: dict, progress, timeout: float = None) -> str:
+        """
+        Runs a job. Returns None on success, else an error message.
+        The process is killed if the job takes longer than timeout seconds.
+        """
+        if self.proc is None or self.proc.poll() is not None:
+            self.proc = Popen(self.cmd, stdin=PIPE, stdout=PIPE, stderr=DEVNULL, text=True, bufsize=1)
+            # Lines are read by a thread, so waiting for one can time out.
+            self.lines = queue.Queue()
+            threading.Thread(target=self._read, args=(self.proc.stdout, self.lines), daemon=True).start()
+
+        try:
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            self.kill()
+            return "worker exited"
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=None if deadline is None else max(deadline-time.monotonic(), 0))
+            except queue.Empty:
+                self.kill()
+                return f"timed out after {timeout} seconds"
+            if line is None:
+                break
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                msg = None
+            # Other output (e.g. from a login shell) isn't a report.
+            if not isinstance(msg, dict):
+                continue
+            if "progress" in msg:
+                progress(msg["progress"])
+            elif "done" in msg:
+                return None
+            elif "error" in msg:
+                return msg["error"]
+
+        self.kill()
+        return "worker exited"
+
+    @staticmethod
+    def _read(stdout: TextIO, lines: queue.Queue) -> None:
+        """
+        Puts every line of stdout in lines, then None at EOF.
+        """
+        for line in stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def kill(self) -> None:
+        """
+        Stops the process, so the next job starts a new one.
+        """
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def close(self) -> None:
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+
+def render_distributed(script: str, path: str, workers: int = None, chunk: int = None,
+        vencode: str = "libx265", video: str = None, retries: int = 2,
+        worker_cmds: Sequence[str] = None, progress: ProgressSink = None, timeout: float = None) -> None:
+    """
+    Renders a video script with several worker processes.
+
+    Raises ``RuntimeError`` if a range still fails after ``retries`` retries,
+    and ``ValueError`` if the video has no frames.
+    A failed range is retried by another worker if there is one, and the
+    worker that failed restarts its process.
+
+    :param script: Path to script that builds the video. See ``load_video``.
+    :param path: Output video file path. Overwritten if it exists. Segments are
+        written to ``<path>_segments`` and removed after they are joined.
+    :param workers: Number of local workers. Defaults to ``os.cpu_count()``.
+        Ignored if ``worker_cmds`` is given.
+    :param chunk: Frames per range. Defaults to splitting the video into 4 ranges per worker.
+    :param vencode: Video encoding.
+    :param video: Name of the video in the script. See ``load_video``.
+    :param retries: Times a failed range is retried.
+    :param worker_cmds: Shell commands that start a worker, one per worker.
+        Defaults to local ``python -m csanim worker`` processes.
+    :param progress: Where to report progress. Defaults to a ``csanim.progress.TerminalSink``.
+    :param timeout: Seconds a range may take before its worker is killed and the
+        range fails. Defaults to no limit.
+    """
+    script = os.path.realpath(script)
+    path = os.path.realpath(path)
+    # Look for FFmpeg before starting workers.
+    find_ffmpeg()
+    total = load_video(script, video).total_frames
+    if total == 0:
+        raise ValueError(f"Video in {script} has no frames.")
+
+    if worker_cmds:
+        cmds = [shlex.split(cmd) for cmd in worker_cmds]
+    else:
+        cmds = [[sys.executable, "-m", "csanim", "worker"]] * (workers or os.cpu_count() or 1)
+    if chunk is None:
+        chunk = max(-(-total // (4*len(cmds))), 1)
+
+    seg_dir = path + "_segments"
+    os.makedirs(seg_dir, exist_ok=True)
+    ext = os.path.splitext(path)[1]
+    jobs = queue.Queue()
+    segments = []
+    for i, start in enumerate(range(0, total, chunk)):
+        segment = os.path.join(seg_dir, f"{i}{ext}")
+        segments.append(segment)
+        jobs.put(({"script": script, "video": video, "start": start, "end": min(start+chunk, total),
+            "output": segment, "vencode": vencode}, 0, frozenset()))
+
+    lock = threading.Lock()
+    remaining = [len(segments)]
+    done_frames = {}
+    errors = []
+    # Ranges finish out of order, so per scene stats aren't tracked.
+    tracker = ProgressTracker(progress, "Rendering", total)
+
+    def report(job, frames):
+        with lock:
+            done_frames[job["start"]] = frames
+            tracker.update(sum(done_frames.values()))
+
+    def run(index, cmd):
+        proc = _Worker(cmd)
+        try:
+            while True:
+                with lock:
+                    if remaining[0] == 0 or errors:
+                        return
+                try:
+                    # Workers that failed a range before (failed) leave it to the others.
+                    job, attempts, failed = jobs.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if index in failed and len(failed) < len(cmds):
+                    jobs.put((job, attempts, failed))
+                    time.sleep(0.1)
+                    continue
+
+                error = proc.run(job, lambda frames: report(job, frames), timeout)
+                if error is None:
+                    report(job, job["end"]-job["start"])
+                    with lock:
+                        remaining[0] -= 1
+                    continue
+
+                # A new process for the next job, in case this one is in a bad state.
+                proc.kill()
+                if attempts < retries:
+                    report(job, 0)
+                    jobs.put((job, attempts+1, failed | {index}))
+                else:
+                    with lock:
+                        errors.append(f"Frames {job['start']}-{job['end']} failed:\n{error}")
+        except Exception:
+            with lock:
+                errors.append(traceback.format_exc())
+        finally:
+            proc.close()
+
+    threads = [threading.Thread(target=run, args=(i, cmd)) for i, cmd in enumerate(cmds)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors or remaining[0] > 0:
+        raise RuntimeError(errors[0] if errors else "Not all frames were rendered.")
+    tracker.finish()
+
+    concat(segments, path)
+    shutil.rmtree(seg_dir, ignore_errors=True)
+    tracker.log(f"Finished exporting {total} frames.")
@@ -25,8 +25,9 @@ img variables are raveled numpy arrays.
 
 #define  PI  3.14159265
 
-#include <iostream>
+#include <climits>
 #include <cmath>
+#include <vector>
 
 using std::min;
 using std::max;
@@ -112,7 +113,7 @@ double radians(CD deg) {
     /*
     Convert degrees to radians.
     */
-    return deg/180*2*PI;
+    return deg/180*PI;
 }
 
 double pythag(CD dx, CD dy) {
@@ -148,6 +149,38 @@ double dbounds(CD v, CD vmin = 0, CD vmax = 1) {
 }
 
 
+void affine(const double* tf, CD x, CD y, double& ox, double& oy) {
+    /*
+    Applies a 2x3 affine transform (row major) to a point.
+    */
+    ox = tf[0]*x + tf[1]*y + tf[2];
+    oy = tf[3]*x + tf[4]*y + tf[5];
+}
+
+double affine_scale(const double* tf) {
+    /*
+    How much a transform scales lengths, on average (square root of the area scale).
+    */
+    return sqrt(fabs(tf[0]*tf[4] - tf[1]*tf[3]));
+}
+
+extern "C" void fill(UCH* img, const UINT width, const UINT height, CD r, CD g, CD b, CD a) {
+    /*
+    Blends the whole image with one color, in place.
+
+    :param img: Image.
+    :param width: Image width.
+    :param height: Image height.
+    :param r, g, b, a: R, G, B, A values.
+    */
+    CD afac = a / 255;
+    const UCH c1[3] = {(UCH)r, (UCH)g, (UCH)b};
+    const unsigned long size = (unsigned long)width * height * 3;
+
+    for (unsigned long i = 0; i < size; i += 3)
+        mix(img+i, img+i, c1, afac);
+}
+
 extern "C" void line(UCH* img, const UINT width, const UINT height, CD x1, CD y1, CD x2, CD y2,
         CD thick, CD r, CD g, CD b, CD a) {
     /*
@@ -257,9 +290,9 @@ extern "C" void rect(UCH* img, const UINT width, const UINT height, CD dx, CD dy
     const UCH c1[3] = {(UCH)r, (UCH)g, (UCH)b};
 
     const int xmin = max((int)(dx-1), 0);
-    const int xmax = min((int)(dx+dw+1), (int)width);
+    const int xmax = min((int)(dx+dw+1), (int)width-1);
     const int ymin = max((int)(dy-1), 0);
-    const int ymax = min((int)(dy+dh+1), (int)height);
+    const int ymax = min((int)(dy+dh+1), (int)height-1);
     for (int x = xmin; x <= xmax; x++) {
         for (int y = ymin; y <= ymax; y++) {
             bool is_corner = false;
@@ -295,8 +328,9 @@ extern "C" void rect(UCH* img, const UINT width, const UINT height, CD dx, CD dy
                 final_fac = out_fac*in_fac*afac;
             } else {
                 CD out_fac = dbounds(x-dx+1) * dbounds(dx+dw-x+1) * dbounds(y-dy+1) * dbounds(dy+dh-y+1);
-                CD in_fac = (border == 0) ? 1 :
-                    dbounds(dx+border-x+1) + dbounds(x-(dx+dw-border)+1) + dbounds(dy+border-y+1) + dbounds(y-(dy+dh-border)+1);
+                // Sides overlap at the corners, so the largest is used instead of the sum.
+                CD in_fac = (border == 0) ? 1 : max(max(dbounds(dx+border-x+1), dbounds(x-(dx+dw-border)+1)),
+                    max(dbounds(dy+border-y+1), dbounds(y-(dy+dh-border)+1)));
                 final_fac = out_fac*in_fac*afac;
             }
 
@@ -308,10 +342,435 @@ extern "C" void rect(UCH* img, const UINT width, const UINT height, CD dx, CD dy
     }
 }
 
+extern "C" void circles(UCH* img, const UINT width, const UINT height, const double* data, const UINT count,
+        const double* tf) {
+    /*
+    Draws many circles, in order.
+
+    :param img: Image.
+    :param width: Image width.
+    :param height: Image height.
+    :param data: Center X, center Y, radius, border, R, G, B, A of each circle.
+    :param count: Number of circles.
+    :param tf: 2x3 affine transform of the coordinates. Radii and borders are
+        scaled by the average scale, so circles stay circles.
+    */
+    CD scale = affine_scale(tf);
+    for (UINT i = 0; i < count; i++) {
+        const double* d = data + 8*i;
+        if (d[7] == 0)
+            continue;
+        double cx, cy;
+        affine(tf, d[0], d[1], cx, cy);
+        circle(img, width, height, cx, cy, d[2]*scale, d[3]*scale, d[4], d[5], d[6], d[7]);
+    }
+}
+
+
+struct Coverage {
+    /*
+    Coverage of strokes in a box of the image, from 0 to 1 per pixel.
+    Shapes are added with the maximum, so overlapping shapes (segments,
+    joins, arrowheads) are blended once instead of once per shape.
+    Only the span of columns touched in each row is blended and cleared,
+    so one buffer is reused for many long, thin strokes.
+    */
+    int xmin, ymin, xmax, ymax, w;
+    int top, bottom;
+    std::vector<float> cov;
+    std::vector<int> left, right;
+
+    Coverage(const int x1, const int y1, const int x2, const int y2) {
+        xmin = x1;
+        ymin = y1;
+        xmax = x2;
+        ymax = y2;
+        w = max(xmax-xmin+1, 0);
+        const int h = max(ymax-ymin+1, 0);
+        cov.assign((size_t)w * h, 0);
+        left.assign(h, INT_MAX);
+        right.assign(h, INT_MIN);
+        top = INT_MAX;
+        bottom = INT_MIN;
+    }
+
+    bool row(const int y, int& x1, int& x2) {
+        /*
+        Clips a span of a row to the box, and marks it touched.
+        Returns false if nothing is left.
+        */
+        if (y < ymin || y > ymax)
+            return false;
+        x1 = max(x1, xmin);
+        x2 = min(x2, xmax);
+        if (x1 > x2)
+            return false;
+        left[y-ymin] = min(left[y-ymin], x1);
+        right[y-ymin] = max(right[y-ymin], x2);
+        top = min(top, y);
+        bottom = max(bottom, y);
+        return true;
+    }
+
+    void add(const int x, const int y, CD fac) {
+        float& c = cov[(size_t)(y-ymin)*w + (x-xmin)];
+        if (fac > c)
+            c = fac;
+    }
+
+    void disc(CD cx, CD cy, CD rad) {
+        /*
+        Adds a filled circle.
+        */
+        for (int y = (int)(cy-rad-1); y <= (int)(cy+rad+1); y++) {
+            int x1 = (int)(cx-rad-1), x2 = (int)(cx+rad+1);
+            if (!row(y, x1, x2))
+                continue;
+            for (int x = x1; x <= x2; x++)
+                add(x, y, dbounds(rad-pythag(x-cx, y-cy)+1));
+        }
+    }
+
+    void polygon(const double* pts, const int count) {
+        /*
+        Adds a filled convex polygon. Distance outside is the largest distance
+        to an edge's line, which is exact except near corners.
+
+        :param pts: X, Y of each vertex, in order (either direction).
+        :param count: Number of vertices.
+        */
+        double area = 0;
+        for (int i = 0; i < count; i++) {
+            const int j = (i+1) % count;
+            area += pts[2*i]*pts[2*j+1] - pts[2*j]*pts[2*i+1];
+        }
+        if (area == 0)
+            return;
+        CD sign = area > 0 ? 1 : -1;
+
+        double nx[8], ny[8], nc[8];
+        double bx1 = pts[0], bx2 = pts[0], by1 = pts[1], by2 = pts[1];
+        for (int i = 0; i < count; i++) {
+            const int j = (i+1) % count;
+            CD ex = pts[2*j]-pts[2*i], ey = pts[2*j+1]-pts[2*i+1];
+            CD len = pythag(ex, ey);
+            // Outward unit normal, and offset so distance = nx*x + ny*y + nc
+            nx[i] = (len == 0) ? 0 : sign*ey/len;
+            ny[i] = (len == 0) ? 0 : -sign*ex/len;
+            nc[i] = -(nx[i]*pts[2*i] + ny[i]*pts[2*i+1]);
+            bx1 = min(bx1, pts[2*i]);
+            bx2 = max(bx2, pts[2*i]);
+            by1 = min(by1, pts[2*i+1]);
+            by2 = max(by2, pts[2*i+1]);
+        }
+
+        for (int y = (int)(by1-1); y <= (int)(by2+1); y++) {
+            // Columns where every edge distance is under 0.5, i.e. coverage isn't 0.
+            double lo = bx1-1, hi = bx2+1;
+            for (int i = 0; i < count; i++) {
+                CD rest = 0.5 - ny[i]*y - nc[i];
+                if (nx[i] > 0)
+                    hi = min(hi, rest/nx[i]);
+                else if (nx[i] < 0)
+                    lo = max(lo, rest/nx[i]);
+                else if (rest <= 0)
+                    hi = lo - 1;
+            }
+            if (hi < lo)
+                continue;
+            int x1 = max((int)floor(lo), (int)(bx1-1)), x2 = min((int)ceil(hi), (int)(bx2+1));
+            if (!row(y, x1, x2))
+                continue;
+            for (int x = x1; x <= x2; x++) {
+                double dist = -1e9;
+                for (int i = 0; i < count; i++)
+                    dist = max(dist, nx[i]*x + ny[i]*y + nc[i]);
+                // Polygons have a hard edge at 0, antialiased over one pixel.
+                add(x, y, dbounds(0.5-dist));
+            }
+        }
+    }
+
+    void segment(CD x1, CD y1, CD x2, CD y2, CD hw) {
+        /*
+        Adds a segment with butt ends.
+        */
+        CD len = pythag(x2-x1, y2-y1);
+        if (len == 0)
+            return;
+        CD nx = -(y2-y1)/len*hw, ny = (x2-x1)/len*hw;
+        const double pts[8] = {x1+nx, y1+ny, x2+nx, y2+ny, x2-nx, y2-ny, x1-nx, y1-ny};
+        polygon(pts, 4);
+    }
+
+    void blend(UCH* img, const UINT width, CD r, CD g, CD b, CD a) {
+        /*
+        Blends the touched pixels with a color, and clears them for the next stroke.
+        */
+        CD afac = a / 255;
+        const UCH c1[3] = {(UCH)r, (UCH)g, (UCH)b};
+        for (int y = top; y <= bottom; y++) {
+            const int ind = y - ymin;
+            for (int x = left[ind]; x <= right[ind]; x++) {
+                float& fac = cov[(size_t)ind*w + (x-xmin)];
+                if (fac <= 0)
+                    continue;
+                UCH c2[3], color[3];
+                getc(img, width, x, y, c2);
+                mix(color, c2, c1, fac*afac);
+                setc(img, width, x, y, color[0], color[1], color[2]);
+                fac = 0;
+            }
+            left[ind] = INT_MAX;
+            right[ind] = INT_MIN;
+        }
+        top = INT_MAX;
+        bottom = INT_MIN;
+    }
+};
+
+void cap(Coverage& cov, CD x, CD y, CD dx, CD dy, CD hw, const UINT style) {
+    /*
+    Adds a line cap at an end point.
+
+    :param dx, dy: Unit direction pointing out of the line.
+    :param style: 0 = butt, 1 = round, 2 = square.
+    */
+    if (style == 1)
+        cov.disc(x, y, hw-0.5);
+    else if (style == 2)
+        cov.segment(x, y, x+dx*hw, y+dy*hw, hw);
+}
+
+void join(Coverage& cov, CD x, CD y, CD d1x, CD d1y, CD d2x, CD d2y, CD hw, const UINT style) {
+    /*
+    Fills the gap on the outer side of a corner.
+
+    :param d1x, d1y: Unit direction of the segment into the corner.
+    :param d2x, d2y: Unit direction of the segment out of the corner.
+    :param style: 0 = round, 1 = bevel, 2 = miter (bevel if longer than 4 half widths).
+    */
+    if (style == 0) {
+        cov.disc(x, y, hw-0.5);
+        return;
+    }
+    CD cross = d1x*d2y - d1y*d2x;
+    if (cross == 0)
+        return;
+    // Normals on the outer side of the turn.
+    CD side = cross > 0 ? -1 : 1;
+    CD n1x = -d1y*side*hw, n1y = d1x*side*hw;
+    CD n2x = -d2y*side*hw, n2y = d2x*side*hw;
+
+    CD mx = n1x+n2x, my = n1y+n2y;
+    CD mlen = pythag(mx, my);
+    // Distance from the corner to the miter point, along the bisector.
+    CD miter = (mlen == 0) ? 1e9 : hw*hw*mlen / (mx*n1x + my*n1y);
+    if (style == 2 && mlen > 0 && miter <= 4*hw) {
+        const double pts[8] = {x, y, x+n1x, y+n1y, x+mx/mlen*miter, y+my/mlen*miter, x+n2x, y+n2y};
+        cov.polygon(pts, 4);
+    } else {
+        const double pts[6] = {x, y, x+n1x, y+n1y, x+n2x, y+n2y};
+        cov.polygon(pts, 3);
+    }
+}
+
+void stroke(Coverage& cov, UCH* img, const UINT width, const double* pts, UINT count, CD thick,
+        const UINT cap_style, const UINT join_style, const UINT closed, CD head_len, CD head_width,
+        const UINT heads, CD r, CD g, CD b, CD a) {
+    /*
+    Draws one path. See polylines()
+    */
+    // Skip repeated points, which have no direction.
+    std::vector<double> p;
+    for (UINT i = 0; i < count; i++) {
+        const size_t n = p.size();
+        if (n >= 2 && p[n-2] == pts[2*i] && p[n-1] == pts[2*i+1])
+            continue;
+        p.push_back(pts[2*i]);
+        p.push_back(pts[2*i+1]);
+    }
+    count = p.size() / 2;
+    if (count < 2)
+        return;
+    const bool loop = closed && count >= 3;
+    // Fully covered up to thick from the line and faded over the next pixel, like line()
+    CD hw = thick + 0.5;
+
+    // Arrowheads, with the line pulled back under them.
+    for (int end = 0; end < 2 && !loop; end++) {
+        if (!(heads & (1 << end)))
+            continue;
+        const UINT tip = (end == 0) ? count-1 : 0, prev = (end == 0) ? count-2 : 1;
+        CD tx = p[2*tip], ty = p[2*tip+1];
+        CD seg = pythag(tx-p[2*prev], ty-p[2*prev+1]);
+        CD dx = (tx-p[2*prev])/seg, dy = (ty-p[2*prev+1])/seg;
+        CD bx = tx-dx*head_len, by = ty-dy*head_len;
+        const double tri[6] = {tx, ty, bx-dy*head_width, by+dx*head_width, bx+dy*head_width, by-dx*head_width};
+        cov.polygon(tri, 3);
+
+        CD back = min(head_len/2, seg*0.99);
+        p[2*tip] = tx - dx*back;
+        p[2*tip+1] = ty - dy*back;
+    }
+
+    const UINT segs = loop ? count : count-1;
+    for (UINT i = 0; i < segs; i++) {
+        const UINT j = (i+1) % count;
+        cov.segment(p[2*i], p[2*i+1], p[2*j], p[2*j+1], hw);
+    }
+
+    // Joins between consecutive segments.
+    for (UINT i = loop ? 0 : 1; i < (loop ? count : count-1); i++) {
+        const UINT h = (i+count-1) % count, j = (i+1) % count;
+        CD l1 = pythag(p[2*i]-p[2*h], p[2*i+1]-p[2*h+1]);
+        CD l2 = pythag(p[2*j]-p[2*i], p[2*j+1]-p[2*i+1]);
+        if (l1 == 0 || l2 == 0)
+            continue;
+        join(cov, p[2*i], p[2*i+1], (p[2*i]-p[2*h])/l1, (p[2*i+1]-p[2*h+1])/l1,
+            (p[2*j]-p[2*i])/l2, (p[2*j+1]-p[2*i+1])/l2, hw, join_style);
+    }
+
+    if (!loop) {
+        const UINT e = count-1;
+        CD l1 = pythag(p[2]-p[0], p[3]-p[1]);
+        CD l2 = pythag(p[2*e]-p[2*e-2], p[2*e+1]-p[2*e-1]);
+        if (l1 > 0 && !(heads & 2))
+            cap(cov, p[0], p[1], (p[0]-p[2])/l1, (p[1]-p[3])/l1, hw, cap_style);
+        if (l2 > 0 && !(heads & 1))
+            cap(cov, p[2*e], p[2*e+1], (p[2*e]-p[2*e-2])/l2, (p[2*e+1]-p[2*e-1])/l2, hw, cap_style);
+    }
+
+    cov.blend(img, width, r, g, b, a);
+}
+
+extern "C" void rects(UCH* img, const UINT width, const UINT height, const double* data, const UINT count,
+        const double* tf) {
+    /*
+    Draws many rectangles, in order.
+
+    :param img: Image.
+    :param width: Image width.
+    :param height: Image height.
+    :param data: X, Y, width, height, border, corner radius, R, G, B, A of each rectangle.
+    :param count: Number of rectangles.
+    :param tf: 2x3 affine transform of the coordinates. Rotated rectangles are
+        drawn as polygons, without corner rounding.
+    */
+    CD scale = affine_scale(tf);
+    CD det = tf[0]*tf[4] - tf[1]*tf[3];
+    const bool aligned = tf[1] == 0 && tf[3] == 0;
+    Coverage* cov = NULL;
+    if (!aligned)
+        cov = new Coverage(0, 0, (int)width-1, (int)height-1);
+
+    for (UINT i = 0; i < count; i++) {
+        const double* d = data + 10*i;
+        if (d[9] == 0)
+            continue;
+        if (aligned) {
+            // Corners map to corners. Flips give negative sizes.
+            CD x = tf[0]*d[0] + tf[2], y = tf[4]*d[1] + tf[5];
+            CD w = tf[0]*d[2], h = tf[4]*d[3];
+            rect(img, width, height, min(x, x+w), min(y, y+h), fabs(w), fabs(h), d[4]*scale, d[5]*scale,
+                -1, -1, -1, -1, d[6], d[7], d[8], d[9]);
+            continue;
+        }
+
+        // rect() fully covers pixels whose centers are inside and fades over
+        // the next pixel, the same as covering the area half a pixel around
+        // the rectangle, so the polygons are grown by half a pixel.
+        if (det == 0)
+            continue;
+        // One image pixel in local units, across the edges along each axis.
+        CD px = pythag(tf[1], tf[4]) / fabs(det), py = pythag(tf[0], tf[3]) / fabs(det);
+        CD x1 = min(d[0], d[0]+d[2]) - px/2, x2 = max(d[0], d[0]+d[2]) + px/2;
+        CD y1 = min(d[1], d[1]+d[3]) - py/2, y2 = max(d[1], d[1]+d[3]) + py/2;
+        // Inner edges of the border, which is scaled like in rect().
+        CD ix1 = x1 + (d[4]*scale+1)*px, ix2 = x2 - (d[4]*scale+1)*px;
+        CD iy1 = y1 + (d[4]*scale+1)*py, iy2 = y2 - (d[4]*scale+1)*py;
+
+        // A fill, or the border's four sides at full length, overlapping at the
+        // corners so no polygon edge is inside the border (it would be half covered).
+        const bool fill = d[4] == 0 || ix1 >= ix2 || iy1 >= iy2;
+        const double quads[32] = {x1, y1, x2, y1, x2, fill ? y2 : iy1, x1, fill ? y2 : iy1,
+            x1, iy2, x2, iy2, x2, y2, x1, y2,  x1, y1, ix1, y1, ix1, y2, x1, y2,  ix2, y1, x2, y1, x2, y2, ix2, y2};
+        for (int q = 0; q < (fill ? 1 : 4); q++) {
+            double pts[8];
+            for (int j = 0; j < 4; j++)
+                affine(tf, quads[8*q+2*j], quads[8*q+2*j+1], pts[2*j], pts[2*j+1]);
+            cov->polygon(pts, 4);
+        }
+        cov->blend(img, width, d[6], d[7], d[8], d[9]);
+    }
+    delete cov;
+}
+
+extern "C" void polylines(UCH* img, const UINT width, const UINT height, const double* points,
+        const UINT* counts, const UINT paths, CD thick, const UINT cap_style, const UINT join_style,
+        const UINT closed, CD head_len, CD head_width, const UINT heads, const double* colors,
+        const double* tf) {
+    /*
+    Draws paths made of connected line segments. Each path's segments,
+    joins, caps and arrowheads are rasterized into one coverage buffer,
+    and each pixel is blended once.
+
+    :param img: Image.
+    :param width: Image width.
+    :param height: Image height.
+    :param points: X, Y of every point of every path.
+    :param counts: Number of points in each path.
+    :param paths: Number of paths.
+    :param thick: Line thickness (half the stroke width, like line()).
+    :param cap_style: 0 = butt, 1 = round, 2 = square.
+    :param join_style: 0 = round, 1 = bevel, 2 = miter.
+    :param closed: Whether to connect the last point of each path to the first.
+    :param head_len: Arrowhead length.
+    :param head_width: Arrowhead half width.
+    :param heads: Arrowheads. Bit 0 = at the last point, bit 1 = at the first point.
+    :param colors: R, G, B, A values of each path.
+    :param tf: 2x3 affine transform of the points. Thickness and arrowheads
+        are scaled by the average scale.
+    */
+    size_t total = 0;
+    for (UINT i = 0; i < paths; i++)
+        total += counts[i];
+    if (total == 0)
+        return;
+
+    std::vector<double> pts(2*total);
+    for (size_t i = 0; i < total; i++)
+        affine(tf, points[2*i], points[2*i+1], pts[2*i], pts[2*i+1]);
+    CD scale = affine_scale(tf);
+    CD tf_thick = thick*scale, tf_head_len = head_len*scale, tf_head_width = head_width*scale;
+
+    // One coverage buffer around all paths, reused for each.
+    double bx1 = pts[0], bx2 = pts[0], by1 = pts[1], by2 = pts[1];
+    for (size_t i = 1; i < total; i++) {
+        bx1 = min(bx1, pts[2*i]);
+        bx2 = max(bx2, pts[2*i]);
+        by1 = min(by1, pts[2*i+1]);
+        by2 = max(by2, pts[2*i+1]);
+    }
+    CD pad = max((tf_thick+0.5)*4, tf_head_width) + 2;
+    Coverage cov(max((int)(bx1-pad), 0), max((int)(by1-pad), 0),
+        min((int)(bx2+pad), (int)width-1), min((int)(by2+pad), (int)height-1));
+    if (cov.w == 0 || cov.ymax < cov.ymin)
+        return;
+
+    size_t start = 0;
+    for (UINT i = 0; i < paths; i++) {
+        const double* c = colors + 4*i;
+        stroke(cov, img, width, pts.data()+2*start, counts[i], tf_thick, cap_style, join_style, closed,
+            tf_head_len, tf_head_width, heads, c[0], c[1], c[2], c[3]);
+        start += counts[i];
+    }
+}
+
 extern "C" void arrow(UCH* img, const UINT width, const UINT height, CD x1, CD y1, CD x2, CD y2,
         CD angle, CD side_len_fac, CD thick, CD r, CD g, CD b, CD a) {
     /*
-    Draws an arrow.
+    Draws an arrow with an open head: the shaft and two side lines meeting at the head.
 
     :param img: Image.
     :param width: Width.
@@ -322,22 +781,33 @@ extern "C" void arrow(UCH* img, const UINT width, const UINT height, CD x1, CD y
     :param side_len_fac: Length factor of side lines.
     :param thick: Line thickness.
     */
-    CD dx = (x1-x2), dy = (y1-y2);
-
+    CD len = pythag(x1-x2, y1-y2);
+    if (len == 0)
+        return;
+    CD ux = (x1-x2)/len, uy = (y1-y2)/len;
     CD rad_angle = radians(angle);
-    CD main_angle = atan(dy/dx);
-    CD slope1 = tan((PI-main_angle)+rad_angle);
-    CD slope2 = tan((PI-main_angle)-rad_angle);
-
-    // Calculate side endpoints. s1y = side 1 Y
-    std::cout << main_angle;
-    std::cout << slope1 << " " << slope2 << std::endl;
-    CD side_len = side_len_fac * pythag(dx, dy);
-    CD s1x = side_len*cos(slope1)+x2, s1y = side_len*sin(slope1)+y2;
-    CD s2x = side_len*cos(slope2)+x2, s2y = side_len*sin(slope2)+y2;
-    std::cout << s1x << ' ' << s1y << " " << s2x << " " << s2y << std::endl;
-
-    line(img, width, height, x1, y1, x2, y2, thick, r, g, b, a);
-    line(img, width, height, x2, y2, s1x, s1y, thick, r, g, b, a);
-    line(img, width, height, x2, y2, s2x, s2y, thick, r, g, b, a);
+    CD side_len = side_len_fac * len;
+    CD c = cos(rad_angle), s = sin(rad_angle);
+
+    // Side ends: the direction back to the tail, rotated both ways.
+    CD s1x = x2 + (ux*c - uy*s)*side_len, s1y = y2 + (ux*s + uy*c)*side_len;
+    CD s2x = x2 + (ux*c + uy*s)*side_len, s2y = y2 + (-ux*s + uy*c)*side_len;
+
+    CD hw = thick + 0.5;
+    CD pad = hw + 2;
+    CD bx1 = min(min(x1, x2), min(s1x, s2x)), bx2 = max(max(x1, x2), max(s1x, s2x));
+    CD by1 = min(min(y1, y2), min(s1y, s2y)), by2 = max(max(y1, y2), max(s1y, s2y));
+    Coverage cov(max((int)(bx1-pad), 0), max((int)(by1-pad), 0),
+        min((int)(bx2+pad), (int)width-1), min((int)(by2+pad), (int)height-1));
+    if (cov.w == 0 || cov.ymax < cov.ymin)
+        return;
+
+    cov.segment(x1, y1, x2, y2, hw);
+    cov.segment(x2, y2, s1x, s1y, hw);
+    cov.segment(x2, y2, s2x, s2y, hw);
+    cov.disc(x1, y1, hw-0.5);
+    cov.disc(x2, y2, hw-0.5);
+    cov.disc(s1x, s1y, hw-0.5);
+    cov.disc(s2x, s2y, hw-0.5);
+    cov.blend(img, width, r, g, b, a);
 }
@@ -0,0 +1,247 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Easing curves for interpolating between keyframes.
+
+An easing curve maps progress between two keyframes (0 to 1) to how far
+the value has moved (0 at the first keyframe, 1 at the second; it may
+overshoot). Curves are sampled once into a lookup table and refined
+linearly between samples, so evaluating any curve costs about as much as
+linear interpolation, one value at a time or vectorized over frames.
+
+Built-in curves have interpolation constants, e.g. ``I_BOUNCE``. Other
+curves are registered and get a new constant to pass to ``Property.key``::
+
+    overshoot = csanim.easing.cubic_bezier(0.3, 1.5, 0.6, 1)
+    prop.key(0, 0, overshoot)
+
+Registered constants depend on registration order. To load a file saved
+with ``csanim.serialize``, register the same curves in the same order first.
+"""
+
+__all__ = (
+    "Easing",
+    "get",
+    "curve",
+    "cubic_bezier",
+    "reverse",
+    "in_out",
+    "evaluate",
+)
+
+import math
+import numpy as np
+from typing import Callable, Dict, Union
+from .constants import *
+from . import lib
+
+TABLE_SIZE = 4097
+
+# Constants of registered curves. Kept below 256 for csanim.serialize.
+FIRST_CUSTOM = 128
+LAST_CUSTOM = 255
+
+# Interpolation functions, called with (f1, f2, v1, v2, frame).
+INTERPS: Dict[int, Callable[[float, float, float, float, float], float]] = {
+    I_CONST: lib.interp.constant,
+    I_LIN: lib.interp.linear,
+    I_SINE: lib.interp.sine,
+}
+
+CURVES: Dict[int, "Easing"] = {}
+
+# Registered curves by what they were made from, so making the same curve twice gives one constant.
+_registered = {}
+
+
+class Easing:
+    """
+    An easing curve sampled into a lookup table.
+
+    * ``interp``: The interpolation constant.
+    * ``name``: Name, for display.
+    * ``table``: ``TABLE_SIZE`` samples of the curve at evenly spaced progress from 0 to 1.
+    """
+    interp: int
+    name: str
+    table: np.ndarray
+
+    def __init__(self, interp: int, name: str, func: Callable) -> None:
+        """
+        Samples ``func`` and registers the curve under ``interp``.
+
+        :param interp: The interpolation constant.
+        :param name: Name.
+        :param func: The curve. Called with an array of progress values if it
+            supports it, otherwise with each value.
+        """
+        fac = np.linspace(0, 1, TABLE_SIZE)
+        try:
+            table = np.asarray(func(fac), dtype=np.float64)
+        except (TypeError, ValueError):
+            table = None
+        if table is None or table.shape != fac.shape:
+            table = np.array([func(x) for x in fac.tolist()], dtype=np.float64)
+
+        self.interp = interp
+        self.name = name
+        self.table = table
+        CURVES[interp] = self
+        INTERPS[interp] = lib.interp.easer(table)
+
+    def __repr__(self) -> str:
+        return f"Easing({self.name})"
+
+    def __call__(self, fac: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Evaluates the curve from the table.
+
+        :param fac: Progress from 0 to 1, or an array of them.
+        """
+        result = self.interpolate(0, 1, 0, 1, np.asarray(fac, dtype=np.float64))
+        return result if isinstance(fac, np.ndarray) else float(result)
+
+    def interpolate(self, f1, f2, v1, v2, frame):
+        """
+        Vectorized interpolation between keyframes ``(f1, v1)`` and ``(f2, v2)``.
+        Arguments can be arrays. Gives the same results as the scalar function
+        in ``INTERPS``.
+        """
+        table = self.table
+        last = table.shape[0] - 1
+        pos = np.clip((frame-f1) / (f2-f1) * last, 0, last)
+        ind = np.minimum(pos.astype(np.int64), last-1)
+        fac = table[ind] + (table[ind+1]-table[ind]) * (pos-ind)
+        return v1 + (v2-v1)*fac
+
+
+def get(interp: int) -> Easing:
+    """
+    The curve of an interpolation constant.
+    Raises ``KeyError`` for ``I_CONST``, ``I_LIN`` and ``I_SINE``, which aren't tables.
+    """
+    return CURVES[interp]
+
+
+def _register(key, name: str, func: Callable) -> int:
+    if key in _registered:
+        return _registered[key]
+    interp = FIRST_CUSTOM + len(_registered)
+    if interp > LAST_CUSTOM:
+        raise ValueError(f"Can't register more than {LAST_CUSTOM-FIRST_CUSTOM+1} easing curves.")
+    Easing(interp, name, func)
+    _registered[key] = interp
+    return interp
+
+
+def curve(func: Callable, name: str = None) -> int:
+    """
+    Registers a custom curve. Returns its interpolation constant.
+    Registering the same function again returns the same constant.
+
+    :param func: Maps progress (0 to 1) to the eased progress.
+        Should give 0 at 0 and 1 at 1, so values reach the keyframes.
+    :param name: Name. Defaults to the function's name.
+    """
+    return _register(("curve", func), name or getattr(func, "__name__", "curve"), func)
+
+
+def cubic_bezier(x1: float, y1: float, x2: float, y2: float) -> int:
+    """
+    Registers a CSS style cubic Bezier curve from (0, 0) to (1, 1) with
+    control points (x1, y1) and (x2, y2). Returns its interpolation constant.
+
+    :param x1: First control point X, from 0 to 1.
+    :param y1: First control point Y. Outside 0 to 1 overshoots.
+    :param x2: Second control point X, from 0 to 1.
+    :param y2: Second control point Y.
+    """
+    if not (0 <= x1 <= 1 and 0 <= x2 <= 1):
+        raise ValueError("Control point X must be from 0 to 1.")
+
+    def func(fac):
+        # Sample the curve densely by its parameter, then resample at even X.
+        t = np.linspace(0, 1, TABLE_SIZE*8)
+        x = 3*(1-t)**2*t*x1 + 3*(1-t)*t**2*x2 + t**3
+        y = 3*(1-t)**2*t*y1 + 3*(1-t)*t**2*y2 + t**3
+        return np.interp(fac, x, y)
+
+    return _register(("cubic_bezier", x1, y1, x2, y2), f"cubic_bezier({x1}, {y1}, {x2}, {y2})", func)
+
+
+def reverse(interp: int) -> int:
+    """
+    Registers the reverse of a curve: ``1 - curve(1 - fac)``, which turns an
+    ease-out curve into an ease-in one (e.g. a bounce at the start).
+    Returns its interpolation constant.
+    """
+    easing = get(interp)
+    return _register(("reverse", interp), f"reverse({easing.name})", lambda fac: 1 - easing(1-fac))
+
+
+def in_out(interp: int) -> int:
+    """
+    Registers a curve that plays ``reverse(curve)`` in the first half and the
+    curve in the second half. Returns its interpolation constant.
+    """
+    easing = get(interp)
+
+    def func(fac):
+        return np.where(fac < 0.5, (1 - easing(np.clip(1 - 2*fac, 0, 1))) / 2,
+            (1 + easing(np.clip(2*fac - 1, 0, 1))) / 2)
+
+    return _register(("in_out", interp), f"in_out({easing.name})", func)
+
+
+def evaluate(interp: int, f1, f2, v1, v2, frame):
+    """
+    Vectorized interpolation with any interpolation constant. Arguments can be
+    arrays. Gives the same results as the scalar functions in ``INTERPS``.
+    """
+    if interp == I_CONST:
+        return v1 + np.zeros_like(frame, dtype=np.float64)
+    if interp == I_LIN:
+        return v1 + (v2-v1)*((frame-f1) / (f2-f1))
+    if interp == I_SINE:
+        # Same steps as sine() in interp.cpp
+        fac = np.fmod(-0.25 + (frame-f1) / (f2-f1) * 0.5, 1.0)
+        return (np.sin(fac * (3.1415926535*2)) + 1) / 2 * (v2-v1) + v1
+    return CURVES[interp].interpolate(f1, f2, v1, v2, frame)
+
+
+def _bounce(fac):
+    n, d = 7.5625, 2.75
+    return np.select(
+        [fac < 1/d, fac < 2/d, fac < 2.5/d],
+        [n*fac**2, n*(fac-1.5/d)**2 + 0.75, n*(fac-2.25/d)**2 + 0.9375],
+        n*(fac-2.625/d)**2 + 0.984375)
+
+
+def _elastic(fac):
+    with np.errstate(over="ignore"):
+        out = 2**(-10*fac) * np.sin((fac*10 - 0.75) * (2*math.pi/3)) + 1
+    return np.where(fac <= 0, 0, np.where(fac >= 1, 1, out))
+
+
+Easing(I_EASE_IN, "ease_in", lambda fac: fac**3)
+Easing(I_EASE_OUT, "ease_out", lambda fac: 1 - (1-fac)**3)
+Easing(I_EASE_IN_OUT, "ease_in_out", lambda fac: np.where(fac < 0.5, 4*fac**3, 1 - (2-2*fac)**3/2))
+Easing(I_BOUNCE, "bounce", _bounce)
+Easing(I_ELASTIC, "elastic", _elastic)
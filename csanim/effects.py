@@ -0,0 +1,426 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Post-processing effects: blur, glow, drop shadow and vignette.
+
+Effects are chained in an ``Effects`` stage, attached to a group (applied
+to its layer) or to a scene (applied to every frame). Layers are
+premultiplied BGRA images, and scene frames are opaque BGR images.
+
+Each effect is one or two vectorized passes over the affected region
+only: a group's layer is cropped to its drawn pixels and padded by how
+far the effects reach. Blurs use separable Gaussian kernels, and large
+radii are blurred on a downsampled image, then upsampled, so the cost
+doesn't grow with the radius. The stage's output is reused on frames
+where its input and the effects' prop values are the same.
+"""
+
+__all__ = (
+    "Effect",
+    "Effects",
+    "Blur",
+    "Glow",
+    "Shadow",
+    "Vignette",
+)
+
+import math
+import numpy as np
+from typing import Any, List, Optional, Sequence, Tuple
+from .props import *
+from .utils import getstate
+
+# Largest standard deviation blurred at full resolution. Larger blurs are
+# done on an image downsampled by a power of 2.
+MAX_SIGMA = 3.0
+
+
+def _gaussian(img: np.ndarray, sigma: float) -> np.ndarray:
+    """
+    Internal function.
+    Gaussian blur with standard deviation ``sigma``. Layers (4 channels) are
+    transparent outside the image, frames (3 channels) are reflected.
+    """
+    import cv2
+
+    if sigma <= 0 or img.size == 0:
+        return img
+    border = cv2.BORDER_CONSTANT if img.shape[2] == 4 else cv2.BORDER_REFLECT_101
+    factor = 1
+    while sigma/factor > MAX_SIGMA:
+        factor *= 2
+
+    height, width = img.shape[:2]
+    small = img
+    if factor > 1:
+        # Pad to a multiple of the factor, so pixels map exactly when upsampling.
+        pad_y, pad_x = -height % factor, -width % factor
+        small = cv2.copyMakeBorder(img, 0, pad_y, 0, pad_x, border)
+        small = cv2.resize(small, ((width+pad_x)//factor, (height+pad_y)//factor), interpolation=cv2.INTER_AREA)
+        # Averaging blocks and interpolating back blur too (variances (f^2-1)/12 and f^2/6).
+        sigma = math.sqrt(max(sigma**2 - (factor**2-1)/12 - factor**2/6, (factor/2)**2)) / factor
+
+    size = 2*math.ceil(3*sigma) + 1
+    kernel = cv2.getGaussianKernel(size, sigma)
+    small = cv2.sepFilter2D(small, -1, kernel, kernel, borderType=border)
+
+    if factor > 1:
+        small = cv2.resize(small, (small.shape[1]*factor, small.shape[0]*factor), interpolation=cv2.INTER_LINEAR)
+        small = small[:height, :width]
+    return small.reshape(img.shape)
+
+
+def _under(img: np.ndarray, cover: np.ndarray, color: Tuple[float, ...]) -> np.ndarray:
+    """
+    Internal function.
+    Draws a layer under a shape with coverage ``cover`` (uint8) and one color.
+    """
+    alpha = cover.astype(np.float32) * (color[3]/255)
+    under = np.empty(img.shape, dtype=np.float32)
+    for i in range(3):
+        under[..., i] = alpha * (color[i]/255)
+    under[..., 3] = alpha
+    # Premultiplied: img + under*(1-img alpha)
+    rest = 1 - img[..., 3:4].astype(np.float32)/255
+    return np.minimum(img + under*rest + 0.5, 255).astype(np.uint8)
+
+
+class Effect:
+    """
+    Base effect class. All other effects inherit from this.
+
+    Inherit and define:
+
+    * ``apply()``
+    * ``extent()`` (optional)
+
+    The docstrings of inherited effects should define a list of
+    animatable properties and what they do.
+    """
+
+    def props(self) -> List[Tuple[str, Property]]:
+        """
+        All animatable properties of the effect as (name, property).
+        """
+        props = []
+        for name, attr in vars(self).items():
+            if isinstance(attr, Property):
+                props.append((name, attr))
+            elif isinstance(attr, VectorProp):
+                props.extend((f"{name}[{i}]", prop) for i, prop in enumerate(attr.props))
+        return props
+
+    def extent(self, frame: float) -> Tuple[int, int, int, int]:
+        """
+        Effects may define their own implementation.
+        How many pixels the effect can reach past the drawn pixels of a
+        layer, as (left, top, right, bottom).
+
+        The default implementation returns zeros.
+        """
+        return (0, 0, 0, 0)
+
+    def apply(self, img: np.ndarray, x: int, y: int, shape: Tuple[int, ...], frame: float) -> np.ndarray:
+        """
+        Effects must define their own implementation.
+        Returns the image with the effect applied, with the same shape. The
+        input may be modified.
+
+        :param img: Premultiplied BGRA layer, or opaque BGR frame.
+        :param x: X location of the image in the frame.
+        :param y: Y location of the image in the frame.
+        :param shape: Shape of the frame.
+        :param frame: Frame.
+        """
+        raise NotImplementedError
+
+
+class Blur(Effect):
+    """
+    Gaussian blur.
+
+    Animatable attributes:
+
+    * ``radius``: How far pixels spread. Three standard deviations.
+    """
+    radius: FloatProp
+
+    def __init__(self, radius: float = 6) -> None:
+        self.radius = FloatProp(radius)
+
+    def extent(self, frame: float) -> Tuple[int, int, int, int]:
+        radius = math.ceil(max(self.radius.value(frame), 0))
+        return (radius,)*4
+
+    def apply(self, img: np.ndarray, x: int, y: int, shape: Tuple[int, ...], frame: float) -> np.ndarray:
+        return _gaussian(img, self.radius.value(frame)/3)
+
+
+class Glow(Effect):
+    """
+    Soft colored halo around a layer, drawn under it.
+    Only visible around transparent pixels, so it has no effect on a scene.
+
+    Animatable attributes:
+
+    * ``color``: The RGBA color of the halo.
+    * ``radius``: How far the halo spreads.
+    * ``strength``: Multiplies the halo's opacity. Above 1 makes it brighter near the layer.
+    """
+    color: VectorProp
+    radius: FloatProp
+    strength: FloatProp
+
+    def __init__(self, color: Tuple[float, ...] = (255, 255, 255, 255), radius: float = 12,
+            strength: float = 1) -> None:
+        self.color = VectorProp(FloatProp, 4, color)
+        self.radius = FloatProp(radius)
+        self.strength = FloatProp(strength)
+
+    def extent(self, frame: float) -> Tuple[int, int, int, int]:
+        radius = math.ceil(max(self.radius.value(frame), 0))
+        return (radius,)*4
+
+    def apply(self, img: np.ndarray, x: int, y: int, shape: Tuple[int, ...], frame: float) -> np.ndarray:
+        import cv2
+
+        color = self.color.value(frame)
+        if img.shape[2] != 4 or color[3] == 0:
+            return img
+        cover = _gaussian(np.ascontiguousarray(img[..., 3:4]), self.radius.value(frame)/3)
+        cover = cv2.multiply(cover.reshape(img.shape[:2]), max(self.strength.value(frame), 0))
+        return _under(img, cover, color)
+
+
+class Shadow(Effect):
+    """
+    Blurred drop shadow of a layer, drawn under it.
+    Only visible around transparent pixels, so it has no effect on a scene.
+
+    Animatable attributes:
+
+    * ``color``: The RGBA color of the shadow.
+    * ``offset``: (X, Y) shift of the shadow. Rounded to whole pixels.
+    * ``radius``: How far the shadow's edge spreads.
+    """
+    color: VectorProp
+    offset: VectorProp
+    radius: FloatProp
+
+    def __init__(self, color: Tuple[float, ...] = (0, 0, 0, 160), offset: Tuple[float, float] = (6, 6),
+            radius: float = 10) -> None:
+        self.color = VectorProp(FloatProp, 4, color)
+        self.offset = VectorProp(FloatProp, 2, offset)
+        self.radius = FloatProp(radius)
+
+    def extent(self, frame: float) -> Tuple[int, int, int, int]:
+        dx, dy = map(round, self.offset.value(frame))
+        radius = math.ceil(max(self.radius.value(frame), 0))
+        return (radius+max(-dx, 0), radius+max(-dy, 0), radius+max(dx, 0), radius+max(dy, 0))
+
+    def apply(self, img: np.ndarray, x: int, y: int, shape: Tuple[int, ...], frame: float) -> np.ndarray:
+        color = self.color.value(frame)
+        if img.shape[2] != 4 or color[3] == 0:
+            return img
+        dx, dy = map(round, self.offset.value(frame))
+        height, width = img.shape[:2]
+        cover = np.zeros((height, width, 1), dtype=np.uint8)
+        cover[max(dy, 0):height+min(dy, 0), max(dx, 0):width+min(dx, 0)] = \
+            img[max(-dy, 0):height-max(dy, 0), max(-dx, 0):width-max(dx, 0), 3:4]
+        cover = _gaussian(cover, self.radius.value(frame)/3)
+        return _under(img, cover.reshape(img.shape[:2]), color)
+
+
+class Vignette(Effect):
+    """
+    Darkens toward the corners of the frame. Applied to a group, only the
+    group's pixels are darkened, as they would be on the whole frame.
+
+    Animatable attributes:
+
+    * ``strength``: Darkening at the corners, from 0 (none) to 1 (black).
+    * ``radius``: Fraction of the distance to the corners that isn't darkened.
+    """
+    strength: FloatProp
+    radius: FloatProp
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_factor", "_factor_key")
+
+    def __init__(self, strength: float = 0.5, radius: float = 0.5) -> None:
+        self.strength = FloatProp(strength)
+        self.radius = FloatProp(radius)
+        self._factor = None
+        self._factor_key = None
+
+    def __getstate__(self) -> dict:
+        return getstate(self)
+
+    def factor(self, img_shape: Tuple[int, ...], x: int, y: int, shape: Tuple[int, ...],
+            frame: float) -> np.ndarray:
+        """
+        Per-pixel multipliers for an image of ``img_shape`` at (X, Y), as float32
+        with the image's channels (alpha isn't changed). Reused while the
+        region and prop values don't change.
+        """
+        strength = self.strength.value(frame)
+        radius = min(max(self.radius.value(frame), 0), 0.999)
+        key = (img_shape, x, y, shape, strength, radius)
+        if self._factor is not None and self._factor_key == key:
+            return self._factor
+
+        # Distance from the frame's center, 1 at the corners.
+        cx, cy = shape[1]/2, shape[0]/2
+        ys, xs = np.ogrid[y:y+img_shape[0], x:x+img_shape[1]]
+        dist = np.hypot((xs+0.5-cx).astype(np.float32), (ys+0.5-cy).astype(np.float32)) / math.hypot(cx, cy)
+        fade = np.clip((dist-radius) / (1-radius), 0, 1)
+        factor = np.ones(img_shape, dtype=np.float32)
+        factor[..., :3] = (1 - strength*fade*fade)[..., None]
+
+        self._factor = factor
+        self._factor_key = key
+        return factor
+
+    def apply(self, img: np.ndarray, x: int, y: int, shape: Tuple[int, ...], frame: float) -> np.ndarray:
+        import cv2
+
+        if self.strength.value(frame) == 0 or img.size == 0:
+            return img
+        factor = self.factor(img.shape, x, y, shape, frame)
+        return cv2.multiply(img, factor, dtype=cv2.CV_8U).reshape(img.shape)
+
+
+class Effects:
+    """
+    A chain of effects, applied in order, e.g. a shadow under a glow.
+    Attach one to a ``Group`` or a ``Scene`` with ``add_effect``.
+
+    The output is cached: on a frame where the input image and every
+    effect's prop values are unchanged, the previous output is reused.
+    """
+    effects: List[Effect]
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_cache",)
+
+    def __init__(self, effects: Sequence[Effect] = ()) -> None:
+        self.effects = list(effects)
+        # (key, input, output) of the last call.
+        self._cache = None
+
+    def __getstate__(self) -> dict:
+        return getstate(self)
+
+    def __len__(self) -> int:
+        return len(self.effects)
+
+    def add(self, effect: Effect) -> None:
+        """
+        Appends an effect. It is applied after the previous effects.
+        """
+        self.effects.append(effect)
+
+    def extent(self, frame: float) -> Tuple[int, int, int, int]:
+        """
+        How many pixels the chain can reach past a layer's drawn pixels, as
+        (left, top, right, bottom).
+        """
+        total = [0, 0, 0, 0]
+        for effect in self.effects:
+            total = [a+b for a, b in zip(total, effect.extent(frame))]
+        return tuple(total)
+
+    def _cached(self, img: np.ndarray, key: List[Any]) -> Optional[Any]:
+        """
+        Internal method.
+        The previous output if the input and key are unchanged, else None.
+        """
+        # One attribute, so threads rendering other frames never see a mismatched entry.
+        cache = self._cache
+        if cache is None or cache[0] != key:
+            return None
+        if img is cache[1] or np.array_equal(img, cache[1]):
+            return cache[2]
+        return None
+
+    def _key(self, frame: float, *extra: Any) -> List[Any]:
+        """
+        Internal method.
+        Everything the output depends on, other than the input image.
+        """
+        key = list(extra)
+        for effect in self.effects:
+            key.append(type(effect))
+            key.extend(prop.value(frame) for name, prop in effect.props())
+        return key
+
+    def apply(self, layer: np.ndarray, x: int, y: int, shape: Tuple[int, ...], frame: float,
+            region: Tuple[int, int, int, int] = None) -> Tuple[np.ndarray, int, int]:
+        """
+        Applies the effects to a premultiplied BGRA layer at (X, Y) on a frame
+        of ``shape``. Returns the new layer and its location, which covers
+        the layer padded by ``extent()`` and clipped to ``region``.
+
+        :param region: (X1, Y1, X2, Y2) pixels that can be seen, e.g. all
+            places a moving layer passes. Defaults to the frame.
+        """
+        region = (0, 0, shape[1], shape[0]) if region is None else tuple(region)
+        key = self._key(frame, x, y, shape, region)
+        cached = self._cached(layer, key)
+        if cached is not None:
+            return cached
+
+        import cv2
+
+        left, top, right, bottom = self.extent(frame)
+        height, width = layer.shape[:2]
+        x1, y1 = max(x-left, region[0]), max(y-top, region[1])
+        x2, y2 = min(x+width+right, region[2]), min(y+height+bottom, region[3])
+        if layer.size == 0 or x1 >= x2 or y1 >= y2:
+            result = (layer, x, y)
+        else:
+            # The layer only covers pixels inside the region, so clipping removes only padding.
+            img = cv2.copyMakeBorder(layer, y-y1, y2-y-height, x-x1, x2-x-width, cv2.BORDER_CONSTANT, value=0)
+            for effect in self.effects:
+                img = effect.apply(img, x1, y1, shape, frame)
+            result = (img, x1, y1)
+
+        self._cache = (key, layer, result)
+        return result
+
+    def render(self, img: np.ndarray, frame: float) -> None:
+        """
+        Applies the effects to a whole opaque BGR frame, in place.
+        """
+        key = self._key(frame, img.shape)
+        cached = self._cached(img, key)
+        if cached is not None:
+            img[...] = cached
+            return
+
+        original = img.copy()
+        result = img
+        for effect in self.effects:
+            result = effect.apply(result, 0, 0, img.shape, frame)
+        # Effects may work in place, and img is reused for the next frame.
+        if np.may_share_memory(result, img):
+            result = result.copy()
+        img[...] = result
+        self._cache = (key, original, result)
@@ -26,20 +26,35 @@ __all__ = (
     "Fill",
     "Circle",
     "Rect",
+    "Path",
+    "Arrow",
+    "Image",
+    "Group",
 )
 
 # Type hinting
 class Scene:
     pass
 
+import math
+import os
+import threading
 import numpy as np
-from typing import Tuple, TYPE_CHECKING
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from .constants import *
+from .effects import Effect, Effects
 from .props import *
 from .lib import draw
-from .utils import getres
+from .transform import Transform, apply_bounds
+from .utils import getres, getstate
 if TYPE_CHECKING:
     from .scene import Scene
 
+# (X, Y) frame location of the image elements are drawing on. Groups set
+# it while drawing children on a layer that doesn't start at (0, 0).
+_canvas = threading.local()
+
 
 class Element:
     """
@@ -55,11 +70,22 @@ class Element:
 
     * ``relevant()``
     * ``render()``
+    * ``opacity()`` (optional)
+    * ``bounds()`` (optional)
 
     The docstrings of inherited elements should define a list of
     animatable properties and what they do.
+
+    Set ``transform`` to a ``csanim.Transform`` to draw the element in the
+    transform's coordinates. Elements pass ``world()`` to the drawing
+    functions, and return bounds in their own coordinates.
     """
     show: BoolProp
+    transform: Optional[Transform] = None
+
+    # Incremented whenever a public attribute of any element is set (e.g. a
+    # prop is replaced), so caches built from elements' props know to rebuild.
+    structure: int = 0
 
     def __init__(self) -> None:
         """
@@ -69,6 +95,24 @@ class Element:
         """
         self.show = BoolProp(True)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if not name.startswith("_"):
+            Element.structure += 1
+
+    def props(self) -> List[Tuple[str, Property]]:
+        """
+        All animatable properties of the element as (name, property), in a
+        stable order. Props inside a VectorProp are named like ``color[3]``.
+        """
+        props = []
+        for name, attr in vars(self).items():
+            if isinstance(attr, Property):
+                props.append((name, attr))
+            elif isinstance(attr, VectorProp):
+                props.extend((f"{name}[{i}]", prop) for i, prop in enumerate(attr.props))
+        return props
+
     def relevant(self, frame: float) -> bool:
         """
         Elements may define their own implementation.
@@ -80,6 +124,85 @@ class Element:
         """
         return True
 
+    def opacity(self) -> Optional[Property]:
+        """
+        Elements may define their own implementation.
+        Returns the property that makes the element invisible when it is 0,
+        e.g. the alpha channel of its color.
+        Used by scenes to skip the element on frames where it can't be visible.
+
+        The default implementation returns None.
+        """
+        return None
+
+    def active_intervals(self) -> List[Tuple[float, float]]:
+        """
+        Closed (start, end) frame intervals outside of which the element is
+        never rendered, from its ``show`` and ``opacity()`` keyframes.
+        """
+        intervals = self.show.nonzero_intervals()
+        opacity = self.opacity()
+        if opacity is None:
+            return intervals
+
+        result = []
+        for s1, e1 in intervals:
+            for s2, e2 in opacity.nonzero_intervals():
+                if max(s1, s2) <= min(e1, e2):
+                    result.append((max(s1, s2), min(e1, e2)))
+        return result
+
+    def world(self, frame: float) -> Optional[np.ndarray]:
+        """
+        2x3 affine matrix from the element's coordinates to image pixels, or
+        None if the element isn't attached to a transform and is drawn on
+        the frame itself.
+        """
+        matrix = None if self.transform is None else self.transform.world(frame)
+        origin = getattr(_canvas, "origin", None)
+        if origin is None:
+            return matrix
+        matrix = np.array(((1.0, 0, 0), (0, 1.0, 0))) if matrix is None else matrix.copy()
+        matrix[:, 2] -= origin
+        return matrix
+
+    def world_bounds(self, frame: float) -> Optional[Tuple[float, float, float, float]]:
+        """
+        ``bounds()`` in image pixels, with the element's transform applied.
+        """
+        bounds = self.bounds(frame)
+        matrix = None if self.transform is None else self.transform.world(frame)
+        if bounds is None or matrix is None:
+            return bounds
+        return apply_bounds(matrix, bounds)
+
+    def _state(self, frame: float) -> list:
+        """
+        Internal method.
+        Values that decide what the element draws at frame: its prop values
+        and transform. Elements that draw other elements add theirs.
+        """
+        state = []
+        for name, prop in self.props():
+            value = prop.value(frame)
+            state.append(value.tobytes() if isinstance(value, np.ndarray) else value)
+        matrix = None if self.transform is None else self.transform.world(frame)
+        state.append(None if matrix is None else matrix.tobytes())
+        return state
+
+    def bounds(self, frame: float) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Elements may define their own implementation.
+        Returns (X1, Y1, X2, Y2) pixel bounds that everything the element draws
+        at frame lies within. Scenes skip elements whose bounds are completely
+        outside the image.
+
+        The default implementation returns None (unknown, never skipped).
+
+        :param frame: The frame in question.
+        """
+        return None
+
     def render(self, img: np.ndarray, frame: float, fps: float) -> None:
         """
         Elements may define their own implementation.
@@ -146,14 +269,12 @@ class Fill(Element):
         color = self.color.value(frame)
         return color[3] != 0
 
+    def opacity(self) -> Property:
+        return self.color[3]
+
     def render(self, img: np.ndarray, frame: float, fps: float) -> None:
         color = self.color.value(frame)
-        alpha = color[-1] / 255
-
-        fill = np.full(img.shape, color[:3], dtype=np.uint8)
-        new = fill*alpha + img*(1-alpha)
-
-        img[:] = new
+        draw.fill(img, color)
 
 
 class Circle(Element):
@@ -184,12 +305,21 @@ class Circle(Element):
         color = self.color.value(frame)
         return color[3] != 0
 
+    def opacity(self) -> Property:
+        return self.color[3]
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        x, y = self.center.value(frame)
+        # One pixel of antialiasing past the radius.
+        radius = abs(self.radius.value(frame)) + 1
+        return (x-radius, y-radius, x+radius, y+radius)
+
     def render(self, img: np.ndarray, frame: float, fps: float) -> None:
         color = self.color.value(frame)
         center = self.center.value(frame)
         radius = self.radius.value(frame)
         border = self.border.value(frame)
-        draw.circle(img, color, center, radius, border)
+        draw.circle(img, color, center, radius, border, transform=self.world(frame))
 
 
 class Rect(Element):
@@ -223,10 +353,625 @@ class Rect(Element):
         color = self.color.value(frame)
         return color[3] != 0
 
+    def opacity(self) -> Property:
+        return self.color[3]
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        x, y = self.loc.value(frame)
+        w, h = self.size.value(frame)
+        # One pixel of antialiasing past the edges.
+        return (min(x, x+w)-1, min(y, y+h)-1, max(x, x+w)+1, max(y, y+h)+1)
+
     def render(self, img: np.ndarray, frame: float, fps: float) -> None:
         color = self.color.value(frame)
         loc = self.loc.value(frame)
         size = self.size.value(frame)
         border = self.border.value(frame)
         border_radius = self.border_radius.value(frame)
-        draw.rect(img, color, (*loc, *size), border, border_radius)
+        draw.rect(img, color, (*loc, *size), border, border_radius, transform=self.world(frame))
+
+
+def _trim(points: np.ndarray, fraction: float) -> np.ndarray:
+    """
+    Internal function.
+    The start of a path, ``fraction`` of its length long.
+    """
+    if fraction >= 1:
+        return points
+    lengths = np.hypot(*np.diff(points, axis=0).T)
+    cumulative = np.concatenate(([0], np.cumsum(lengths)))
+    target = cumulative[-1] * max(fraction, 0)
+    ind = int(np.searchsorted(cumulative, target, side="right"))
+    if ind >= len(points):
+        return points
+    fac = (target-cumulative[ind-1]) / lengths[ind-1]
+    end = points[ind-1] + (points[ind]-points[ind-1])*fac
+    return np.vstack((points[:ind], end))
+
+
+class Path(Element):
+    """
+    Draws connected line segments, optionally closed or with arrowheads.
+    The points, caps, joins and arrowheads are fixed.
+
+    Animatable attributes:
+
+    * ``color``: The RGBA color.
+    * ``thickness``: Line thickness.
+    * ``progress``: Fraction of the path's length that is drawn, from the first
+      point. Animate from 0 to 1 to draw the path on.
+    """
+    color: VectorProp
+    thickness: FloatProp
+    progress: FloatProp
+
+    def __init__(self, points: Sequence[Tuple[float, float]], color: Tuple[float, ...] = (255, 255, 255, 255),
+            thickness: float = 1, closed: bool = False, cap: int = CAP_ROUND, join: int = JOIN_ROUND,
+            end_arrow: bool = False, start_arrow: bool = False, head_size: Tuple[float, float] = None) -> None:
+        """
+        :param points: (X, Y) points.
+        :param closed: Whether to connect the last point to the first.
+        :param cap: Line ends. See ``csanim.draw.paths``.
+        :param join: Corners. See ``csanim.draw.paths``.
+        :param end_arrow: Whether to draw an arrowhead at the last point.
+        :param start_arrow: Whether to draw an arrowhead at the first point.
+        :param head_size: (length, width) of arrowheads. Defaults to a size based on thickness.
+        """
+        super().__init__()
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.closed = closed
+        self.cap = cap
+        self.join = join
+        self.end_arrow = end_arrow
+        self.start_arrow = start_arrow
+        self.head_size = head_size
+        self.color = VectorProp(FloatProp, 4, color)
+        self.thickness = FloatProp(thickness)
+        self.progress = FloatProp(1)
+
+    def relevant(self, frame: float) -> bool:
+        color = self.color.value(frame)
+        return color[3] != 0 and self.progress.value(frame) > 0 and len(self.points) >= 2
+
+    def opacity(self) -> Property:
+        return self.color[3]
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        points = np.array(self.points)
+        thickness = self.thickness.value(frame)
+        # Miter joins reach 4 half widths out. Arrowheads can be wider.
+        head = 0 if self.head_size is None else max(self.head_size)
+        pad = max(4*(abs(thickness)+0.5), head, 6+4*abs(thickness)) + 2
+        x1, y1 = points.min(axis=0) - pad
+        x2, y2 = points.max(axis=0) + pad
+        return (float(x1), float(y1), float(x2), float(y2))
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        color = self.color.value(frame)
+        thickness = self.thickness.value(frame)
+        progress = self.progress.value(frame)
+
+        points = np.array(self.points)
+        closed = self.closed
+        if progress < 1 and closed:
+            points = np.vstack((points, points[:1]))
+            closed = False
+        draw.path(img, color, _trim(points, progress), thickness=thickness, cap=self.cap, join=self.join,
+            closed=closed, end_arrow=self.end_arrow, start_arrow=self.start_arrow, head_size=self.head_size,
+            transform=self.world(frame))
+
+
+class Arrow(Element):
+    """
+    Draws a straight arrow with a filled head.
+
+    Animatable attributes:
+
+    * ``color``: The RGBA color.
+    * ``tail``: (X, Y) start location.
+    * ``head``: (X, Y) location of the arrowhead's tip.
+    * ``thickness``: Line thickness.
+    * ``head_size``: (length, width) of the arrowhead.
+    """
+    color: VectorProp
+    tail: VectorProp
+    head: VectorProp
+    thickness: FloatProp
+    head_size: VectorProp
+
+    def __init__(self, color: Tuple[float, ...] = (255, 255, 255, 255), tail: Tuple[float, float] = (0, 0),
+            head: Tuple[float, float] = (0, 0), thickness: float = 1, head_size: Tuple[float, float] = None,
+            double: bool = False) -> None:
+        """
+        :param head_size: Defaults to a size based on thickness.
+        :param double: Whether to also draw a head at the tail.
+        """
+        super().__init__()
+        if head_size is None:
+            head_size = (6 + 4*thickness, 5 + 3*thickness)
+        self.double = double
+        self.color = VectorProp(FloatProp, 4, color)
+        self.tail = VectorProp(FloatProp, 2, tail)
+        self.head = VectorProp(FloatProp, 2, head)
+        self.thickness = FloatProp(thickness)
+        self.head_size = VectorProp(FloatProp, 2, head_size)
+
+    def relevant(self, frame: float) -> bool:
+        color = self.color.value(frame)
+        return color[3] != 0
+
+    def opacity(self) -> Property:
+        return self.color[3]
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        x1, y1 = self.tail.value(frame)
+        x2, y2 = self.head.value(frame)
+        pad = max(abs(self.thickness.value(frame))+0.5, *map(abs, self.head_size.value(frame))) + 2
+        return (min(x1, x2)-pad, min(y1, y2)-pad, max(x1, x2)+pad, max(y1, y2)+pad)
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        color = self.color.value(frame)
+        points = (self.tail.value(frame), self.head.value(frame))
+        draw.path(img, color, points, thickness=self.thickness.value(frame), end_arrow=True,
+            start_arrow=self.double, head_size=self.head_size.value(frame), transform=self.world(frame))
+
+
+def _load_bgra(source: Any) -> np.ndarray:
+    """
+    Internal function.
+    Reads an image as premultiplied BGRA.
+    """
+    import cv2
+
+    if isinstance(source, (str, os.PathLike)):
+        img = cv2.imread(os.fspath(source), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise OSError(f"Could not read image {source}")
+    else:
+        img = np.asarray(source)
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+    if img.dtype != np.uint8:
+        raise ValueError(f"Unsupported image type {img.dtype}.")
+
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA)
+    elif img.ndim == 3 and img.shape[2] == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    elif img.ndim == 3 and img.shape[2] == 4:
+        img = img.copy()
+    else:
+        raise ValueError(f"Unsupported image shape {img.shape}.")
+
+    alpha = img[..., 3:4].astype(np.uint16)
+    img[..., :3] = (img[..., :3]*alpha + 127) // 255
+    return img
+
+
+def _composite(dest: np.ndarray, src: np.ndarray, alpha: float, opaque: bool = False) -> None:
+    """
+    Internal function.
+    Blends a premultiplied BGRA image over an image of the same size, in place.
+
+    :param alpha: Extra opacity, from 0 to 1.
+    :param opaque: Whether every pixel of src has full alpha.
+    """
+    import cv2
+
+    color = np.ascontiguousarray(src[..., :3])
+    if opaque and alpha >= 1:
+        dest[...] = color
+        return
+    cover = np.ascontiguousarray(src[..., 3])
+    if alpha < 1:
+        color = cv2.multiply(color, (alpha,)*3)
+        cover = cv2.multiply(cover, alpha)
+    # Colors are premultiplied: dest*(1-cover) + color
+    cv2.multiply(dest, cv2.cvtColor(255-cover, cv2.COLOR_GRAY2BGR), dst=dest, scale=1/255)
+    cv2.add(dest, color, dst=dest)
+
+
+class Image(Element):
+    """
+    Draws a bitmap image, e.g. a logo, screenshot or diagram.
+
+    The source is decoded once into a pyramid of halved copies. Each size
+    drawn is resampled from the smallest copy at least that large, so
+    zooming doesn't resample the full image every frame, and recently
+    used sizes are cached.
+
+    Animatable attributes:
+
+    * ``loc``: (X, Y) top left corner.
+    * ``size``: (width, height). Rounded to whole pixels.
+    * ``alpha``: Opacity, from 0 to 255.
+    """
+    loc: VectorProp
+    size: VectorProp
+    alpha: FloatProp
+
+    # Number of resampled sizes kept per image.
+    cache_size = 16
+
+    # Runtime caches, see ``utils.transient``. Rebuilt from the source where needed.
+    _transient = ("_pyramid", "_cache")
+
+    def __init__(self, source: Any, loc: Tuple[float, float] = (0, 0), size: Tuple[float, float] = None,
+            alpha: float = 255) -> None:
+        """
+        :param source: File path, or (H, W), (H, W, 3) or (H, W, 4) uint8 array in
+            BGR(A) order, like frames and OpenCV images.
+        :param size: Defaults to the source's size.
+        """
+        super().__init__()
+        self.source = source
+        self._pyramid = None
+        self._cache = None
+        self._opaque = False
+        if size is None:
+            height, width = self.pyramid()[0].shape[:2]
+            size = (width, height)
+        self.loc = VectorProp(FloatProp, 2, loc)
+        self.size = VectorProp(FloatProp, 2, size)
+        self.alpha = FloatProp(alpha)
+
+    def __getstate__(self) -> dict:
+        return getstate(self)
+
+    def pyramid(self) -> List[np.ndarray]:
+        """
+        The premultiplied BGRA source, then copies halving in size down to one pixel.
+        """
+        if self._pyramid is None:
+            import cv2
+
+            level = _load_bgra(self.source)
+            levels = [level]
+            while max(level.shape[:2]) > 1:
+                size = (max(level.shape[1]//2, 1), max(level.shape[0]//2, 1))
+                level = cv2.resize(level, size, interpolation=cv2.INTER_AREA)
+                levels.append(level)
+            self._pyramid = levels
+            self._opaque = bool((levels[0][..., 3] == 255).all())
+        return self._pyramid
+
+    def scaled(self, width: int, height: int) -> np.ndarray:
+        """
+        The premultiplied BGRA image at a size. Don't modify it; it's cached.
+
+        :param width: Width in pixels.
+        :param height: Height in pixels.
+        """
+        if self._cache is None:
+            self._cache = OrderedDict()
+        cache = self._cache
+        key = (width, height)
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        import cv2
+
+        levels = self.pyramid()
+        src = levels[0]
+        for level in levels[1:]:
+            if level.shape[1] < width or level.shape[0] < height:
+                break
+            src = level
+        if src.shape[:2] == (height, width):
+            img = src
+        else:
+            shrink = src.shape[1] >= width and src.shape[0] >= height
+            img = cv2.resize(src, key, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+
+        cache[key] = img
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return img
+
+    def relevant(self, frame: float) -> bool:
+        width, height = self.size.value(frame)
+        return self.alpha.value(frame) != 0 and round(width) > 0 and round(height) > 0
+
+    def opacity(self) -> Property:
+        return self.alpha
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        x, y = self.loc.value(frame)
+        width, height = self.size.value(frame)
+        # Rounding to whole pixels moves edges by up to half a pixel.
+        return (x-1, y-1, x+width+1, y+height+1)
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        import cv2
+
+        matrix = self.world(frame)
+        shift = (0, 0)
+        if matrix is not None and np.array_equal(matrix[:, :2], np.eye(2)) and np.array_equal(matrix[:, 2],
+                np.round(matrix[:, 2])):
+            # Moved by whole pixels, e.g. drawn on a group's layer.
+            shift = tuple(map(int, matrix[:, 2]))
+        elif matrix is not None:
+            self._render_transformed(img, frame, matrix)
+            return
+
+        x, y = map(round, self.loc.value(frame))
+        x, y = x+shift[0], y+shift[1]
+        width, height = map(round, self.size.value(frame))
+        alpha = self.alpha.value(frame) / 255
+
+        # Only the part of the image inside the frame is blended.
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x+width, img.shape[1]), min(y+height, img.shape[0])
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        base = self.pyramid()[0]
+        if width > base.shape[1] or height > base.shape[0]:
+            # Enlarged: interpolate only the visible part instead of the whole image.
+            sx, sy = base.shape[1]/width, base.shape[0]/height
+            matrix = np.array([[sx, 0, sx*(x1-x+0.5)-0.5], [0, sy, sy*(y1-y+0.5)-0.5]])
+            src = cv2.warpAffine(base, matrix, (x2-x1, y2-y1), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                borderMode=cv2.BORDER_REPLICATE)
+        else:
+            src = self.scaled(width, height)[y1-y:y2-y, x1-x:x2-x]
+        _composite(img[y1:y2, x1:x2], src, alpha, self._opaque)
+
+    def _render_transformed(self, img: np.ndarray, frame: float, matrix: np.ndarray) -> None:
+        """
+        Internal method.
+        Warps the closest pyramid level straight into the covered part of the image.
+        """
+        import cv2
+
+        levels = self.pyramid()
+        base_h, base_w = levels[0].shape[:2]
+        x, y = self.loc.value(frame)
+        width, height = self.size.value(frame)
+        # Source pixels to image pixels.
+        place = np.array(((width/base_w, 0, x), (0, height/base_h, y), (0, 0, 1)))
+        full = np.vstack((matrix, (0, 0, 1))) @ place
+
+        scale = math.sqrt(abs(np.linalg.det(full[:2, :2])))
+        src = levels[0]
+        for level in levels[1:]:
+            if level.shape[1] < base_w*scale or level.shape[0] < base_h*scale:
+                break
+            src = level
+        src_h, src_w = src.shape[:2]
+        full = full @ np.diag((base_w/src_w, base_h/src_h, 1))
+
+        corners = full[:2, :2] @ np.array(((0, src_w, src_w, 0), (0, 0, src_h, src_h))) + full[:2, 2:]
+        x1, y1 = np.floor(corners.min(axis=1)).astype(int)
+        x2, y2 = np.ceil(corners.max(axis=1)).astype(int)
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, img.shape[1]), min(y2, img.shape[0])
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        # OpenCV puts pixel centers at whole coordinates, and the drawn part starts at (x1, y1).
+        linear = full[:2, :2]
+        offset = full[:2, 2] + linear @ (0.5, 0.5) - 0.5 - (x1, y1)
+        warped = cv2.warpAffine(src, np.column_stack((linear, offset)), (x2-x1, y2-y1), flags=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        _composite(img[y1:y2, x1:x2], warped, self.alpha.value(frame)/255)
+
+
+class Group(Element):
+    """
+    Draws elements as one layer, with its own opacity and offset.
+    Fading or sliding the group fades or slides the layer, without keying
+    every child.
+
+    Children are drawn into an offscreen BGRA layer, which is reused until
+    a child's prop value changes, so animating only the group costs one
+    blend per frame. A new layer draws the children twice, so when the
+    group is fully opaque and not offset, changed children are drawn
+    directly instead. Children should look the same whenever their props
+    have the same values.
+
+    The layer covers every part of the children that the ``offset``
+    animation brings into view, so children can slide in from outside the
+    frame. Children must draw through ``world()`` (as all built-in
+    elements do) to be placed on the layer.
+
+    The group's own ``transform`` isn't used; attach the children to a
+    transform to move them with it.
+
+    Post-processing effects added with ``add_effect`` are applied to the
+    layer, within its drawn pixels and as far as the effects reach.
+
+    Animatable attributes:
+
+    * ``alpha``: Opacity of the layer, from 0 to 255.
+    * ``offset``: (X, Y) shift of the layer. Rounded to whole pixels.
+    """
+    alpha: FloatProp
+    offset: VectorProp
+    effects: Optional[Effects] = None
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_layer", "_layer_key", "_reach_value", "_reach_key")
+
+    def __init__(self, elements: Sequence[Element] = (), alpha: float = 255,
+            offset: Tuple[float, float] = (0, 0)) -> None:
+        """
+        :param elements: Children, in drawing order.
+        """
+        super().__init__()
+        self.elements = list(elements)
+        self.alpha = FloatProp(alpha)
+        self.offset = VectorProp(FloatProp, 2, offset)
+        self._layer = None
+        self._layer_key = None
+        self._reach_value = None
+        self._reach_key = None
+
+    def __getstate__(self) -> dict:
+        return getstate(self)
+
+    def add_element(self, element: Element) -> None:
+        """
+        Appends a child. It goes above the previous children.
+        """
+        self.elements.append(element)
+
+    def add_effect(self, effect: Effect) -> None:
+        """
+        Appends a post-processing effect, applied to the layer after the previous ones.
+        """
+        if self.effects is None:
+            self.effects = Effects()
+        self.effects.add(effect)
+
+    def relevant(self, frame: float) -> bool:
+        return self.alpha.value(frame) != 0 and len(self.elements) > 0
+
+    def opacity(self) -> Property:
+        return self.alpha
+
+    def bounds(self, frame: float) -> Optional[Tuple[float, float, float, float]]:
+        dx, dy = self.offset.value(frame)
+        left = top = right = bottom = 0
+        if self.effects:
+            left, top, right, bottom = self.effects.extent(frame)
+        result = None
+        for element in self.elements:
+            bounds = element.world_bounds(frame)
+            if bounds is None:
+                return None
+            x1, y1, x2, y2 = bounds
+            # Rounding the offset moves the layer by up to half a pixel.
+            bounds = (x1+dx-left-1, y1+dy-top-1, x2+dx+right+1, y2+dy+bottom+1)
+            result = bounds if result is None else (min(result[0], bounds[0]), min(result[1], bounds[1]),
+                max(result[2], bounds[2]), max(result[3], bounds[3]))
+        return result
+
+    def _state(self, frame: float) -> list:
+        state = super()._state(frame)
+        if self.effects:
+            state.append(self.effects._key(frame))
+        for element in self.elements:
+            state.append(element._state(frame))
+        return state
+
+    def _layer_state(self, shape: Tuple[int, ...], frame: float, fps: float) -> list:
+        """
+        Internal method.
+        Everything the layer depends on: the children's state, including
+        the children of child groups.
+        """
+        return [shape, fps] + [element._state(frame) for element in self.elements]
+
+    def _reach(self, frame: float) -> Tuple[int, int, int, int]:
+        """
+        Internal method.
+        Smallest and largest rounded offset over the whole animation, as
+        (min X, min Y, max X, max Y). Driven offsets only give the current one.
+        """
+        # The offset props can be replaced without a new keyframe, so they are part of the key.
+        props = tuple(self.offset.props)
+        key = (Property.generation, props, tuple(prop.default for prop in props))
+        if getattr(self, "_reach_key", None) == key:
+            return self._reach_value
+
+        low, high = [], []
+        for prop in self.offset.props:
+            keys = prop.keyframes
+            if isinstance(prop, Driver) or len(keys) == 0:
+                values = np.array([prop.value(frame)], dtype=np.float64)
+            else:
+                # Integer frames catch interpolations that overshoot the keyframes.
+                frames = np.arange(math.floor(min(k.frame for k in keys)), math.ceil(max(k.frame for k in keys))+1)
+                values = np.concatenate((prop.values(frames), [k.value for k in keys]))
+            low.append(math.floor(values.min()))
+            high.append(math.ceil(values.max()))
+        reach = (low[0], low[1], high[0], high[1])
+        if not any(isinstance(prop, Driver) for prop in self.offset.props):
+            self._reach_value = reach
+            self._reach_key = key
+        return reach
+
+    def _region(self, shape: Tuple[int, ...], frame: float) -> Tuple[int, int, int, int]:
+        """
+        Internal method.
+        Part of the children's coordinates that the layer can be seen from:
+        where their bounds overlap the image for some offset of the animation.
+        """
+        ox, oy = getattr(_canvas, "origin", None) or (0, 0)
+        low_x, low_y, high_x, high_y = self._reach(frame)
+        x1, y1, x2, y2 = ox-high_x, oy-high_y, ox+shape[1]-low_x, oy+shape[0]-low_y
+        bounds = [element.world_bounds(frame) for element in self.elements]
+        if bounds and None not in bounds:
+            x1 = max(x1, math.floor(min(b[0] for b in bounds)))
+            y1 = max(y1, math.floor(min(b[1] for b in bounds)))
+            x2 = min(x2, math.ceil(max(b[2] for b in bounds)))
+            y2 = min(y2, math.ceil(max(b[3] for b in bounds)))
+        return (x1, y1, max(x1, x2), max(y1, y2))
+
+    def layer(self, shape: Tuple[int, ...], frame: float, fps: float) -> Tuple[np.ndarray, int, int]:
+        """
+        The children drawn at frame, before ``offset``, as a premultiplied BGRA
+        image cropped to the drawn pixels, and its (X, Y) location. The
+        children are drawn on a canvas covering every pixel that can be seen
+        on an image of ``shape`` during the group's offset animation.
+        Reused while children's prop values don't change.
+        """
+        region = self._region(shape, frame)
+        state = self._layer_state(shape, frame, fps) + [region]
+        if self._layer is not None and self._layer_key == state:
+            return self._layer
+
+        # Every draw blends as dest*(1-a) + color*a, so drawing on black gives
+        # premultiplied colors, and the difference from white gives alpha.
+        rx1, ry1, rx2, ry2 = region
+        canvas = (ry2-ry1, rx2-rx1, 3)
+        black = np.zeros(canvas, dtype=np.uint8)
+        white = np.full(canvas, 255, dtype=np.uint8)
+        origin = getattr(_canvas, "origin", None)
+        _canvas.origin = (rx1, ry1)
+        try:
+            for element in self.elements:
+                if element.show.value(frame) and element.relevant(frame):
+                    element.render(black, frame, fps)
+                    element.render(white, frame, fps)
+        finally:
+            _canvas.origin = origin
+        cover = 255 - np.max(white-black, axis=2)
+
+        rows = np.flatnonzero(cover.any(axis=1))
+        cols = np.flatnonzero(cover.any(axis=0))
+        if len(rows) == 0:
+            layer = (np.zeros((0, 0, 4), dtype=np.uint8), 0, 0)
+        else:
+            y1, y2, x1, x2 = rows[0], rows[-1]+1, cols[0], cols[-1]+1
+            bgra = np.empty((y2-y1, x2-x1, 4), dtype=np.uint8)
+            bgra[..., :3] = black[y1:y2, x1:x2]
+            bgra[..., 3] = cover[y1:y2, x1:x2]
+            layer = (bgra, int(x1)+rx1, int(y1)+ry1)
+        self._layer = layer
+        self._layer_key = state
+        return layer
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        alpha = self.alpha.value(frame)
+        dx, dy = map(round, self.offset.value(frame))
+        if alpha >= 255 and dx == dy == 0 and not self.effects and \
+                (self._layer_key is None or self._layer_key[:-1] != self._layer_state(img.shape, frame, fps)):
+            # Drawing the children directly looks the same, and is cheaper than a new layer.
+            for element in self.elements:
+                if element.show.value(frame) and element.relevant(frame):
+                    element.render(img, frame, fps)
+            return
+
+        layer, lx, ly = self.layer(img.shape, frame, fps)
+        if self.effects:
+            layer, lx, ly = self.effects.apply(layer, lx, ly, img.shape, frame, self._region(img.shape, frame))
+        # The layer is in frame pixels, and img may be another group's layer.
+        ox, oy = getattr(_canvas, "origin", None) or (0, 0)
+        x, y = lx+dx-ox, ly+dy-oy
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x+layer.shape[1], img.shape[1]), min(y+layer.shape[0], img.shape[0])
+        if x1 >= x2 or y1 >= y2:
+            return
+        _composite(img[y1:y2, x1:x2], layer[y1-y:y2-y, x1-x:x2-x], alpha/255)
@@ -0,0 +1,218 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Streams raw frames into FFmpeg encoder processes.
+"""
+
+__all__ = (
+    "Output",
+    "Downscaler",
+    "EncoderSet",
+    "concat",
+)
+
+import os
+import shutil
+import tempfile
+import functools
+import numpy as np
+from subprocess import Popen, PIPE, DEVNULL
+from typing import Dict, Iterable, List, Sequence, Tuple
+from .utils import empty
+
+
+@functools.lru_cache(maxsize=None)
+def find_ffmpeg() -> str:
+    """
+    Finds the FFmpeg executable. Looked up on first use rather than on
+    import, so importing csanim doesn't need FFmpeg.
+    """
+    path = shutil.which("ffmpeg")
+    if path is None or not os.path.isfile(path):
+        raise FileNotFoundError("FFmpeg not found.")
+    return path
+
+
+class Output:
+    """
+    One encoded output of a render.
+
+    * ``path``: Output video file path.
+    * ``vencode``: Video encoding.
+    * ``resolution``: (W, H) resolution. ``None`` = the video's resolution.
+    * ``bitrate``: FFmpeg bitrate, e.g. ``"4M"``. ``None`` = encoder default.
+    """
+    path: str
+    vencode: str
+    resolution: Tuple[int, int]
+    bitrate: str
+
+    def __init__(self, path: str, vencode: str = "libx265", resolution: Tuple[int, int] = None,
+            bitrate: str = None) -> None:
+        self.path = path
+        self.vencode = vencode
+        self.resolution = resolution
+        self.bitrate = bitrate
+
+
+def _resolution(output: Output, resolution: Tuple[int, int]) -> Tuple[int, int]:
+    return tuple(resolution) if output.resolution is None else tuple(output.resolution)
+
+
+def encoder_args(output: Output, resolution: Tuple[int, int], fps: float) -> List[str]:
+    """
+    FFmpeg arguments that encode raw BGR frames from stdin to an output.
+
+    :param output: The output.
+    :param resolution: (W, H) master resolution. Used if the output has none.
+    :param fps: Frames per second.
+    """
+    res = _resolution(output, resolution)
+    args = [find_ffmpeg(), "-y", "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{res[0]}x{res[1]}",
+        "-r", str(fps), "-i", "-", "-c:v", output.vencode]
+    if output.bitrate is not None:
+        args.extend(["-b:v", output.bitrate])
+    args.append(output.path)
+    return args
+
+
+class Downscaler:
+    """
+    Scales frames at a master resolution to several smaller resolutions.
+    Each resolution is downscaled once per frame, from the smallest already
+    scaled tier that is still at least as large, into a preallocated buffer.
+    """
+
+    def __init__(self, resolutions: Iterable[Tuple[int, int]], resolution: Tuple[int, int]) -> None:
+        """
+        Allocates the buffers.
+
+        :param resolutions: (W, H) resolutions to produce.
+        :param resolution: (W, H) master resolution.
+        """
+        self.resolution = tuple(resolution)
+        # Largest tier first, so each tier can be scaled from the previous ones.
+        self.tiers = sorted(set(map(tuple, resolutions)), key=lambda r: r[0]*r[1], reverse=True)
+        self.buffers = {res: empty(res) for res in self.tiers if res != self.resolution}
+
+    def scale(self, img: np.ndarray) -> Dict[Tuple[int, int], np.ndarray]:
+        """
+        Returns ``{resolution: image}`` for the master and every tier.
+        Images are reused by the next call.
+
+        :param img: Image at the master resolution.
+        """
+        import cv2
+
+        scaled = {self.resolution: img}
+        for res in self.tiers:
+            if res in scaled:
+                continue
+            src = min((r for r in scaled if r[0] >= res[0] and r[1] >= res[1]),
+                key=lambda r: r[0]*r[1], default=self.resolution)
+            scaled[res] = cv2.resize(scaled[src], res, dst=self.buffers[res], interpolation=cv2.INTER_AREA)
+        return scaled
+
+
+class EncoderSet:
+    """
+    Feeds frames at the master resolution to one FFmpeg process per output.
+    Frames are downscaled once per distinct output resolution (see
+    ``Downscaler``), shared by all outputs of that resolution.
+    """
+
+    def __init__(self, outputs: Sequence[Output], resolution: Tuple[int, int], fps: float) -> None:
+        """
+        Starts the encoder processes.
+
+        :param outputs: Outputs.
+        :param resolution: (W, H) master resolution of the frames passed to ``write``.
+        :param fps: Frames per second.
+        """
+        self.scaler = Downscaler({_resolution(output, resolution) for output in outputs}, resolution)
+        self.procs = []
+
+        try:
+            for output in outputs:
+                log = tempfile.TemporaryFile()
+                proc = Popen(encoder_args(output, resolution, fps), stdin=PIPE, stdout=DEVNULL, stderr=log)
+                self.procs.append((proc, log, output.path, _resolution(output, resolution)))
+        except BaseException:
+            self.close(check=False)
+            raise
+
+    def write(self, img: np.ndarray) -> None:
+        """
+        Writes one frame at the master resolution to all outputs.
+        """
+        scaled = self.scaler.scale(img)
+        for proc, log, path, res in self.procs:
+            try:
+                proc.stdin.write(memoryview(scaled[res]).cast("B"))
+            except BrokenPipeError:
+                # Reported with FFmpeg's output by close()
+                pass
+
+    def close(self, check: bool = True) -> None:
+        """
+        Finishes all outputs and waits for the encoders.
+        Raises ``RuntimeError`` with FFmpeg's output if an encoder failed.
+
+        :param check: Whether to raise on failure.
+        """
+        for proc, log, path, res in self.procs:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        for proc, log, path, res in self.procs:
+            proc.wait()
+
+        failed = None
+        for proc, log, path, res in self.procs:
+            if proc.returncode != 0 and failed is None:
+                log.seek(0)
+                failed = f"Encoding {path} failed:\n" + log.read().decode(errors="replace")
+            log.close()
+        self.procs = []
+
+        if check and failed is not None:
+            raise RuntimeError(failed)
+
+
+def concat(segments: Sequence[str], path: str) -> None:
+    """
+    Joins video segments encoded with the same settings into one file,
+    without re-encoding. Raises ``RuntimeError`` with FFmpeg's output on failure.
+
+    :param segments: Segment file paths, in order.
+    :param path: Output video file path. Overwritten if it exists.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        for segment in segments:
+            file.write(f"file '{os.path.realpath(segment)}'\n")
+    try:
+        args = [find_ffmpeg(), "-y", "-f", "concat", "-safe", "0", "-i", file.name, "-c", "copy", path]
+        proc = Popen(args, stdin=DEVNULL, stdout=DEVNULL, stderr=PIPE)
+        _, err = proc.communicate()
+    finally:
+        os.remove(file.name)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Concatenating segments failed:\n{err.decode(errors='replace')}")
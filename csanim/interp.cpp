@@ -27,6 +27,7 @@ Interpolation between two keyframes.
 #include <cmath>
 
 typedef  const double  CD;
+typedef  unsigned int  UINT;
 
 
 double range(CD old_min, CD old_max, CD new_min, CD new_max, CD value) {
@@ -79,3 +80,22 @@ extern "C" double sine(CD f1, CD f2, CD v1, CD v2, CD frame) {
     CD fac = (frame-f1) / (f2-f1);
     return sin(-0.25, 0.25, v1, v2, fac);
 }
+
+extern "C" double ease(const double* table, const UINT size, CD f1, CD f2, CD v1, CD v2, CD frame) {
+    /*
+    Interpolation between two keyframes along an easing curve.
+    The curve is sampled at size evenly spaced points from 0 to 1 (size >= 2),
+    and refined linearly between samples.
+    */
+    double pos = (frame-f1) / (f2-f1) * (size-1);
+    if (pos < 0)
+        pos = 0;
+    if (pos > size-1)
+        pos = size-1;
+
+    UINT ind = (UINT)pos;
+    if (ind > size-2)
+        ind = size-2;
+    CD fac = table[ind] + (table[ind+1]-table[ind]) * (pos-ind);
+    return v1 + (v2-v1)*fac;
+}
@@ -21,26 +21,78 @@
 Module for graphical drawing functions.
 """
 
-import os
-import ctypes
+import functools
+import math
 import numpy as np
 from numpy import ctypeslib as ctl
-from PIL import Image, ImageDraw, ImageFont
-from typing import Tuple, Union
+from typing import Sequence, Tuple, Union
 from ..constants import *
 from ..utils import *
 
-lib = ctypes.CDLL(os.path.join(PARENT, "libdraw.so"))
-lib.line.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(9)]]
-lib.circle.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(8)]]
-lib.rect.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(14)]]
-lib.arrow.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(11)]]
+try:
+    from .. import _native as native
+except ImportError:
+    native = None
+
+# The ctypes library is the fallback when the extension isn't built.
+lib = load_lib("libdraw.so", required=native is None)
+if lib is not None:
+    lib.fill.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(4)]]
+    lib.line.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(9)]]
+    lib.circle.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(8)]]
+    lib.rect.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(14)]]
+    lib.arrow.argtypes = [AR3D, UINT, UINT, *[DOUB for _ in range(11)]]
+    lib.circles.argtypes = [AR3D, UINT, UINT, ctl.ndpointer(np.float64, flags=AR_FLAGS), UINT,
+        ctl.ndpointer(np.float64, flags=AR_FLAGS)]
+    lib.rects.argtypes = [AR3D, UINT, UINT, ctl.ndpointer(np.float64, flags=AR_FLAGS), UINT,
+        ctl.ndpointer(np.float64, flags=AR_FLAGS)]
+    lib.polylines.argtypes = [AR3D, UINT, UINT, ctl.ndpointer(np.float64, flags=AR_FLAGS),
+        ctl.ndpointer(np.uint32, flags=AR_FLAGS), UINT, DOUB, UINT, UINT, UINT, DOUB, DOUB, UINT,
+        ctl.ndpointer(np.float64, flags=AR_FLAGS), ctl.ndpointer(np.float64, flags=AR_FLAGS)]
+impl = lib if native is None else native
+
+IDENTITY = np.array([1.0, 0, 0, 0, 1, 0])
+IDENTITY.flags.writeable = False
+
+CAPS = {CAP_BUTT: 0, CAP_ROUND: 1, CAP_SQUARE: 2}
+JOINS = {JOIN_ROUND: 0, JOIN_BEVEL: 1, JOIN_MITER: 2}
 
 
 def rgba(color):
     return (*color, 255) if len(color) == 3 else color
 
 
+def rgba_array(colors, count: int) -> np.ndarray:
+    """
+    One color, or one per shape, as a (count, 4) float64 array.
+    """
+    colors = np.asarray(colors, dtype=np.float64)
+    if colors.shape[-1] == 3:
+        colors = np.concatenate((colors, np.full((*colors.shape[:-1], 1), 255.0)), axis=-1)
+    return np.broadcast_to(colors, (count, 4))
+
+
+def affine(transform: np.ndarray = None) -> np.ndarray:
+    """
+    A 2x3 affine transform (or None for identity) as 6 contiguous float64 values.
+    """
+    if transform is None:
+        return IDENTITY
+    return np.ascontiguousarray(transform, dtype=np.float64).reshape(6)
+
+
+def fill(img: np.ndarray, color: Tuple[float, ...]) -> None:
+    """
+    Blends the whole image with one color, in place.
+
+    :param img: Image.
+    :param color: RGB or RGBA color.
+    """
+    assert img.dtype == np.uint8
+    color = rgba(color)
+    impl.fill(img, img.shape[1], img.shape[0], *color)
+
+
 def line(img: np.ndarray, color: Tuple[float, ...], p1: Tuple[float, float], p2: Tuple[float, float],
         thickness: float = 1) -> None:
     """
@@ -54,11 +106,11 @@ def line(img: np.ndarray, color: Tuple[float, ...], p1: Tuple[float, float], p2:
     """
     assert img.dtype == np.uint8
     color = rgba(color)
-    lib.line(img, img.shape[1], img.shape[0], *p1, *p2, thickness, *color)
+    impl.line(img, img.shape[1], img.shape[0], *p1, *p2, thickness, *color)
 
 
 def circle(img: np.ndarray, color: Tuple[float, ...], center: Tuple[float, float],
-        radius: float, border: float = 0):
+        radius: float, border: float = 0, transform: np.ndarray = None):
     """
     Draws a circle.
 
@@ -67,15 +119,23 @@ def circle(img: np.ndarray, color: Tuple[float, ...], center: Tuple[float, float
     :param center: (X, Y) center.
     :param radius: Radius.
     :param border: Border thickness. Set to 0 for no border.
+    :param transform: Optional 2x3 affine transform, like ``circles``.
     """
     assert img.dtype == np.uint8
     color = rgba(color)
-    lib.circle(img, img.shape[1], img.shape[0], *center, radius, border, *color)
+    if transform is not None:
+        # Same as circles(), without building arrays for one circle.
+        a, b, c, d, e, f = affine(transform).tolist()
+        x, y = center
+        center = (a*x + b*y + c, d*x + e*y + f)
+        scale = math.sqrt(abs(a*e - b*d))
+        radius, border = radius*scale, border*scale
+    impl.circle(img, img.shape[1], img.shape[0], *center, radius, border, *color)
 
 
 def rect(img: np.ndarray, color: Tuple[float, ...], dims: Tuple[float, float, float, float],
         border: float = 0, border_radius: float = 0, tl_rad: float = -1, tr_rad: float = -1,
-        bl_rad: float = -1, br_rad: float = -1) -> None:
+        bl_rad: float = -1, br_rad: float = -1, transform: np.ndarray = None) -> None:
     """
     Draws a rectangle.
 
@@ -88,10 +148,73 @@ def rect(img: np.ndarray, color: Tuple[float, ...], dims: Tuple[float, float, fl
     :param tr_rad: Top right corner radius.
     :param bl_rad: Bottom left corner radius.
     :param br_rad: Bottom right corner radius.
+    :param transform: Optional 2x3 affine transform, like ``rects``. Per corner radii
+        aren't supported with a transform.
     """
     assert img.dtype == np.uint8
+    if transform is not None:
+        a, b, c, d, e, f = affine(transform).tolist()
+        if b != 0 or d != 0:
+            rects(img, color, [dims], border, border_radius, transform)
+            return
+        # Same as rects() for transforms that keep rectangles axis aligned.
+        x, y, w, h = dims
+        x, y, w, h = a*x + c, e*y + f, a*w, e*h
+        dims = (min(x, x+w), min(y, y+h), abs(w), abs(h))
+        scale = math.sqrt(abs(a*e))
+        border, border_radius = border*scale, border_radius*scale
     color = rgba(color)
-    lib.rect(img, img.shape[1], img.shape[0], *dims, border, border_radius, tl_rad, tr_rad, bl_rad, br_rad, *color)
+    impl.rect(img, img.shape[1], img.shape[0], *dims, border, border_radius, tl_rad, tr_rad, bl_rad, br_rad, *color)
+
+
+def circles(img: np.ndarray, colors, centers: np.ndarray, radii, borders=0, transform: np.ndarray = None) -> None:
+    """
+    Draws many circles, in order, in one call.
+    Each argument is one value for all circles, or an array with one per circle.
+
+    :param img: Image.
+    :param colors: RGB or RGBA color, or (N, 3 or 4) array of colors.
+    :param centers: (N, 2) array of (X, Y) centers.
+    :param radii: Radius or radii.
+    :param borders: Border thickness or thicknesses. 0 for filled.
+    :param transform: Optional 2x3 affine transform from the given coordinates to
+        the image's, e.g. ``Transform.world``. Radii and borders are scaled by the
+        average scale, so circles stay circles.
+    """
+    assert img.dtype == np.uint8
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    count = len(centers)
+    data = np.empty((count, 8), dtype=np.float64)
+    data[:, 0:2] = centers
+    data[:, 2] = radii
+    data[:, 3] = borders
+    data[:, 4:8] = rgba_array(colors, count)
+    impl.circles(img, img.shape[1], img.shape[0], data.ravel(), count, affine(transform))
+
+
+def rects(img: np.ndarray, colors, dims: np.ndarray, borders=0, border_radii=0,
+        transform: np.ndarray = None) -> None:
+    """
+    Draws many rectangles, in order, in one call.
+    Each argument is one value for all rectangles, or an array with one per rectangle.
+
+    :param img: Image.
+    :param colors: RGB or RGBA color, or (N, 3 or 4) array of colors.
+    :param dims: (N, 4) array of (X, Y, W, H) dimensions.
+    :param borders: Border thickness or thicknesses. 0 for filled.
+    :param border_radii: Corner rounding radius or radii.
+    :param transform: Optional 2x3 affine transform from the given coordinates to
+        the image's. Rotated rectangles are drawn without corner rounding.
+    """
+    assert img.dtype == np.uint8
+    dims = np.asarray(dims, dtype=np.float64).reshape(-1, 4)
+    count = len(dims)
+    data = np.empty((count, 10), dtype=np.float64)
+    data[:, 0:4] = dims
+    data[:, 4] = borders
+    data[:, 5] = border_radii
+    data[:, 6:10] = rgba_array(colors, count)
+    impl.rects(img, img.shape[1], img.shape[0], data.ravel(), count, affine(transform))
 
 
 def arrow(img: np.ndarray, color: Tuple[float, ...], tail: Tuple[float, float], head: Tuple[float, float],
@@ -109,7 +232,70 @@ def arrow(img: np.ndarray, color: Tuple[float, ...], tail: Tuple[float, float],
     """
     assert img.dtype == np.uint8
     color = rgba(color)
-    lib.arrow(img, img.shape[1], img.shape[0], *tail, *head, angle, side_len_fac, thickness, *color)
+    impl.arrow(img, img.shape[1], img.shape[0], *tail, *head, angle, side_len_fac, thickness, *color)
+
+
+def paths(img: np.ndarray, color: Tuple[float, ...], paths: Sequence[Sequence[Tuple[float, float]]],
+        thickness: float = 1, cap: int = CAP_ROUND, join: int = JOIN_ROUND, closed: bool = False,
+        end_arrow: bool = False, start_arrow: bool = False, head_size: Tuple[float, float] = None,
+        transform: np.ndarray = None) -> None:
+    """
+    Draws paths of connected line segments, e.g. graph edges, in one call.
+    Each path (with its joins, caps and arrowheads) is blended once per pixel,
+    so overlapping segments of a translucent path don't darken.
+
+    :param img: Image.
+    :param color: RGB or RGBA color, or (P, 3 or 4) array with one color per path.
+    :param paths: List of paths. Each path is a list (or (N, 2) array) of (X, Y) points.
+        A (P, N, 2) array is also accepted when all paths have N points.
+    :param thickness: Line thickness, like ``line``.
+    :param cap: Line ends. ``CAP_BUTT``, ``CAP_ROUND`` or ``CAP_SQUARE``.
+    :param join: Corners. ``JOIN_ROUND``, ``JOIN_BEVEL`` or ``JOIN_MITER``.
+    :param closed: Whether to connect the last point of each path to the first.
+    :param end_arrow: Whether to draw an arrowhead at the last point.
+    :param start_arrow: Whether to draw an arrowhead at the first point.
+    :param head_size: (length, width) of arrowheads. Defaults to a size based on thickness.
+    :param transform: Optional 2x3 affine transform of the points. Thickness and
+        arrowheads are scaled by the average scale.
+    """
+    assert img.dtype == np.uint8
+    if len(paths) == 0:
+        return
+    if head_size is None:
+        head_size = (6 + 4*thickness, 5 + 3*thickness)
+    if isinstance(paths, np.ndarray) and paths.ndim == 3:
+        points = np.ascontiguousarray(paths, dtype=np.float64)
+        counts = np.full(len(paths), paths.shape[1], dtype=np.uint32)
+    else:
+        points = np.ascontiguousarray(np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2)
+            for p in paths]))
+        counts = np.array([len(p) for p in paths], dtype=np.uint32)
+    colors = np.ascontiguousarray(rgba_array(color, len(counts)))
+    heads = int(end_arrow) | int(start_arrow) << 1
+    impl.polylines(img, img.shape[1], img.shape[0], points.ravel(), counts, len(counts), thickness, CAPS[cap],
+        JOINS[join], int(closed), head_size[0], head_size[1]/2, heads, colors.ravel(), affine(transform))
+
+
+def path(img: np.ndarray, color: Tuple[float, ...], points: Sequence[Tuple[float, float]], **kwargs) -> None:
+    """
+    Draws one path of connected line segments. Takes the same keyword arguments as ``paths``.
+
+    :param img: Image.
+    :param color: RGB or RGBA color.
+    :param points: List (or (N, 2) array) of (X, Y) points.
+    """
+    paths(img, color, [points], **kwargs)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_font(font: Union[int, str], font_size: int) -> "ImageFont.FreeTypeFont":
+    from PIL import ImageFont
+
+    if isinstance(font, int):
+        if font == F_CODE:
+            return ImageFont.truetype(ROBOTO, font_size)
+        raise ValueError(f"Invalid font code: {font}")
+    return ImageFont.truetype(font, font_size)
 
 
 def text(img: np.ndarray, color: Tuple[float, ...], loc: Tuple[float, float], text: str,
@@ -124,14 +310,20 @@ def text(img: np.ndarray, color: Tuple[float, ...], loc: Tuple[float, float], te
     :param font: Font. Integer = builtin constant (F_CODE), str = font path (/path/a.ttf)
     :param font_size: Font size.
     """
-    if isinstance(font, int):
-        if font == F_CODE:
-            real_font = ImageFont.truetype(ROBOTO, font_size)
-        else:
-            raise ValueError(f"Invalid font code: {font}")
-    else:
-        real_font = ImageFont.truetype(font, font_size)
+    from PIL import Image, ImageDraw
+
+    real_font = _load_font(font, font_size)
+
+    # Only copy the region the text covers, not the whole image.
+    left, top, right, bottom = real_font.getbbox(text)
+    x0 = max(int(loc[0]+left) - 1, 0)
+    y0 = max(int(loc[1]+top) - 1, 0)
+    x1 = min(int(loc[0]+right) + 2, img.shape[1])
+    y1 = min(int(loc[1]+bottom) + 2, img.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return
 
-    pil = Image.fromarray(img)
-    ImageDraw.Draw(pil).text(loc, text, color[:3][::-1], real_font)
-    img[:] = np.array(pil)
+    region = img[y0:y1, x0:x1]
+    pil = Image.fromarray(region)
+    ImageDraw.Draw(pil).text((loc[0]-x0, loc[1]-y0), text, color[:3][::-1], real_font)
+    region[:] = np.asarray(pil)
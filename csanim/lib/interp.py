@@ -21,16 +21,26 @@
 Module for interpolation functions.
 """
 
-import os
 import ctypes
+import functools
+import numpy as np
 from ..constants import *
 from ..utils import *
 
-lib = ctypes.CDLL(os.path.join(PARENT, "libinterp.so"))
-lib.linear.argtypes = [DOUB for _ in range(5)]
-lib.linear.restype = ctypes.c_double
-lib.sine.argtypes = [DOUB for _ in range(5)]
-lib.sine.restype = ctypes.c_double
+try:
+    from .. import _native as native
+except ImportError:
+    native = None
+
+# The ctypes library is the fallback when the extension isn't built.
+lib = load_lib("libinterp.so", required=native is None)
+if lib is not None:
+    lib.linear.argtypes = [DOUB for _ in range(5)]
+    lib.linear.restype = ctypes.c_double
+    lib.sine.argtypes = [DOUB for _ in range(5)]
+    lib.sine.restype = ctypes.c_double
+    lib.ease.argtypes = [ctypes.POINTER(DOUB), UINT] + [DOUB for _ in range(5)]
+    lib.ease.restype = ctypes.c_double
 
 def constant(f1, f2, v1, v2, frame):
     """
@@ -50,3 +60,19 @@ def sine(f1, f2, v1, v2, frame):
     Sine interpolation.
     """
     return lib.sine(f1, f2, v1, v2, frame)
+
+def easer(table: np.ndarray):
+    """
+    Interpolation function (same arguments as ``linear``) along an easing
+    curve sampled at ``len(table)`` evenly spaced points from 0 to 1.
+    """
+    table = np.ascontiguousarray(table, dtype=np.float64)
+    if native is not None:
+        return functools.partial(native.ease, table.tobytes())
+    # The pointer keeps the table alive.
+    return functools.partial(lib.ease, table.ctypes.data_as(ctypes.POINTER(DOUB)), len(table))
+
+if native is not None:
+    # Called directly, without a Python wrapper in between.
+    linear = native.linear
+    sine = native.sine
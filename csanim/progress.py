@@ -0,0 +1,296 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Render progress events, and sinks that report them.
+
+Renders report progress to a ``ProgressSink``. A sink is only sent an
+update every ``sink.interval`` seconds, so reporting costs next to nothing
+per frame.
+"""
+
+__all__ = (
+    "RenderProgress",
+    "ProgressSink",
+    "NullSink",
+    "TerminalSink",
+    "JSONLinesSink",
+    "ProgressTracker",
+)
+
+import sys
+import math
+import json
+import time
+import shutil
+from typing import List, Sequence, TextIO, Tuple
+
+
+class RenderProgress:
+    """
+    Progress of a render, e.g. yielded by ``Video.render_async``.
+
+    * ``frame``: Number of frames rendered so far.
+    * ``total``: Total number of frames.
+    * ``elapsed``: Seconds since the render started.
+    * ``done``: Whether the render, including encoding, has finished.
+    * ``scenes``: ``(frames rendered, seconds spent)`` of each scene.
+    """
+    frame: int
+    total: int
+    elapsed: float
+    done: bool
+    scenes: List[Tuple[int, float]]
+
+    def __init__(self, frame: int, total: int, elapsed: float, done: bool = False,
+            scenes: List[Tuple[int, float]] = None) -> None:
+        self.frame = frame
+        self.total = total
+        self.elapsed = elapsed
+        self.done = done
+        self.scenes = [] if scenes is None else scenes
+
+    def __repr__(self) -> str:
+        return f"RenderProgress(frame={self.frame}, total={self.total}, elapsed={self.elapsed:.2f}, done={self.done})"
+
+    @property
+    def fps(self) -> float:
+        """
+        Average frames rendered per second.
+        """
+        return self.frame/self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def fraction(self) -> float:
+        """
+        Fraction of frames rendered, from 0 to 1.
+        """
+        return self.frame/self.total if self.total > 0 else 1.0
+
+    @property
+    def eta(self) -> float:
+        """
+        Estimated seconds until all frames are rendered. ``None`` if unknown.
+        """
+        if self.frame == 0 or self.elapsed <= 0:
+            return None
+        return (self.total-self.frame) / self.fps
+
+
+class ProgressSink:
+    """
+    Base class of progress sinks. Override the methods to report progress somewhere.
+
+    * ``interval``: Minimum seconds between ``update`` calls.
+    """
+    interval: float = 0
+
+    def start(self, task: str, total: int) -> None:
+        """
+        Called when a render starts.
+
+        :param task: What is being done, e.g. ``"Rendering"``.
+        :param total: Total number of frames.
+        """
+
+    def update(self, progress: RenderProgress) -> None:
+        """
+        Called with the progress, at most every ``interval`` seconds.
+        """
+
+    def finish(self, progress: RenderProgress) -> None:
+        """
+        Called once all frames are done.
+        """
+
+    def log(self, msg: str) -> None:
+        """
+        Called with other messages, e.g. when FFmpeg starts compiling.
+        """
+
+
+class NullSink(ProgressSink):
+    """
+    Discards all progress.
+    """
+    interval = math.inf
+
+
+class TerminalSink(ProgressSink):
+    """
+    Human readable progress. On a terminal, one line is rewritten in place;
+    otherwise (e.g. redirected to a file) each update is a new line.
+    """
+
+    def __init__(self, interval: float = 0.1, stream: TextIO = None) -> None:
+        """
+        :param interval: Minimum seconds between updates.
+        :param stream: Stream to write to. Defaults to ``sys.stdout``.
+        """
+        self.interval = interval
+        self.stream = stream
+        self.task = ""
+        self.width = 80
+        self.tty = False
+
+    def _write(self, line: str, end: str) -> None:
+        stream = sys.stdout if self.stream is None else self.stream
+        if self.tty:
+            line = "\r" + line[:self.width-1].ljust(self.width-1)
+        stream.write(line + end)
+        stream.flush()
+
+    def start(self, task: str, total: int) -> None:
+        stream = sys.stdout if self.stream is None else self.stream
+        self.task = task
+        self.tty = stream.isatty()
+        self.width = shutil.get_terminal_size()[0]
+
+    def update(self, progress: RenderProgress) -> None:
+        msg = f"{self.task} {progress.frame}/{progress.total}, {progress.fps:.1f} fps, " + \
+            f"{progress.fraction*100:.1f}% done, {progress.elapsed:.1f}s elapsed"
+        if progress.eta is not None:
+            msg += f", {progress.eta:.1f}s remaining"
+        self._write(msg, "" if self.tty else "\n")
+
+    def finish(self, progress: RenderProgress) -> None:
+        self._write(f"Finished {self.task.lower()} {progress.frame} frames in {progress.elapsed:.2f}s", "\n")
+
+    def log(self, msg: str) -> None:
+        self._write(msg, "\n")
+
+
+class JSONLinesSink(ProgressSink):
+    """
+    Writes one JSON object per line, for log aggregators and other programs.
+    Each object has an ``event``: ``"start"``, ``"progress"``, ``"finish"`` or ``"log"``.
+    Progress and finish events have ``frame``, ``total``, ``fps``, ``elapsed``,
+    ``eta`` (``null`` if unknown) and ``scenes``, a list of
+    ``{"frames", "seconds", "fps"}`` for each scene.
+    """
+
+    def __init__(self, stream: TextIO = None, interval: float = 1) -> None:
+        """
+        :param stream: Stream to write to. Defaults to ``sys.stdout``.
+        :param interval: Minimum seconds between progress events.
+        """
+        self.stream = stream
+        self.interval = interval
+        self.task = ""
+
+    def _write(self, data: dict) -> None:
+        stream = sys.stdout if self.stream is None else self.stream
+        stream.write(json.dumps(data) + "\n")
+        stream.flush()
+
+    def _progress(self, event: str, progress: RenderProgress) -> None:
+        self._write({
+            "event": event,
+            "task": self.task,
+            "frame": progress.frame,
+            "total": progress.total,
+            "fps": progress.fps,
+            "elapsed": progress.elapsed,
+            "eta": progress.eta,
+            "scenes": [{"frames": frames, "seconds": seconds, "fps": frames/seconds if seconds > 0 else 0.0}
+                for frames, seconds in progress.scenes],
+        })
+
+    def start(self, task: str, total: int) -> None:
+        self.task = task
+        self._write({"event": "start", "task": task, "total": total})
+
+    def update(self, progress: RenderProgress) -> None:
+        self._progress("progress", progress)
+
+    def finish(self, progress: RenderProgress) -> None:
+        self._progress("finish", progress)
+
+    def log(self, msg: str) -> None:
+        self._write({"event": "log", "task": self.task, "message": msg})
+
+
+class ProgressTracker:
+    """
+    Counts finished frames and time per scene, and sends a sink an update
+    when its ``interval`` has passed.
+    """
+
+    def __init__(self, sink: ProgressSink, task: str, total: int, offsets: Sequence[int] = None) -> None:
+        """
+        Starts the sink.
+
+        :param sink: The sink. ``None`` = ``TerminalSink()``.
+        :param task: What is being done, e.g. ``"Rendering"``.
+        :param total: Total number of frames.
+        :param offsets: First global frame of each scene, then the total
+            (see ``Video.reindex``). Defaults to one scene.
+        """
+        self.sink = TerminalSink() if sink is None else sink
+        self.total = total
+        self.offsets = [0, total] if offsets is None else list(offsets)
+        self.scene_frames = [0] * (len(self.offsets)-1)
+        self.scene_seconds = [0.0] * (len(self.offsets)-1)
+        self.frame = 0
+        self.scene = 0
+
+        self.start = self.last = time.monotonic()
+        self.next_update = self.start
+        self.sink.start(task, total)
+
+    def update(self, frame: int) -> None:
+        """
+        Records that global frames before ``frame`` are done.
+        """
+        now = time.monotonic()
+        offsets = self.offsets
+        # Offsets of no scenes (just [0]) have no scene to count in.
+        if self.scene_frames:
+            while self.scene < len(self.scene_frames)-1 and frame > offsets[self.scene+1]:
+                self.scene_frames[self.scene] = offsets[self.scene+1] - offsets[self.scene]
+                self.scene += 1
+            self.scene_frames[self.scene] = max(frame-offsets[self.scene], 0)
+            self.scene_seconds[self.scene] += now - self.last
+        self.last = now
+        self.frame = frame
+
+        if now >= self.next_update:
+            self.next_update = now + self.sink.interval
+            self.sink.update(self.progress())
+
+    def progress(self, done: bool = False) -> RenderProgress:
+        """
+        The current progress.
+        """
+        return RenderProgress(self.frame, self.total, time.monotonic()-self.start, done,
+            list(zip(self.scene_frames, self.scene_seconds)))
+
+    def finish(self) -> RenderProgress:
+        """
+        Tells the sink all frames are done.
+        """
+        progress = self.progress(done=True)
+        self.sink.finish(progress)
+        return progress
+
+    def log(self, msg: str) -> None:
+        """
+        Sends the sink a message.
+        """
+        self.sink.log(msg)
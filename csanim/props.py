@@ -24,17 +24,21 @@ __all__ = (
     "IntProp",
     "FloatProp",
     "StrProp",
+    "ArrayProp",
+    "Driver",
+    "Simplified",
+    "driver_order",
 )
 
-from typing import Any, List, Tuple, Type
+import math
+import sys
+import operator
+import numpy as np
+from typing import Any, Callable, List, Sequence, Tuple, Type, Union
 from .constants import *
-from . import lib
-
-INTERPS = {
-    I_CONST: "constant",
-    I_LIN: "linear",
-    I_SINE: "sine",
-}
+from . import easing
+from .easing import INTERPS
+from .utils import getstate
 
 
 class Keyframe:
@@ -44,7 +48,10 @@ class Keyframe:
     * ``frame``: The frame.
     * ``value``: The value. Can be any type.
     * ``interp``: The interpolation of this keyframe and the next.
+
+    Keyframes can be edited in place; caches built from keyframes rebuild.
     """
+    __slots__ = ("frame", "value", "interp")
     frame: float
     value: Any
     interp: int
@@ -53,9 +60,42 @@ class Keyframe:
         """
         Initializes keyframe.
         """
-        self.frame = frame
-        self.value = value
-        self.interp = interp
+        object.__setattr__(self, "frame", frame)
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "interp", interp)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        Property.generation += 1
+        Property.edits += 1
+
+
+class Simplified:
+    """
+    Result of ``Property.simplify`` or ``Scene.optimize``.
+
+    * ``props``: Number of props simplified.
+    * ``keyframes``: Number of keyframes before simplifying.
+    * ``removed``: Number of keyframes removed.
+    * ``bytes``: Approximate memory freed, in bytes.
+    """
+    props: int
+    keyframes: int
+    removed: int
+    bytes: int
+
+    def __init__(self, props: int = 0, keyframes: int = 0, removed: int = 0, bytes: int = 0) -> None:
+        self.props = props
+        self.keyframes = keyframes
+        self.removed = removed
+        self.bytes = bytes
+
+    def __add__(self, other: "Simplified") -> "Simplified":
+        return Simplified(self.props+other.props, self.keyframes+other.keyframes, self.removed+other.removed,
+            self.bytes+other.bytes)
+
+    def __repr__(self) -> str:
+        return f"Simplified(props={self.props}, keyframes={self.keyframes}, removed={self.removed}, bytes={self.bytes})"
 
 
 class Property:
@@ -73,7 +113,18 @@ class Property:
     default_interp: int
 
     default: Any
-    keyframes: List[Keyframe]
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_baked",)
+
+    # Incremented whenever any property gets a keyframe or changes otherwise,
+    # so caches built from keyframes (e.g. a scene's active element index)
+    # know to rebuild.
+    generation: int = 0
+    # Incremented when keyframes or defaults change other than by ``key``
+    # (a keyframe edited in place, a new list of keyframes, a new default),
+    # for caches that otherwise only check the number of keyframes.
+    edits: int = 0
 
     def __init__(self, default: Any) -> None:
         """
@@ -81,8 +132,39 @@ class Property:
 
         :param default: The default value (returned if no keyframes are present).
         """
-        self.keyframes = []
-        self.default = default
+        # Not counted as edits: a new prop isn't used by anything yet.
+        object.__setattr__(self, "_keyframes", [])
+        object.__setattr__(self, "_track", None)
+        object.__setattr__(self, "default", default)
+        self._baked = None
+
+    @property
+    def keyframes(self) -> List[Keyframe]:
+        """
+        List of keyframes.
+        Props loaded by ``csanim.serialize`` keep keyframes in arrays until
+        this is first accessed.
+        """
+        if self._keyframes is None:
+            frames, values, interps = self._track
+            if hasattr(values, "tolist"):
+                values = values.tolist()
+            self._keyframes = list(map(Keyframe, frames.tolist(), values, interps.tolist()))
+            self._track = None
+        return self._keyframes
+
+    @keyframes.setter
+    def keyframes(self, keyframes: List[Keyframe]) -> None:
+        self._keyframes = keyframes
+        self._track = None
+        Property.generation += 1
+        Property.edits += 1
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name == "default":
+            Property.generation += 1
+            Property.edits += 1
 
     def key(self, frame: float, value: Any, interp: int = None) -> None:
         """
@@ -93,14 +175,167 @@ class Property:
         if self.supported_interps != "ALL":
             assert (interp in self.supported_interps), "Interpolation not supported."
         self.keyframes.append(Keyframe(frame, value, interp))
+        self._baked = None
+        Property.generation += 1
 
     def value(self, frame: float) -> Any:
         """
         Get value at frame, depending on keyframes.
         If no keyframes are present, the default is returned.
         """
+        baked = self._baked
+        if baked is not None:
+            ind = int(frame)
+            if ind == frame and 0 <= ind < baked.shape[0]:
+                return self.type(baked[ind])
         return _interpolate(self.keyframes, frame, self.default)
 
+    def values(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Values at many frames at once, as a float64 array. Numeric props only.
+        Gives the same results as calling ``value`` at each frame (as floats),
+        without a Python call per frame.
+
+        :param frames: Array of frames.
+        """
+        frames = np.asarray(frames, dtype=np.float64)
+        keys = self.keyframes
+        if len(keys) == 0:
+            return np.full(frames.shape, float(self.default))
+        if len(keys) == 1:
+            return np.full(frames.shape, float(keys[0].value))
+
+        key_frames = np.array([k.frame for k in keys], dtype=np.float64)
+        key_values = np.array([k.value for k in keys], dtype=np.float64)
+        key_interps = np.array([k.interp for k in keys])
+
+        # Same keyframe pair as _closest_ind. Outside the keyframes, the
+        # first or last value is held.
+        ind = np.clip(np.searchsorted(key_frames, frames, side="right") - 1, 0, len(keys)-2)
+        result = np.empty(frames.shape, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for interp in np.unique(key_interps[ind]):
+                mask = key_interps[ind] == interp
+                i = ind[mask]
+                result[mask] = easing.evaluate(int(interp), key_frames[i], key_frames[i+1],
+                    key_values[i], key_values[i+1], frames[mask])
+        # In this order, so the first value wins if all keyframes share a frame.
+        result[frames >= key_frames[-1]] = key_values[-1]
+        result[frames <= key_frames[0]] = key_values[0]
+        return result
+
+    def nonzero_intervals(self) -> List[Tuple[float, float]]:
+        """
+        Closed (start, end) frame intervals outside of which the value is
+        always falsy (False, 0, ""). Bounds may be infinite.
+        Conservative: the value may still be falsy inside an interval.
+        """
+        keys = self.keyframes
+        if len(keys) == 0:
+            return [(-math.inf, math.inf)] if self.default else []
+        if any(keys[i].frame > keys[i+1].frame for i in range(len(keys)-1)):
+            return [(-math.inf, math.inf)]
+
+        intervals = []
+        if keys[0].value:
+            intervals.append((-math.inf, keys[0].frame))
+        for k1, k2 in zip(keys, keys[1:]):
+            # Interpolating between two falsy values stays falsy.
+            if k1.value or (k1.interp != I_CONST and k2.value):
+                intervals.append((k1.frame, k2.frame))
+        if keys[-1].value:
+            intervals.append((keys[-1].frame, math.inf))
+        return intervals
+
+    def simplify(self, tolerance: float = 0) -> Simplified:
+        """
+        Removes keyframes that don't change the value, e.g. repeated values,
+        or points on a line with linear interpolation. Values are checked at
+        every integer frame and at the frame of every original keyframe, so
+        props keyed in seconds are safe too.
+
+        A keyframe is removed if, without it, every checked value is within
+        ``tolerance`` of the original (numeric props), or equal (others).
+        Values are always compared with the original keyframes, so errors
+        don't add up. With the default 0, only float rounding differences
+        are allowed.
+
+        Keyframes sharing a frame with a neighbor (jumps) are kept, and so
+        are keyframes that aren't in frame order. Frames of removed
+        keyframes and of jumps are checked like any other frame.
+
+        :param tolerance: Largest allowed change of a numeric value.
+        """
+        keys = self.keyframes
+        count = len(keys)
+        if count == 0 or any(keys[i].frame > keys[i+1].frame for i in range(count-1)):
+            return Simplified(1, count)
+
+        # Original values at every frame that is checked, including one frame
+        # before the first and after the last keyframe for the held values.
+        key_frames = np.array([k.frame for k in keys], dtype=np.float64)
+        frames = np.union1d(np.arange(math.ceil(key_frames[0]), math.floor(key_frames[-1])+1), key_frames)
+        frames = np.concatenate(([frames[0]-1], frames, [frames[-1]+1]))
+        original = self._sample(keys, frames)
+
+        kept = []
+        for i, key in enumerate(keys):
+            prev = kept[-1] if kept else None
+            next = keys[i+1] if i+1 < count else None
+            if (prev is not None and prev.frame == key.frame) or (next is not None and next.frame == key.frame):
+                kept.append(key)
+                continue
+
+            # Without it, only frames from prev to next (both included) change.
+            # They are sampled with the keys around that range, so jumps at
+            # prev or next and the held values before the first and after the
+            # last keyframe are evaluated as with all keyframes.
+            start = prev.frame if prev is not None else -math.inf
+            end = next.frame if next is not None else math.inf
+            a = len(kept)
+            while a > 0 and kept[a-1].frame == start:
+                a -= 1
+            b = i + 1
+            while b < count and keys[b].frame == end:
+                b += 1
+            window = kept[max(a-1, 0):] + keys[i+1:b+1]
+            lo, hi = np.searchsorted(frames, start, "left"), np.searchsorted(frames, end, "right")
+            if not self._close(self._sample(window, frames[lo:hi]), original[lo:hi], tolerance):
+                kept.append(key)
+
+        removed = count - len(kept)
+        freed = 0
+        if removed > 0:
+            kept_ids = set(map(id, kept))
+            freed = sum(sys.getsizeof(k) + sys.getsizeof(k.value) + 8 for k in keys if id(k) not in kept_ids)
+            self.keyframes = kept
+            self._baked = None
+        return Simplified(1, count, removed, freed)
+
+    def _sample(self, keys: List[Keyframe], frames: np.ndarray) -> Any:
+        """
+        Internal method.
+        Values of the prop at frames if it had only ``keys``.
+        """
+        prop = object.__new__(type(self))
+        prop.__dict__.update(self.__dict__)
+        prop.keyframes = keys
+        prop._baked = None
+        if self.type in (bool, int, float):
+            return prop.values(frames)
+        return [prop.value(frame) for frame in frames]
+
+    def _close(self, values: Any, original: Any, tolerance: float) -> bool:
+        """
+        Internal method.
+        Whether values are within tolerance of the original values.
+        """
+        if self.type in (bool, int, float, np.ndarray):
+            values = np.asarray(values, dtype=np.float64)
+            original = np.asarray(original, dtype=np.float64)
+            return bool(np.all(np.abs(values-original) <= tolerance + 1e-9*np.abs(original)))
+        return all(v == o for v, o in zip(values, original))
+
 class VectorProp:
     """
     A static sized list of props of the same type.
@@ -152,6 +387,15 @@ class VectorProp:
         """
         return [self.props[i].value(frame) for i in range(self.length)]
 
+    def simplify(self, tolerance: float = 0) -> Simplified:
+        """
+        Simplifies every prop. See ``Property.simplify``.
+        """
+        result = Simplified()
+        for prop in self.props:
+            result += prop.simplify(tolerance)
+        return result
+
 class BoolProp(Property):
     """
     Boolean property.
@@ -184,6 +428,223 @@ class StrProp(Property):
     supported_interps = (I_CONST,)
     default_interp = I_CONST
 
+class ArrayProp(Property):
+    """
+    Float64 array property, for elements with many items (e.g. a value per
+    bar of an array). Every keyframe has the default's shape, and is
+    interpolated element-wise, so one keyframe animates all items.
+    """
+    type = np.ndarray
+    supported_interps = "ALL"
+    default_interp = I_SINE
+
+    def __init__(self, default: np.ndarray) -> None:
+        """
+        Initializes the property.
+
+        :param default: The default array. Its shape is the shape of all values.
+        """
+        super().__init__(self._freeze(default))
+        self.shape = self.default.shape
+
+    @staticmethod
+    def _freeze(value: Any) -> np.ndarray:
+        value = np.array(value, dtype=np.float64)
+        value.flags.writeable = False
+        return value
+
+    def key(self, frame: float, value: Any, interp: int = None) -> None:
+        """
+        Add a keyframe. The value is copied.
+        """
+        value = self._freeze(value)
+        if value.shape != self.shape:
+            raise ValueError(f"Expected an array of shape {self.shape}, got {value.shape}.")
+        super().key(frame, value, interp)
+
+    def value(self, frame: float) -> np.ndarray:
+        """
+        Get value at frame, depending on keyframes. The array is read only.
+        If no keyframes are present, the default is returned.
+        """
+        keys = self.keyframes
+        if len(keys) == 0:
+            return self.default
+        if frame <= keys[0].frame or len(keys) == 1:
+            return keys[0].value
+        if frame >= keys[-1].frame:
+            return keys[-1].value
+
+        ind = _closest_ind(keys, frame)
+        k1, k2 = keys[ind], keys[ind+1]
+        # Every interpolation is v1 + (v2-v1)*fac, so find fac once for all items.
+        fac = INTERPS[k1.interp](k1.frame, k2.frame, 0.0, 1.0, frame)
+        return k1.value + (k2.value-k1.value)*fac
+
+    def values(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Values at many frames at once, with shape ``frames.shape + shape``.
+        """
+        return np.array([self.value(f) for f in np.ravel(frames)]).reshape(*np.shape(frames), *self.shape)
+
+    def nonzero_intervals(self) -> List[Tuple[float, float]]:
+        if len(self.keyframes) == 0 and not self.default.any():
+            return []
+        return [(-math.inf, math.inf)]
+
+
+class Driver(Property):
+    """
+    A prop computed from other props, e.g. a label's location following a
+    circle's center. Use it in place of an element's prop::
+
+        label.loc = Driver(lambda center: (center[0], center[1]-40), circle.center)
+
+    The value at a frame is ``func(*(input.value(frame) for input in inputs))``.
+    Inputs can be props, vector props or other drivers. Each driver is
+    evaluated at most once per frame: the value is cached with the frame,
+    and recomputed when the frame or any keyframe changes. Scenes evaluate
+    their drivers in dependency order before drawing (see ``Scene.drivers``).
+
+    Drivers can't be keyed. Indexing a driver (``driver[i]``) gives a driver
+    of one item of its value, e.g. for an element's ``opacity()``. Functions
+    must be defined at module level for the video to be sent to worker
+    processes, and ``csanim.serialize`` can't save them.
+    """
+    type = object
+    supported_interps = ()
+    default_interp = I_CONST
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_cache", "_items")
+
+    # Incremented whenever a driver is created or its inputs change, so
+    # dependency graphs built from drivers know to rebuild.
+    structure: int = 0
+
+    def __init__(self, func: Callable[..., Any], *inputs: Union[Property, VectorProp], name: str = None) -> None:
+        """
+        :param func: Called with the value of each input.
+        :param inputs: Props the value is computed from.
+        :param name: Name shown in errors. Defaults to the function's name.
+        """
+        super().__init__(None)
+        self.func = func
+        self.name = getattr(func, "__name__", "driver") if name is None else name
+        self._inputs = ()
+        self._cache = None
+        self._items = None
+        self.inputs = inputs
+
+    def __getstate__(self) -> dict:
+        return getstate(self)
+
+    def __repr__(self) -> str:
+        return f"Driver({self.name})"
+
+    @property
+    def inputs(self) -> Tuple[Union[Property, VectorProp], ...]:
+        """
+        Props the value is computed from. Can be changed. Raises ``ValueError``
+        if the driver would depend on itself.
+        """
+        return self._inputs
+
+    @inputs.setter
+    def inputs(self, inputs: Sequence[Union[Property, VectorProp]]) -> None:
+        inputs = tuple(inputs)
+        for driver in driver_order(_input_drivers(inputs)):
+            if driver is self:
+                raise ValueError(f"{self!r} can't depend on itself.")
+        self._inputs = inputs
+        Driver.structure += 1
+
+    def dependencies(self) -> List["Driver"]:
+        """
+        Drivers among the inputs, including items of vector props.
+        """
+        return _input_drivers(self._inputs)
+
+    def key(self, frame: float, value: Any, interp: int = None) -> None:
+        raise TypeError("Drivers are computed from their inputs, and can't be keyed.")
+
+    def value(self, frame: float) -> Any:
+        key = (frame, Property.generation, Driver.structure)
+        # One attribute, so threads rendering other frames never see a mismatched pair.
+        cache = self._cache
+        if cache is not None and cache[0] == key:
+            return cache[1]
+        value = self.func(*(prop.value(frame) for prop in self._inputs))
+        self._cache = (key, value)
+        return value
+
+    def values(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Values at many frames at once, as a float64 array with the value's shape
+        after the frames' shape. Numeric values only.
+        """
+        values = [self.value(frame) for frame in np.ravel(frames)]
+        return np.array(values, dtype=np.float64).reshape(*np.shape(frames), *np.shape(values)[1:])
+
+    def nonzero_intervals(self) -> List[Tuple[float, float]]:
+        return [(-math.inf, math.inf)]
+
+    def __getitem__(self, idx: int) -> "Driver":
+        if self._items is None:
+            self._items = {}
+        if idx not in self._items:
+            self._items[idx] = Driver(operator.itemgetter(idx), self, name=f"{self.name}[{idx}]")
+        return self._items[idx]
+
+
+def _input_drivers(inputs: Sequence[Union[Property, VectorProp]]) -> List[Driver]:
+    """
+    Internal function.
+    Drivers among props, including items of vector props.
+    """
+    drivers = []
+    for prop in inputs:
+        if isinstance(prop, Driver):
+            drivers.append(prop)
+        elif isinstance(prop, VectorProp):
+            drivers.extend(p for p in prop.props if isinstance(p, Driver))
+    return drivers
+
+
+def driver_order(drivers: Sequence[Driver]) -> List[Driver]:
+    """
+    The drivers and every driver they depend on, each once, ordered so that
+    every driver comes after its dependencies. Raises ``ValueError`` naming
+    the drivers of a cycle if there is one.
+
+    :param drivers: Drivers.
+    """
+    order = []
+    # 1 = being visited (on the path), 2 = done.
+    state = {}
+    for root in drivers:
+        if id(root) in state:
+            continue
+        # Iterative depth first search, so long chains don't hit the recursion limit.
+        path = [root]
+        stack = [iter(root.dependencies())]
+        state[id(root)] = 1
+        while stack:
+            driver = next(stack[-1], None)
+            if driver is None:
+                stack.pop()
+                done = path.pop()
+                state[id(done)] = 2
+                order.append(done)
+            elif state.get(id(driver)) == 1:
+                cycle = path[path.index(driver):] + [driver]
+                raise ValueError("Drivers depend on each other: " + " -> ".join(map(repr, cycle)))
+            elif id(driver) not in state:
+                state[id(driver)] = 1
+                path.append(driver)
+                stack.append(iter(driver.dependencies()))
+    return order
+
 
 def _closest_ind(keyframes: List[Keyframe], frame: float) -> int:
     """
@@ -229,5 +690,4 @@ def _interpolate(keyframes: List[Keyframe], frame: float, default: Any) -> Any:
             v1 = keyframes[ind].value
             v2 = keyframes[ind+1].value
 
-            func = INTERPS[keyframes[ind].interp]
-            return getattr(lib.interp, func)(f1, f2, v1, v2, frame)
+            return INTERPS[keyframes[ind].interp](f1, f2, v1, v2, frame)
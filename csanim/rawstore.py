@@ -0,0 +1,154 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Lossless raw frame store.
+A single memory-mapped file of uint8 BGR frames, used as an intermediate
+format so a video can be re-encoded without re-rendering.
+
+File layout (little endian):
+
+* Header: magic, version, width, height, fps, frame count, scene count.
+* ``scene count + 1`` uint64 frame offsets (prefix sums of scene lengths).
+* Zero padding up to a multiple of ``PAGE``.
+* Frames, each ``height*width*3`` bytes.
+"""
+
+__all__ = (
+    "RawStore",
+    "encode",
+)
+
+import struct
+import numpy as np
+from typing import List, Sequence, Tuple
+from .encoder import EncoderSet, Output
+from .progress import ProgressSink, ProgressTracker
+
+MAGIC = b"CSANIMRW"
+VERSION = 1
+PAGE = 4096
+HEADER = struct.Struct("<8sIIIdQI")
+
+
+class RawStore:
+    """
+    A memory-mapped file of raw frames.
+    Use ``RawStore.create`` to write a new store and ``RawStore.open``
+    to read an existing one.
+    """
+    path: str
+    resolution: Tuple[int, int]
+    fps: float
+    offsets: List[int]
+    frames: np.memmap
+
+    def __init__(self, path: str, resolution: Tuple[int, int], fps: float, offsets: List[int],
+            frames: np.memmap) -> None:
+        self.path = path
+        self.resolution = resolution
+        self.fps = fps
+        self.offsets = offsets
+        self.frames = frames
+
+    @staticmethod
+    def _header_size(scenes: int) -> int:
+        size = HEADER.size + 8*(scenes+1)
+        return (size+PAGE-1) // PAGE * PAGE
+
+    @classmethod
+    def create(cls, path: str, resolution: Tuple[int, int], fps: float, offsets: Sequence[int]) -> "RawStore":
+        """
+        Creates a store, overwriting ``path``.
+
+        :param path: File path.
+        :param resolution: (W, H) resolution.
+        :param fps: Frames per second.
+        :param offsets: Global frame each scene starts at, followed by the total frame count.
+        """
+        offsets = list(offsets)
+        scenes = len(offsets) - 1
+        count = offsets[-1]
+        header_size = cls._header_size(scenes)
+
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, *resolution, fps, count, scenes))
+            file.write(struct.pack(f"<{scenes+1}Q", *offsets))
+            file.truncate(header_size + count*resolution[0]*resolution[1]*3)
+
+        frames = np.memmap(path, np.uint8, "r+", header_size, (count, resolution[1], resolution[0], 3))
+        return cls(path, resolution, fps, offsets, frames)
+
+    @classmethod
+    def open(cls, path: str, mode: str = "r") -> "RawStore":
+        """
+        Opens an existing store.
+
+        :param path: File path.
+        :param mode: ``"r"`` for read only, ``"r+"`` for read and write.
+        """
+        with open(path, "rb") as file:
+            magic, version, width, height, fps, count, scenes = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a raw frame store.")
+            if version != VERSION:
+                raise ValueError(f"Unsupported raw frame store version {version}.")
+            offsets = list(struct.unpack(f"<{scenes+1}Q", file.read(8*(scenes+1))))
+
+        frames = np.memmap(path, np.uint8, mode, cls._header_size(scenes), (count, height, width, 3))
+        return cls(path, (width, height), fps, offsets, frames)
+
+    def __len__(self) -> int:
+        return self.frames.shape[0]
+
+    def __getitem__(self, frame: int) -> np.ndarray:
+        return self.frames[frame]
+
+    def __setitem__(self, frame: int, img: np.ndarray) -> None:
+        self.frames[frame] = img
+
+    def flush(self) -> None:
+        """
+        Writes changes to disk.
+        """
+        self.frames.flush()
+
+
+def encode(store: RawStore, outputs: Sequence[Output], progress: ProgressSink = None) -> None:
+    """
+    Encodes a raw frame store into one or more videos with FFmpeg.
+    Frames are read from the store once and fed to all encoders, so this
+    only costs encoder time.
+
+    Raises ``RuntimeError`` with FFmpeg's output if an encoder fails.
+
+    :param store: The store.
+    :param outputs: Outputs.
+    :param progress: Where to report progress. Defaults to a ``csanim.progress.TerminalSink``.
+    """
+    encoders = EncoderSet(outputs, store.resolution, store.fps)
+    tracker = ProgressTracker(progress, "Encoding", len(store), store.offsets)
+    try:
+        for frame in range(len(store)):
+            tracker.update(frame)
+            encoders.write(store[frame])
+    finally:
+        encoders.close()
+    tracker.update(len(store))
+    tracker.finish()
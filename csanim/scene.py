@@ -28,16 +28,153 @@ __all__ = [
     "SceneCode",
 ]
 
+import math
 import numpy as np
-from typing import List, Tuple, Union
+from typing import Any, List, Optional, Sequence, Set, Tuple, Union
+from .bake import Bake
 from .constants import *
+from .effects import Effect, Effects
 from .elements import *
 from .lib import draw
 from .props import *
+from .transform import Transform
 from .transition import transition
 from .utils import empty, getres
 
 
+def _clear(img: np.ndarray, resolution: Tuple[int, int]) -> np.ndarray:
+    """
+    Internal function.
+    Clears a recycled buffer in place, or allocates one if none given.
+    """
+    if img is None:
+        return empty(resolution)
+    assert getres(img) == tuple(resolution), "Buffer resolution doesn't match."
+    img.fill(0)
+    return img
+
+
+def _collect_props(obj: Any, props: List[Property], seen: Set[int]) -> None:
+    """
+    Internal function.
+    Appends every prop reachable from a scene or its elements, transforms and effects, once.
+    """
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, Property):
+        props.append(obj)
+    elif isinstance(obj, VectorProp):
+        props.extend(p for p in obj.props if id(p) not in seen and not seen.add(id(p)))
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _collect_props(item, props, seen)
+    elif isinstance(obj, (Scene, Element, Transform, Effects, Effect)):
+        for value in vars(obj).values():
+            _collect_props(value, props, seen)
+        # Class attributes, e.g. an element's transform.
+        for name in ("transform", "effects"):
+            value = getattr(obj, name, None)
+            if value is not None:
+                _collect_props(value, props, seen)
+
+
+def _in_view(bounds: Tuple[float, float, float, float], resolution: Tuple[int, int]) -> bool:
+    """
+    Internal function.
+    Whether element bounds intersect the image. None (unknown bounds) always does.
+    """
+    if bounds is None:
+        return True
+    x1, y1, x2, y2 = bounds
+    return x2 >= 0 and y2 >= 0 and x1 < resolution[0] and y1 < resolution[1]
+
+
+class _ActiveIndex:
+    """
+    Internal class.
+    For every integer frame, which elements can possibly be visible.
+
+    Element intervals are converted to half open integer ranges, kept in
+    flat arrays with the index of their element, so a lookup selects the
+    ranges containing the frame. Memory is one entry per range, however
+    long it is.
+
+    ``update`` rebuilds the ranges of elements that were added or replaced,
+    or whose ``show`` or ``opacity()`` prop was replaced or got keyframes.
+    It only looks at the elements after a prop or element changed.
+    """
+
+    def __init__(self) -> None:
+        self.key = None
+        self.edits = None
+        self.elements = []
+        # Per element: (props and their keyframe counts, ranges).
+        self.entries = []
+        self.starts = self.ends = self.owners = np.empty(0)
+
+    @staticmethod
+    def _signature(element: Element) -> tuple:
+        # Props are compared by identity (they don't define ==).
+        show, opacity = element.show, element.opacity()
+        return (show, len(show.keyframes), opacity, 0 if opacity is None else len(opacity.keyframes))
+
+    @staticmethod
+    def _ranges(element: Element) -> List[Tuple[float, float]]:
+        ranges = []
+        for start, end in sorted(element.active_intervals()):
+            start = -math.inf if start == -math.inf else math.ceil(start)
+            end = math.inf if end == math.inf else math.floor(end)+1
+            if start >= end:
+                continue
+            # Merged with the previous range if they touch, so a frame is in
+            # at most one range of each element.
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def update(self, elements: List[Element]) -> None:
+        """
+        Makes the index match elements.
+        """
+        key = (Property.generation, Element.structure)
+        if key == self.key and elements == self.elements:
+            return
+
+        # Edits other than new keyframes (e.g. a new default) can't be seen
+        # in the signatures, so every element is rebuilt then.
+        edits = Property.edits
+        old = {}
+        if self.edits == edits:
+            old = {id(element): (element, entry) for element, entry in zip(self.elements, self.entries)}
+        entries = []
+        for element in elements:
+            signature = self._signature(element)
+            element_old, entry = old.get(id(element), (None, None))
+            if element_old is not element or entry[0] != signature:
+                entry = (signature, self._ranges(element))
+            entries.append(entry)
+
+        if len(entries) != len(self.entries) or any(a is not b for a, b in zip(entries, self.entries)):
+            ranges = [(start, end, i) for i, entry in enumerate(entries) for start, end in entry[1]]
+            self.starts = np.array([r[0] for r in ranges], dtype=np.float64)
+            self.ends = np.array([r[1] for r in ranges], dtype=np.float64)
+            self.owners = np.array([r[2] for r in ranges], dtype=np.int64)
+        self.key = key
+        self.edits = edits
+        self.elements = list(elements)
+        self.entries = entries
+
+    def active(self, frame: int) -> List[int]:
+        """
+        Indices of elements that can be visible at frame, in drawing order.
+        """
+        # Ranges are in element order, and don't overlap within an element.
+        return self.owners[(self.starts <= frame) & (self.ends > frame)].tolist()
+
+
 class Scene:
     """
     Base scene.
@@ -47,6 +184,10 @@ class Scene:
     trans_start: int
     trans_len: float
     elements: List[Element]
+    effects: Optional[Effects] = None
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_index", "_drivers", "_drivers_key")
 
     def __init__(self, length: float, trans_start: int = T_CUT, trans_len: float = 1.5):
         """
@@ -59,6 +200,9 @@ class Scene:
         self.trans_start = trans_start
         self.trans_len = trans_len
         self.elements = []
+        self._index = None
+        self._drivers = None
+        self._drivers_key = None
 
     def add_element(self, element: Element) -> None:
         """
@@ -67,7 +211,66 @@ class Scene:
         """
         self.elements.append(element)
 
-    def render(self, resolution: Tuple[int, int], frame: float, fps: int) -> np.ndarray:
+    def add_effect(self, effect: Effect) -> None:
+        """
+        Appends a post-processing effect, applied to every rendered frame
+        after the previous ones.
+        """
+        if self.effects is None:
+            self.effects = Effects()
+        self.effects.add(effect)
+
+    def optimize(self, tolerance: float = 0) -> Simplified:
+        """
+        Removes redundant keyframes from every prop of the scene, its
+        elements (including group children), transforms and effects.
+        See ``Property.simplify``. Returns how many keyframes were removed
+        and the memory freed.
+
+        Bake the scene after optimizing, not before.
+
+        :param tolerance: Largest allowed change of a numeric value.
+        """
+        props = []
+        _collect_props(self, props, set())
+        result = Simplified()
+        for prop in props:
+            result += prop.simplify(tolerance)
+        return result
+
+    def drivers(self) -> List[Driver]:
+        """
+        Every driver the scene's props use, directly or through other drivers,
+        ordered so that each comes after the drivers it reads. Raises
+        ``ValueError`` if drivers depend on each other in a cycle.
+
+        The order is rebuilt after drivers are created or changed, or elements
+        are added. Call this after replacing a prop with an existing driver
+        to check it right away.
+        """
+        key = (Driver.structure, len(self.elements))
+        if getattr(self, "_drivers", None) is None or self._drivers_key != key:
+            props = []
+            _collect_props(self, props, set())
+            self._drivers = driver_order([prop for prop in props if isinstance(prop, Driver)])
+            self._drivers_key = key
+        return self._drivers
+
+    def bake(self, fps: float, shared: bool = False) -> Bake:
+        """
+        Evaluates every animated prop at every frame ahead of time and
+        attaches the result, so rendering reads values by index instead of
+        interpolating keyframes. See ``csanim.bake.Bake``.
+
+        :param fps: Frames per second the scene will be rendered at.
+        :param shared: Whether to put the values in shared memory, for worker processes.
+        """
+        bake = Bake.bake(self, fps, shared)
+        bake.attach(self)
+        return bake
+
+    def render(self, resolution: Tuple[int, int], frame: float, fps: int,
+            img: np.ndarray = None) -> np.ndarray:
         """
         Renders an image. Define your own implementation if you are inheriting.
         Return a numpy array image.
@@ -81,14 +284,63 @@ class Scene:
         :param resolution: (X, Y) resolution.
         :param frame: Frame.
         :param fps: FPS.
+        :param img: Optional recycled buffer to render into. It is cleared in place
+            and returned. Inherited scenes may omit this parameter.
         """
-        img = empty(resolution)
-        for element in self.elements:
-            if element.show.value(frame) and element.relevant(frame):
-                element.render(img, frame, fps)
+        img = _clear(img, resolution)
+        self.render_over(img, frame, fps)
+        if self.effects:
+            self.effects.render(img, frame)
         # TODO transition
         return img
 
+    def render_over(self, img: np.ndarray, frame: float, fps: int, start: int = 0,
+            end: int = None) -> np.ndarray:
+        """
+        Draws elements over an existing image, without clearing it.
+        With ``start`` and ``end``, only elements ``[start, end)`` are drawn, e.g.
+        to draw the top layers over a cached image of the ones below.
+
+        :param img: Image to draw on.
+        :param frame: Frame.
+        :param fps: FPS.
+        :param start: Index of the first element to draw.
+        :param end: Index of the element to stop before. Defaults to all elements.
+        """
+        resolution = getres(img)
+        end = len(self.elements) if end is None else end
+        # Dependencies first, so every driver is computed once, from cached inputs.
+        for driver in self.drivers():
+            driver.value(frame)
+        for i in self._active_indices(frame):
+            element = self.elements[i]
+            if start <= i < end and element.show.value(frame) and element.relevant(frame) and \
+                    _in_view(element.world_bounds(frame), resolution):
+                element.render(img, frame, fps)
+        return img
+
+    def active_elements(self, frame: float) -> List[Element]:
+        """
+        Elements that can be visible at frame, in drawing order.
+        Elements whose ``show`` or ``opacity()`` keyframes make them invisible
+        at frame are skipped without evaluating any of their props.
+
+        The lookup uses an index of every element's active frames, which is
+        updated after elements, their props or keyframes change.
+
+        :param frame: Frame.
+        """
+        return [self.elements[i] for i in self._active_indices(frame)]
+
+    def _active_indices(self, frame: float) -> Sequence[int]:
+        if frame != int(frame):
+            return range(len(self.elements))
+
+        if self._index is None:
+            self._index = _ActiveIndex()
+        self._index.update(self.elements)
+        return self._index.active(int(frame))
+
 
 class SceneCode(Scene):
     """
@@ -138,14 +390,15 @@ class SceneCode(Scene):
         self._max_time = max(self._time, self._max_time)
         return self._time
 
-    def render(self, resolution: Tuple[int, int], frame: float, fps: int) -> np.ndarray:
+    def render(self, resolution: Tuple[int, int], frame: float, fps: int,
+            img: np.ndarray = None) -> np.ndarray:
         text = self._text.value(frame/fps)
         char_width = self.char_width.value(frame)
         font = self.font.value(frame)
         font_size = self.font_size.value(frame)
         cursor = self._cursor.value(frame/fps)
 
-        img = empty(resolution)
+        img = _clear(img, resolution)
 
         for i, char in enumerate(text):
             x = char_width * i
@@ -154,4 +407,6 @@ class SceneCode(Scene):
         cursor_x = cursor[0] * char_width
         draw.rect(img, (255, 255, 255), (cursor_x, 0, 1, 20))
 
+        if self.effects:
+            self.effects.render(img, frame)
         return img
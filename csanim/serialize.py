@@ -0,0 +1,304 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Compact, versioned serialization of videos, scenes, elements and props.
+
+A file is a small JSON description of the object graph followed by a few
+large arrays holding every keyframe track: frames (float64), interpolations
+(uint8) and numeric values (float64 or int64). NumPy arrays (e.g. the
+values of an ``ArrayProp``) are stored in the value arrays too. Loading
+maps the arrays without copying, and props only build their ``Keyframe``
+objects when their keyframes are first used.
+
+Objects are saved as their attributes. Built-in types are registered;
+register custom elements (or scenes, props) with ``register`` in both
+the saving and the loading program.
+
+File layout (little endian):
+
+* Magic ``CSANIMSV``, version (uint32), 4 unused bytes, description length (uint64).
+* Description (JSON, UTF-8), zero padded to a multiple of 8 bytes.
+* Frames, interpolations and values arrays, each 8 byte aligned.
+"""
+
+__all__ = (
+    "register",
+    "dumps",
+    "loads",
+    "dump",
+    "load",
+)
+
+import json
+import struct
+import numpy as np
+from typing import Any, Dict, List, Type
+from .effects import Blur, Effect, Effects, Glow, Shadow, Vignette
+from .elements import Arrow, Circle, Element, Fill, Group, Image, Path, Rect
+from .props import ArrayProp, BoolProp, Driver, FloatProp, IntProp, Property, StrProp, VectorProp
+from .scene import Scene, SceneCode
+from .structures import ArrayBars, Graph, Grid
+from .transform import Transform
+from .utils import transient
+from .video import Video
+
+MAGIC = b"CSANIMSV"
+VERSION = 2
+HEADER = struct.Struct("<8sI4xQ")
+
+REGISTRY: Dict[str, Type] = {}
+
+
+def register(cls: Type, name: str = None) -> Type:
+    """
+    Allows a class to be serialized. Can be used as a decorator.
+    Instances are saved as their attributes, and loaded without calling
+    ``__init__``. Attributes named in the class's ``_transient`` tuple
+    (runtime caches, see ``csanim.utils.transient``) are saved as None.
+
+    :param cls: The class.
+    :param name: Name stored in files. Defaults to the class name.
+    """
+    name = cls.__name__ if name is None else name
+    if REGISTRY.get(name, cls) is not cls:
+        raise ValueError(f"Another class is already registered as {name}.")
+    REGISTRY[name] = cls
+    cls._serialize_name = name
+    return cls
+
+
+for _cls in (Video, Scene, SceneCode, Element, Fill, Circle, Rect, Path, Arrow, Image, Group,
+        ArrayBars, Graph, Grid, Transform, Effect, Effects, Blur, Glow, Shadow, Vignette,
+        Property, BoolProp, IntProp, FloatProp, StrProp, VectorProp, ArrayProp, Driver):
+    register(_cls)
+
+
+def _value_kind(values: List[Any]) -> str:
+    if all(type(v) is bool for v in values):
+        return "b"
+    if all(type(v) is int for v in values):
+        return "i"
+    if all(type(v) in (int, float) for v in values):
+        return "f"
+    return "j"
+
+
+class _Writer:
+    """
+    Internal class.
+    Collects objects and keyframe tracks.
+    """
+
+    def __init__(self) -> None:
+        self.objects = []
+        self.ids = {}
+        self.tracks = []
+        self.frames = []
+        self.interps = []
+        self.floats = []
+        self.ints = []
+
+    def encode(self, value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, list):
+            return [self.encode(v) for v in value]
+        if isinstance(value, tuple):
+            return {"t": [self.encode(v) for v in value]}
+        if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+            return {"d": {k: self.encode(v) for k, v in value.items()}}
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return {"a": self.add_array(value)}
+        if isinstance(value, type) and "_serialize_name" in value.__dict__:
+            return {"c": value._serialize_name}
+        if "_serialize_name" in type(value).__dict__:
+            return {"r": self.add(value)}
+        raise TypeError(f"Can't serialize {type(value).__name__}. Register it with csanim.serialize.register")
+
+    def add(self, obj: Any) -> int:
+        if id(obj) in self.ids:
+            return self.ids[id(obj)]
+        ind = len(self.objects)
+        self.ids[id(obj)] = ind
+        entry = {"type": type(obj)._serialize_name}
+        self.objects.append(entry)
+
+        state = {}
+        skip = transient(type(obj))
+        for key, value in vars(obj).items():
+            if key in skip:
+                state[key] = None
+            elif isinstance(obj, Property) and key in ("_keyframes", "_track"):
+                continue
+            else:
+                state[key] = self.encode(value)
+        if isinstance(obj, Property):
+            entry["track"] = self.add_track(obj.keyframes)
+        entry["state"] = state
+        return ind
+
+    def add_array(self, array: np.ndarray) -> list:
+        kind = {"b": "b", "i": "i", "u": "i"}.get(array.dtype.kind, "f")
+        pool = self.floats if kind == "f" else self.ints
+        ref = [kind, len(pool), list(array.shape)]
+        pool.extend(array.ravel().tolist())
+        return ref
+
+    def add_track(self, keyframes) -> dict:
+        values = [k.value for k in keyframes]
+        kind = _value_kind(values)
+        track = {"n": len(keyframes), "kind": kind}
+        self.frames.extend(k.frame for k in keyframes)
+        self.interps.extend(k.interp for k in keyframes)
+        if kind == "f":
+            track["o"] = len(self.floats)
+            self.floats.extend(values)
+        elif kind in "bi":
+            track["o"] = len(self.ints)
+            self.ints.extend(values)
+        else:
+            track["values"] = [self.encode(v) for v in values]
+        return track
+
+    def dumps(self, root: Any) -> bytes:
+        desc = {"root": self.encode(root), "objects": self.objects}
+        arrays = (
+            np.array(self.frames, dtype="<f8"),
+            np.array(self.interps, dtype=np.uint8),
+            np.array(self.floats, dtype="<f8"),
+            np.array(self.ints, dtype="<i8"),
+        )
+        desc["arrays"] = [len(a) for a in arrays]
+
+        data = json.dumps(desc, separators=(",", ":")).encode()
+        data += b"\0" * (-len(data) % 8)
+        parts = [HEADER.pack(MAGIC, VERSION, len(data)), data]
+        for array in arrays:
+            raw = array.tobytes()
+            parts.append(raw + b"\0"*(-len(raw) % 8))
+        return b"".join(parts)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializes a video, scene, element or prop (and everything it references) to bytes.
+
+    :param obj: The object.
+    """
+    return _Writer().dumps(obj)
+
+
+def loads(data: bytes) -> Any:
+    """
+    Loads an object serialized with ``dumps``.
+    Keyframe arrays are views into ``data``.
+
+    :param data: Serialized bytes.
+    """
+    magic, version, desc_len = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a csanim serialized file.")
+    # Version 1 files have no arrays, and tracks are stored in order.
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported serialization version {version}.")
+
+    offset = HEADER.size
+    desc = json.loads(bytes(data[offset:offset+desc_len]).rstrip(b"\0"))
+    offset += desc_len
+
+    arrays = []
+    for count, dtype in zip(desc["arrays"], ("<f8", "u1", "<f8", "<i8")):
+        arrays.append(np.frombuffer(data, dtype, count, offset))
+        offset += count * np.dtype(dtype).itemsize
+        offset += -offset % 8
+    frames, interps, floats, ints = arrays
+
+    objects = []
+    for entry in desc["objects"]:
+        cls = REGISTRY.get(entry["type"])
+        if cls is None:
+            raise ValueError(f"Unknown type {entry['type']}. Register it with csanim.serialize.register")
+        objects.append(cls.__new__(cls))
+
+    def decode(value):
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        if isinstance(value, dict):
+            if "t" in value:
+                return tuple(decode(v) for v in value["t"])
+            if "d" in value:
+                return {k: decode(v) for k, v in value["d"].items()}
+            if "c" in value:
+                return REGISTRY[value["c"]]
+            if "a" in value:
+                kind, start, shape = value["a"]
+                pool = floats if kind == "f" else ints
+                array = pool[start:start+int(np.prod(shape))].reshape(shape)
+                return array.astype(bool) if kind == "b" else array
+            return objects[value["r"]]
+        return value
+
+    pos = {"key": 0, "f": 0, "i": 0}
+    for obj, entry in zip(objects, desc["objects"]):
+        state = {key: decode(value) for key, value in entry["state"].items()}
+        if "track" in entry:
+            track = entry["track"]
+            n, kind = track["n"], track["kind"]
+            start = pos["key"]
+            pos["key"] += n
+            if kind == "f":
+                start_f = track.get("o", pos["f"])
+                values = floats[start_f:start_f+n]
+                pos["f"] = start_f + n
+            elif kind in "bi":
+                start_i = track.get("o", pos["i"])
+                values = ints[start_i:start_i+n]
+                pos["i"] = start_i + n
+                if kind == "b":
+                    values = values.astype(bool)
+            else:
+                values = decode(track["values"])
+            state["_keyframes"] = None
+            state["_track"] = (frames[start:start+n], values, interps[start:start+n])
+        obj.__dict__.update(state)
+
+    return decode(desc["root"])
+
+
+def dump(obj: Any, path: str) -> None:
+    """
+    Serializes to a file. See ``dumps``.
+
+    :param obj: The object.
+    :param path: File path.
+    """
+    with open(path, "wb") as file:
+        file.write(dumps(obj))
+
+
+def load(path: str) -> Any:
+    """
+    Loads a file written by ``dump``. The file is memory mapped.
+
+    :param path: File path.
+    """
+    return loads(np.memmap(path, np.uint8, "r"))
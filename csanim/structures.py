@@ -0,0 +1,307 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Elements for data structures with many items: arrays, graphs and grids.
+
+Per-item state (values, positions, colors) is kept in ``ArrayProp`` arrays
+instead of one element per item, so one keyframe can move or recolor every
+item, and each frame is drawn with a few batched native calls.
+"""
+
+__all__ = (
+    "ArrayBars",
+    "Graph",
+    "Grid",
+)
+
+import numpy as np
+from typing import Any, Optional, Sequence, Tuple
+from .elements import Element
+from .props import *
+from .lib import draw
+
+
+def _colors(colors: Any, count: int) -> np.ndarray:
+    """
+    Internal function.
+    One color, or one per item, as a (count, 4) array.
+    """
+    return np.array(draw.rgba_array(colors, count))
+
+
+def _key_span(prop: ArrayProp, start: float, end: float, value: np.ndarray, interp: Optional[int]) -> None:
+    """
+    Internal function.
+    Animates an array prop from its value at start to value at end.
+    """
+    keys = prop.keyframes
+    if keys and keys[-1].frame == start:
+        if interp is not None:
+            # Editing the keyframe bumps Property.generation, but baked values
+            # are only cleared by Property.key.
+            keys[-1].interp = interp
+            prop._baked = None
+    else:
+        prop.key(start, prop.value(start), interp)
+    prop.key(end, value, interp)
+
+
+class ArrayBars(Element):
+    """
+    Draws an array as a row of bars, e.g. for sorting algorithms.
+    Bars stand on the bottom edge of the element's box, and a bar of
+    ``max_value`` fills its height.
+
+    Animatable attributes:
+
+    * ``values``: (N,) value of each bar.
+    * ``slots``: (N,) position of each bar, counted in bar widths from the left.
+      Bars start in order. ``swap`` and ``permute`` animate them moving.
+    * ``colors``: (N, 4) RGBA color of each bar.
+    * ``loc``: (X, Y) top left corner.
+    * ``size``: (width, height) of the whole array.
+    * ``gap``: Space between bars.
+    * ``border_radius``: Corner rounding radius of bars.
+    """
+    values: ArrayProp
+    slots: ArrayProp
+    colors: ArrayProp
+    loc: VectorProp
+    size: VectorProp
+    gap: FloatProp
+    border_radius: FloatProp
+
+    def __init__(self, values: Sequence[float], colors: Any = (255, 255, 255, 255), loc: Tuple[float, float] = (0, 0),
+            size: Tuple[float, float] = (800, 400), gap: float = 2, border_radius: float = 0,
+            max_value: float = None) -> None:
+        """
+        :param values: Initial values.
+        :param colors: One RGBA color, or one per bar.
+        :param max_value: Value of a full height bar. Defaults to the largest initial value.
+        """
+        super().__init__()
+        values = np.asarray(values, dtype=np.float64)
+        if max_value is None:
+            max_value = max(float(np.abs(values).max(initial=0)), 1e-9)
+        self.max_value = max_value
+        self.values = ArrayProp(values)
+        self.slots = ArrayProp(np.arange(len(values)))
+        self.colors = ArrayProp(_colors(colors, len(values)))
+        self.loc = VectorProp(FloatProp, 2, loc)
+        self.size = VectorProp(FloatProp, 2, size)
+        self.gap = FloatProp(gap)
+        self.border_radius = FloatProp(border_radius)
+
+    def permute(self, start: float, end: float, order: Sequence[int], interp: int = None) -> None:
+        """
+        Animates bars moving so that slot ``i`` holds the bar that was in slot ``order[i]``.
+
+        :param start: Frame the bars start moving.
+        :param end: Frame the bars arrive.
+        :param order: Permutation of slot indices.
+        :param interp: Interpolation.
+        """
+        order = np.asarray(order)
+        if sorted(order.tolist()) != list(range(len(order))) or len(order) != self.slots.shape[0]:
+            raise ValueError("order must be a permutation of all slots.")
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        current = np.rint(self.slots.value(start)).astype(int)
+        _key_span(self.slots, start, end, inverse[current], interp)
+
+    def swap(self, start: float, end: float, i: int, j: int, interp: int = None) -> None:
+        """
+        Animates the bars in slots ``i`` and ``j`` trading places.
+
+        :param start: Frame the bars start moving.
+        :param end: Frame the bars arrive.
+        :param interp: Interpolation.
+        """
+        order = np.arange(self.slots.shape[0])
+        order[i], order[j] = j, i
+        self.permute(start, end, order, interp)
+
+    def relevant(self, frame: float) -> bool:
+        return bool(self.colors.value(frame)[:, 3].any())
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        x, y = self.loc.value(frame)
+        w, h = self.size.value(frame)
+        values = self.values.value(frame)
+        scale = h / self.max_value
+        top = y + h - max(values.max(initial=0), 0)*scale
+        bottom = y + h + max(-values.min(initial=0), 0)*scale
+        return (x-1, min(y, top)-1, x+w+1, max(y+h, bottom)+1)
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        values = self.values.value(frame)
+        if len(values) == 0:
+            return
+        x, y = self.loc.value(frame)
+        w, h = self.size.value(frame)
+        gap = self.gap.value(frame)
+
+        bar_width = w / len(values)
+        heights = values * (h/self.max_value)
+        dims = np.empty((len(values), 4))
+        dims[:, 0] = x + self.slots.value(frame)*bar_width + gap/2
+        dims[:, 1] = y + h - np.maximum(heights, 0)
+        dims[:, 2] = max(bar_width-gap, 0)
+        dims[:, 3] = np.abs(heights)
+        draw.rects(img, self.colors.value(frame), dims, 0, self.border_radius.value(frame),
+            transform=self.world(frame))
+
+
+class Graph(Element):
+    """
+    Draws a graph: circles for nodes, and lines (arrows if directed) for edges.
+    The edges are fixed; hide one by setting its alpha to 0.
+
+    Animatable attributes:
+
+    * ``positions``: (N, 2) center of each node.
+    * ``radii``: (N,) radius of each node.
+    * ``node_colors``: (N, 4) RGBA color of each node.
+    * ``edge_colors``: (E, 4) RGBA color of each edge.
+    * ``edge_thickness``: Thickness of edges.
+    """
+    positions: ArrayProp
+    radii: ArrayProp
+    node_colors: ArrayProp
+    edge_colors: ArrayProp
+    edge_thickness: FloatProp
+
+    def __init__(self, positions: Sequence[Tuple[float, float]], edges: Sequence[Tuple[int, int]],
+            node_colors: Any = (255, 255, 255, 255), edge_colors: Any = (255, 255, 255, 255),
+            radius: Any = 20, edge_thickness: float = 2, directed: bool = False) -> None:
+        """
+        :param positions: Initial node centers.
+        :param edges: (from, to) node indices of each edge.
+        :param node_colors: One RGBA color, or one per node.
+        :param edge_colors: One RGBA color, or one per edge.
+        :param radius: Node radius, or one per node.
+        :param directed: Whether edges end in arrowheads (at the edge of the "to" node).
+        """
+        super().__init__()
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        if len(edges) and (edges.min() < 0 or edges.max() >= len(positions)):
+            raise ValueError("Edge refers to a node that doesn't exist.")
+        self.edges = edges
+        self.directed = directed
+        self.positions = ArrayProp(positions)
+        self.radii = ArrayProp(np.broadcast_to(np.asarray(radius, dtype=np.float64), len(positions)))
+        self.node_colors = ArrayProp(_colors(node_colors, len(positions)))
+        self.edge_colors = ArrayProp(_colors(edge_colors, len(edges)))
+        self.edge_thickness = FloatProp(edge_thickness)
+
+    def relevant(self, frame: float) -> bool:
+        return bool(self.node_colors.value(frame)[:, 3].any() or self.edge_colors.value(frame)[:, 3].any())
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        positions = self.positions.value(frame)
+        if len(positions) == 0:
+            return (0, 0, 0, 0)
+        thickness = abs(self.edge_thickness.value(frame))
+        pad = max(np.abs(self.radii.value(frame)).max(), 6+4*thickness) + 2
+        x1, y1 = positions.min(axis=0) - pad
+        x2, y2 = positions.max(axis=0) + pad
+        return (float(x1), float(y1), float(x2), float(y2))
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        positions = self.positions.value(frame)
+        radii = self.radii.value(frame)
+        edge_colors = self.edge_colors.value(frame)
+
+        visible = edge_colors[:, 3] != 0
+        if visible.any():
+            edges = self.edges[visible]
+            points = positions[edges]
+            if self.directed:
+                # End arrows at the boundary of the nodes instead of their centers.
+                delta = points[:, 1] - points[:, 0]
+                length = np.hypot(delta[:, 0], delta[:, 1])[:, None]
+                unit = np.divide(delta, length, out=np.zeros_like(delta), where=length > 0)
+                points[:, 0] += unit * radii[edges[:, 0], None]
+                points[:, 1] -= unit * radii[edges[:, 1], None]
+            draw.paths(img, edge_colors[visible], points, thickness=self.edge_thickness.value(frame),
+                end_arrow=self.directed, transform=self.world(frame))
+
+        draw.circles(img, self.node_colors.value(frame), positions, radii, transform=self.world(frame))
+
+
+class Grid(Element):
+    """
+    Draws a grid of cells, e.g. a matrix, a dynamic programming table or a board.
+
+    Animatable attributes:
+
+    * ``colors``: (rows, columns, 4) RGBA color of each cell.
+    * ``loc``: (X, Y) top left corner.
+    * ``cell_size``: (width, height) of each cell.
+    * ``gap``: Space between cells.
+    * ``border_radius``: Corner rounding radius of cells.
+    """
+    colors: ArrayProp
+    loc: VectorProp
+    cell_size: VectorProp
+    gap: FloatProp
+    border_radius: FloatProp
+
+    def __init__(self, shape: Tuple[int, int], colors: Any = (255, 255, 255, 255), loc: Tuple[float, float] = (0, 0),
+            cell_size: Tuple[float, float] = (40, 40), gap: float = 2, border_radius: float = 0) -> None:
+        """
+        :param shape: (rows, columns).
+        :param colors: One RGBA color, or a (rows, columns, 3 or 4) array.
+        """
+        super().__init__()
+        rows, cols = shape
+        colors = np.asarray(colors, dtype=np.float64)
+        colors = _colors(colors.reshape(-1, colors.shape[-1]) if colors.ndim == 3 else colors, rows*cols)
+        self.shape = (rows, cols)
+        self.colors = ArrayProp(colors.reshape(rows, cols, 4))
+        self.loc = VectorProp(FloatProp, 2, loc)
+        self.cell_size = VectorProp(FloatProp, 2, cell_size)
+        self.gap = FloatProp(gap)
+        self.border_radius = FloatProp(border_radius)
+
+    def relevant(self, frame: float) -> bool:
+        return bool(self.colors.value(frame)[..., 3].any())
+
+    def bounds(self, frame: float) -> Tuple[float, float, float, float]:
+        x, y = self.loc.value(frame)
+        w, h = self.cell_size.value(frame)
+        gap = self.gap.value(frame)
+        rows, cols = self.shape
+        return (x-1, y-1, x+cols*(w+gap)+1, y+rows*(h+gap)+1)
+
+    def render(self, img: np.ndarray, frame: float, fps: float) -> None:
+        x, y = self.loc.value(frame)
+        w, h = self.cell_size.value(frame)
+        gap = self.gap.value(frame)
+        rows, cols = np.indices(self.shape)
+
+        dims = np.empty((rows.size, 4))
+        dims[:, 0] = x + cols.ravel()*(w+gap)
+        dims[:, 1] = y + rows.ravel()*(h+gap)
+        dims[:, 2] = w
+        dims[:, 3] = h
+        draw.rects(img, self.colors.value(frame).reshape(-1, 4), dims, 0, self.border_radius.value(frame),
+            transform=self.world(frame))
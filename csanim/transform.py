@@ -0,0 +1,168 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Hierarchical 2D transforms.
+
+Transform nodes form a tree. An element attached to a node is drawn in
+the node's coordinates, so animating one node moves, scales or rotates
+everything attached to it and to its descendants, without keying the
+elements themselves.
+
+Transforms are 2x3 affine matrices mapping (X, Y, 1) to image pixels.
+"""
+
+__all__ = (
+    "Transform",
+)
+
+import math
+import numpy as np
+from typing import Optional, Tuple
+from .props import *
+from .utils import getstate
+
+
+class Transform:
+    """
+    A node of a transform tree. Local coordinates are scaled, rotated,
+    moved by ``loc``, then transformed by the parent.
+
+    World transforms are computed at most once per frame per node: a
+    node's matrix is cached with the frame, and recomputed when the frame,
+    any keyframe, or the tree changes. Children reuse their parent's cached
+    matrix, so thousands of elements under one animated node cost one
+    evaluation of its props per frame.
+
+    Animatable attributes:
+
+    * ``loc``: (X, Y) translation, in the parent's coordinates.
+    * ``scale``: (X, Y) scale factors.
+    * ``rotation``: Clockwise rotation in degrees (Y points down).
+    """
+    loc: VectorProp
+    scale: VectorProp
+    rotation: FloatProp
+
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_world", "_world_key")
+
+    # Incremented whenever a node's parent changes, so cached world
+    # transforms below it are recomputed.
+    structure: int = 0
+
+    def __init__(self, parent: Optional["Transform"] = None, loc: Tuple[float, float] = (0, 0),
+            scale: Tuple[float, float] = (1, 1), rotation: float = 0) -> None:
+        """
+        :param parent: Parent node. None for a root.
+        """
+        self._parent = None
+        self._world = None
+        self._world_key = None
+        self.parent = parent
+        self.loc = VectorProp(FloatProp, 2, loc)
+        self.scale = VectorProp(FloatProp, 2, scale)
+        self.rotation = FloatProp(rotation)
+
+    def __getstate__(self) -> dict:
+        return getstate(self)
+
+    @property
+    def parent(self) -> Optional["Transform"]:
+        """
+        Parent node, or None. Can be changed.
+        """
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent: Optional["Transform"]) -> None:
+        node = parent
+        while node is not None:
+            if node is self:
+                raise ValueError("A transform can't be its own ancestor.")
+            node = node._parent
+        self._parent = parent
+        Transform.structure += 1
+
+    def attach(self, *elements) -> None:
+        """
+        Draws elements in this node's coordinates. Same as setting their ``transform``.
+        """
+        for element in elements:
+            element.transform = self
+
+    def local(self, frame: float) -> np.ndarray:
+        """
+        3x3 matrix from this node's coordinates to its parent's.
+        """
+        x, y = self.loc.value(frame)
+        sx, sy = self.scale.value(frame)
+        angle = math.radians(self.rotation.value(frame))
+        cos, sin = math.cos(angle), math.sin(angle)
+        return np.array((
+            (cos*sx, -sin*sy, x),
+            (sin*sx, cos*sy, y),
+            (0, 0, 1),
+        ))
+
+    def world(self, frame: float) -> np.ndarray:
+        """
+        2x3 affine matrix from this node's coordinates to image pixels. Don't
+        modify it; it's cached.
+        """
+        return self._world_matrix(frame)[:2]
+
+    def _world_matrix(self, frame: float) -> np.ndarray:
+        key = (frame, Property.generation, Transform.structure)
+        if self._world_key != key:
+            matrix = self.local(frame)
+            if self._parent is not None:
+                matrix = self._parent._world_matrix(frame) @ matrix
+            self._world = matrix
+            self._world_key = key
+        return self._world
+
+
+def apply(matrix: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Transforms (N, 2) points with a 2x3 affine matrix.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    return points @ matrix[:, :2].T + matrix[:, 2]
+
+
+def apply_bounds(matrix: np.ndarray, bounds: Tuple[float, float, float, float]) -> Tuple[float, float, float, float]:
+    """
+    Pixel bounds (X1, Y1, X2, Y2) containing transformed bounds.
+    """
+    # Called for every transformed element every frame; plain floats are
+    # much faster than NumPy for four points.
+    (a, b, c), (d, e, f) = matrix.tolist()
+    x1, y1, x2, y2 = bounds
+    xs = (a*x1 + b*y1, a*x2 + b*y1, a*x2 + b*y2, a*x1 + b*y2)
+    ys = (d*x1 + e*y1, d*x2 + e*y1, d*x2 + e*y2, d*x1 + e*y2)
+    cx1, cy1, cx2, cy2 = min(xs)+c, min(ys)+f, max(xs)+c, max(ys)+f
+
+    # Radii and thickness are scaled by the average scale, so when the axes
+    # are scaled differently, circles can reach outside the stretched box.
+    sx, sy = math.hypot(a, d), math.hypot(b, e)
+    if not math.isclose(sx, sy):
+        pad = math.sqrt(abs(a*e - b*d)) * max(x2-x1, y2-y1) / 2
+        cx1, cy1, cx2, cy2 = cx1-pad, cy1-pad, cx2+pad, cy2+pad
+    return (cx1, cy1, cx2, cy2)
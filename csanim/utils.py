@@ -21,14 +21,14 @@
 Utilities for internal use.
 """
 
-import sys
 import os
-import shutil
-import time
 import ctypes
+import functools
+import queue
+import threading
 import numpy as np
 from numpy import ctypeslib
-from typing import Tuple
+from typing import Any, Callable, FrozenSet, Tuple
 
 PARENT = os.path.dirname(os.path.realpath(__file__))
 FONTS = os.path.join(PARENT, "fonts")
@@ -40,6 +40,21 @@ UINT = ctypes.c_uint32
 DOUB = ctypes.c_double
 
 
+def load_lib(name: str, required: bool = True) -> ctypes.CDLL:
+    """
+    Loads a Shared Object library from the package directory.
+
+    :param name: File name, e.g. ``libdraw.so``
+    :param required: If False, returns None instead of raising when the library can't be loaded.
+    """
+    try:
+        return ctypes.CDLL(os.path.join(PARENT, name))
+    except OSError:
+        if required:
+            raise
+        return None
+
+
 def empty(resolution: Tuple[int, int], dtype=np.uint8) -> np.ndarray:
     """
     Generates empty numpy array with the given dimensions.
@@ -48,7 +63,7 @@ def empty(resolution: Tuple[int, int], dtype=np.uint8) -> np.ndarray:
     :param resolution: (W, H) resolution.
     :param dtype: Data type for np array.
     """
-    return np.zeros((*resolution[::-1], 3), dtype=np.uint8)
+    return np.zeros((*resolution[::-1], 3), dtype=dtype)
 
 def getres(img: np.ndarray) -> Tuple[int, int]:
     """
@@ -59,81 +74,131 @@ def getres(img: np.ndarray) -> Tuple[int, int]:
     return img.shape[:2][::-1]
 
 
-class ProgressLogger:
-    def __init__(self, msg, total):
-        self.msg = msg
-        self.total = total
-        self.frame = 0
-        self.start = time.time()
-
-    @staticmethod
-    def _truncate(value, digits=4):
-        s = str(value)
-        parts = s.split(".")
-
-        if len(parts[0]) > digits or len(parts[0]) == digits-1:
-            return parts[0]
-        return s[:digits]
-
-    @staticmethod
-    def _fit(msg, width=None):
-        if width is None:
-            width = shutil.get_terminal_size()[0]
-
-        if len(msg) < width:
-            return msg
-        else:
-            return msg[:width-4] + "..."
-
-    def log(self):
-        frame = self.frame
-        total = self.total
-
-        elapse = time.time() - self.start
-        per_second = (frame+1) / elapse
-        percent = (frame+1) / total * 100
-        remaining = (total-frame-1) / per_second
-
-        msg = f"{self.msg} {frame+1}/{total}, {self._truncate(per_second)} fps, {self._truncate(percent)}% done, " + \
-            f"{self._truncate(elapse)}s elapsed, {self._truncate(remaining)}s remaining"
-        msg = self._fit(msg)
-        log(msg, clear=True)
-
-    def finish(self, msg):
-        elapse = time.time() - self.start
-        log(msg.replace("$TIME", str(elapse)[:4]), clear=True, new=True)
-
-    def update(self, frame):
-        self.frame = frame
-
-
-def log(msg, clear=False, new=False, flush=True):
-    if clear:
-        clearline(flush=False)
-    sys.stdout.write(msg)
-    if flush and not new:
-        sys.stdout.flush()
-    if new:
-        newline(flush=flush)
-
-def clearline(flush=True):
-    width = shutil.get_terminal_size()[0]
-    sys.stdout.write("\r")
-    sys.stdout.write(" "*width)
-    sys.stdout.write("\r")
-    if flush:
-        sys.stdout.flush()
-
-def newline(flush=True):
-    sys.stdout.write("\n")
-    if flush:
-        sys.stdout.flush()
+class FramePool:
+    """
+    Recycles frame buffers of one resolution, so rendering doesn't
+    allocate a new frame every frame.
+    Buffers are handed out dirty; ``Scene.render`` clears them in place.
+    """
 
+    def __init__(self, resolution: Tuple[int, int], size: int = 2) -> None:
+        """
+        :param resolution: (W, H) resolution.
+        :param size: Maximum number of buffers. ``acquire`` blocks when all are in use.
+        """
+        self.resolution = resolution
+        self.size = size
+        self.created = 0
+        self._free = queue.LifoQueue()
+
+    def acquire(self) -> np.ndarray:
+        """
+        Gets a buffer, allocating one if none are free and the pool isn't full.
+        """
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        if self.created < self.size:
+            self.created += 1
+            return empty(self.resolution)
+        return self._free.get()
+
+    def release(self, img: np.ndarray) -> None:
+        """
+        Returns a buffer to the pool.
+        """
+        self._free.put(img)
+
+
+class BackgroundWriter:
+    """
+    Writes frames on a background thread while the next frames render.
 
-def bounds(v: float, vmin: float = 0, vmax: float = 1):
-    return max(min(v, vmax), vmin)
+    At most ``depth`` frames wait in the queue. Frames come from a
+    ``FramePool`` and are released back to it once written, so a slow
+    writer makes ``FramePool.acquire`` block (backpressure) instead of
+    growing memory.
 
+    If ``write`` raises, the error is re-raised in the rendering thread
+    by the next ``submit`` or by ``close``.
+    """
 
-def loading():
-    while True:
-        yield from "-\\|/"
+    def __init__(self, write: Callable[[Any, np.ndarray], None], pool: FramePool, depth: int = 4) -> None:
+        """
+        :param write: Called as ``write(key, img)`` on the writer thread.
+        :param pool: Pool the submitted frames came from.
+        :param depth: Maximum number of queued frames.
+        """
+        self.write = write
+        self.pool = pool
+        self.error = None
+        self._queue = queue.Queue(depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, img = item
+            # After an error, keep draining so the renderer never blocks on the pool.
+            if self.error is None:
+                try:
+                    self.write(key, img)
+                except BaseException as e:
+                    self.error = e
+            self.pool.release(img)
+
+    def check(self) -> None:
+        """
+        Raises the writer's error, if there was one.
+        """
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, key: Any, img: np.ndarray) -> None:
+        """
+        Queues a frame for writing. Blocks if the queue is full.
+        """
+        self.check()
+        self._queue.put((key, img))
+
+    def close(self, check: bool = True) -> None:
+        """
+        Waits for queued frames to be written and stops the thread.
+
+        :param check: Whether to raise the writer's error. Pass False while
+            another exception is propagating, so it isn't replaced.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if check:
+            self.check()
+
+
+@functools.lru_cache(maxsize=None)
+def transient(cls: type) -> FrozenSet[str]:
+    """
+    Names of the runtime caches of a class's instances: the ``_transient``
+    names declared by the class and its bases. Caches aren't saved (pickle,
+    ``csanim.serialize``) or fingerprinted (``csanim.watch``).
+    """
+    return frozenset(name for base in cls.__mro__ for name in base.__dict__.get("_transient", ()))
+
+
+def getstate(obj: Any) -> dict:
+    """
+    ``__getstate__`` of objects with caches: the attributes, with the
+    transient ones set to None.
+    """
+    state = obj.__dict__.copy()
+    for name in transient(type(obj)):
+        if name in state:
+            state[name] = None
+    return state
+
+
+def bounds(v: float, vmin: float = 0, vmax: float = 1):
+    return max(min(v, vmax), vmin)
@@ -23,17 +23,38 @@ The video class.
 
 import sys
 import os
-import time
-import shutil
-import cv2
-from typing import List, Tuple
+import tempfile
+import functools
+import inspect
+import numpy as np
+from bisect import bisect_right
+from typing import AsyncIterator, Callable, Iterator, List, Sequence, Tuple, Union, TYPE_CHECKING
 from subprocess import Popen, PIPE, DEVNULL, STDOUT
+from .bake import Bake
+from .encoder import Downscaler, EncoderSet, Output, _resolution, encoder_args, find_ffmpeg
+from .progress import NullSink, ProgressSink, ProgressTracker, RenderProgress, TerminalSink
+from .rawstore import RawStore
 from .scene import Scene
-from .utils import ProgressLogger, loading
+from .utils import BackgroundWriter, FramePool, empty
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
 
-FFMPEG = shutil.which("ffmpeg")
-if "CSANIM_IGNORE_FFMPEG" not in os.environ:
-    assert FFMPEG is not None and os.path.isfile(FFMPEG), "FFmpeg not found."
+
+def _render_into(scene: Scene, resolution: Tuple[int, int], frame: int, fps: int,
+        buf: np.ndarray) -> np.ndarray:
+    """
+    Internal function.
+    Renders into ``buf`` if the scene's ``render`` accepts a buffer.
+    Inherited scenes written before buffers existed get called the old way.
+    """
+    if _accepts_buffer(type(scene)):
+        return scene.render(resolution, frame, fps, img=buf)
+    return scene.render(resolution, frame, fps)
+
+
+@functools.lru_cache(maxsize=None)
+def _accepts_buffer(cls: type) -> bool:
+    return "img" in inspect.signature(cls.render).parameters
 
 
 class Video:
@@ -45,6 +66,9 @@ class Video:
     resolution: Tuple[int, int]
     scenes: List[Scene]
 
+    # Runtime caches, see ``utils.transient``.
+    _transient = ("_offsets",)
+
     def __init__(self, fps: int, resolution: Tuple[int, int]) -> None:
         """
         Initializes video.
@@ -55,6 +79,7 @@ class Video:
         self.fps = fps
         self.resolution = resolution
         self.scenes = []
+        self._offsets = None
 
     def add_scene(self, scene: Scene) -> None:
         """
@@ -62,56 +87,332 @@ class Video:
         Scenes play in the order they are added.
         """
         self.scenes.append(scene)
+        self._offsets = None
+
+    def bake(self, shared: bool = False) -> List[Bake]:
+        """
+        Bakes every scene at the video's fps. See ``Scene.bake``.
+
+        :param shared: Whether to put the values in shared memory, for worker processes.
+        """
+        return [scene.bake(self.fps, shared) for scene in self.scenes]
+
+    def reindex(self) -> None:
+        """
+        Rebuilds the frame index used by ``frame_at``.
+        Call this if a scene's length changes after it was added
+        (e.g. more ``SceneCode.typewrite`` calls).
+        """
+        offsets = [0]
+        for scene in self.scenes:
+            offsets.append(offsets[-1] + int(scene.length*self.fps))
+        self._offsets = offsets
+
+    @property
+    def total_frames(self) -> int:
+        """
+        Total number of frames in the video.
+        """
+        if self._offsets is None:
+            self.reindex()
+        return self._offsets[-1]
+
+    def locate(self, frame: int) -> Tuple[int, int]:
+        """
+        Maps a global frame to ``(scene index, local frame)``.
+        Uses a binary search over the prefix sums of scene lengths.
+
+        :param frame: Global frame, counted from the start of the video.
+        """
+        total = self.total_frames
+        if not 0 <= frame < total:
+            raise IndexError(f"Frame {frame} out of range for video with {total} frames.")
+        ind = bisect_right(self._offsets, frame) - 1
+        return ind, frame - self._offsets[ind]
+
+    def frame_at(self, frame: int = None, time: float = None) -> np.ndarray:
+        """
+        Renders a single frame without rendering anything before it.
+        Pass exactly one of ``frame`` or ``time``.
+
+        :param frame: Global frame.
+        :param time: Time in seconds from the start of the video.
+        """
+        if (frame is None) == (time is None):
+            raise ValueError("Pass exactly one of frame or time.")
+        if frame is None:
+            frame = int(time*self.fps)
+
+        ind, local = self.locate(frame)
+        return self.scenes[ind].render(self.resolution, local, self.fps)
+
+    def frames_at(self, frames: Sequence[int], workers: int = None) -> List[np.ndarray]:
+        """
+        Renders several global frames, in parallel.
+        Images are returned in the same order as ``frames``.
+
+        :param frames: Global frames.
+        :param workers: Number of threads. Defaults to ``os.cpu_count()``.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.reindex()
+        with ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(lambda f: self.frame_at(frame=f), frames))
+
+    def contact_sheet(self, count: int, columns: int = 4, thumb_width: int = 320,
+            workers: int = None) -> np.ndarray:
+        """
+        Renders a grid of ``count`` thumbnails sampled evenly across the video.
+        Useful for reviewing a video without rendering all of it.
+        Raises ``ValueError`` if the video has no frames.
+
+        :param count: Number of thumbnails.
+        :param columns: Thumbnails per row.
+        :param thumb_width: Width of each thumbnail. Height keeps the aspect ratio.
+        :param workers: Number of threads. Defaults to ``os.cpu_count()``.
+        """
+        import cv2
+
+        total = self.total_frames
+        if total == 0:
+            raise ValueError("Can't make a contact sheet of a video with no frames.")
+        if count < 1:
+            raise ValueError(f"Contact sheet needs at least one thumbnail, got {count}.")
+        frames = [int(i*total/count) for i in range(count)]
+        imgs = self.frames_at(frames, workers)
 
-    def render(self, path: str, vencode: str = "libx265") -> None:
+        thumb_res = (thumb_width, max(int(thumb_width*self.resolution[1]/self.resolution[0]), 1))
+        rows = (count+columns-1) // columns
+        sheet = empty((thumb_res[0]*columns, thumb_res[1]*rows))
+        for i, img in enumerate(imgs):
+            x = (i % columns) * thumb_res[0]
+            y = (i // columns) * thumb_res[1]
+            sheet[y:y+thumb_res[1], x:x+thumb_res[0]] = cv2.resize(img, thumb_res, interpolation=cv2.INTER_AREA)
+        return sheet
+
+    def iter_frames(self, start: int = 0, end: int = None) -> Iterator[Tuple[int, Scene, int]]:
+        """
+        Yields ``(global frame, scene, local frame)`` for global frames ``[start, end)``.
+
+        :param start: First global frame.
+        :param end: Global frame to stop before. Defaults to the end of the video.
+        """
+        total = self.total_frames
+        end = total if end is None else min(end, total)
+        if start >= end:
+            return
+
+        ind, local = self.locate(start)
+        for frame in range(start, end):
+            while local >= self._offsets[ind+1] - self._offsets[ind]:
+                ind += 1
+                local = 0
+            yield frame, self.scenes[ind], local
+            local += 1
+
+    def render_frames(self, write: Callable[[int, np.ndarray], None], start: int = 0, end: int = None,
+            queue_depth: int = 4, progress: Callable[[int], None] = None) -> None:
+        """
+        Renders global frames ``[start, end)`` and calls ``write(frame, img)`` for
+        each one, in order, on a background thread. ``img`` is a recycled buffer;
+        copy it to keep it after ``write`` returns.
+
+        :param write: Called with each rendered frame. Errors are re-raised here.
+        :param start: First global frame.
+        :param end: Global frame to stop before. Defaults to the end of the video.
+        :param queue_depth: Maximum number of rendered frames waiting to be written.
+        :param progress: Called with the global frame before it is rendered.
+        """
+        self.reindex()
+        pool = FramePool(self.resolution, queue_depth+1)
+        writer = BackgroundWriter(write, pool, queue_depth)
+        done = False
+        try:
+            for frame, scene, local in self.iter_frames(start, end):
+                if progress is not None:
+                    progress(frame)
+
+                buf = pool.acquire()
+                img = _render_into(scene, self.resolution, local, self.fps, buf)
+                if img is not buf:
+                    buf[:] = img
+                writer.submit(frame, buf)
+            done = True
+        finally:
+            writer.close(check=done)
+
+    def render(self, path: Union[str, Sequence[Output]], vencode: str = "libx265", queue_depth: int = 4,
+            raw_path: str = None, progress: ProgressSink = None) -> None:
         """
         Exports video to a video file.
         Will first render separate images to a tmp folder in the same directory.
         Requires FFmpeg to put images into video.
 
-        :param path: Output video file path.
+        Images are written on a background thread while the next frames render.
+
+        If ``path`` is a list of ``csanim.Output``, or ``raw_path`` is given, frames
+        are instead streamed straight into FFmpeg. Each frame is rendered once at
+        the video's resolution and downscaled once per output resolution, so
+        e.g. a 1080p/720p/360p ladder costs one render.
+
+        :param path: Output video file path, or list of outputs.
         :param vencode: Video encoding. H.265 may not be supported, so you can try libx264
+            Ignored if ``path`` is a list of outputs.
+        :param queue_depth: Maximum number of rendered frames waiting to be written.
+            Bounds memory use to ``queue_depth+1`` frames.
+        :param raw_path: If given, frames are also stored losslessly in a raw frame store
+            at this path. The store is kept, and can be re-encoded with
+            ``python -m csanim encode`` without re-rendering.
+        :param progress: Where to report progress, see ``csanim.progress``.
+            Defaults to a ``TerminalSink``.
         """
-        if os.path.isfile(path) and input(f"Path {path} exists. Overwrite? [y/N] ").strip().lower() != "y":
-            return
+        outputs = [Output(path, vencode)] if isinstance(path, str) else list(path)
+        for output in outputs:
+            if os.path.isfile(output.path) and \
+                    input(f"Path {output.path} exists. Overwrite? [y/N] ").strip().lower() != "y":
+                return
 
-        dir_path = path + "_imgs"
-        os.makedirs(dir_path, exist_ok=True)
+        self.reindex()
+        total = self.total_frames
 
-        frame = 0
-        total = sum([int(s.length*self.fps) for s in self.scenes])
-        logger = ProgressLogger("Rendering", total)
-        for scene in self.scenes:
-            for f in range(int(scene.length*self.fps)):
-                logger.update(frame)
-                logger.log()
+        stream = not isinstance(path, str) or raw_path is not None
+        if stream:
+            store = None
+            if raw_path is not None:
+                store = RawStore.create(raw_path, self.resolution, self.fps, self._offsets)
+            encoders = EncoderSet(outputs, self.resolution, self.fps)
+
+            def write(frame, img):
+                if store is not None:
+                    store[frame] = img
+                encoders.write(img)
+        else:
+            import cv2
 
-                img = scene.render(self.resolution, f, self.fps)
+            # Look for FFmpeg before spending time rendering.
+            ffmpeg = find_ffmpeg()
+            dir_path = path + "_imgs"
+            os.makedirs(dir_path, exist_ok=True)
+
+            def write(frame, img):
                 fpath = os.path.join(dir_path, f"{frame}.jpg")
-                cv2.imwrite(fpath, img)
-                frame += 1
-        logger.finish(f"Finished rendering {total} in $TIME")
+                if not cv2.imwrite(fpath, img):
+                    raise OSError(f"Could not write {fpath}")
+
+        tracker = ProgressTracker(progress, "Rendering", total, self._offsets)
+        done = False
+        try:
+            self.render_frames(write, queue_depth=queue_depth, progress=tracker.update)
+            done = True
+        finally:
+            if stream:
+                # Don't hide the original error behind the broken pipe it caused.
+                encoders.close(check=done)
+                if store is not None:
+                    store.flush()
+        tracker.update(total)
+        tracker.finish()
 
-        args = [FFMPEG, "-y", "-i", os.path.join(dir_path, "%d.jpg"), "-vframes", str(total-1),
+        if stream:
+            tracker.log(f"Finished exporting {total} frames.")
+            return
+
+        tracker.log("Compiling images to video...")
+        args = [ffmpeg, "-y", "-i", os.path.join(dir_path, "%d.jpg"), "-vframes", str(total-1),
             "-c:v", vencode, "-r", str(self.fps), path]
         proc = Popen(args, stdin=DEVNULL, stdout=PIPE, stderr=STDOUT)
+        out, _ = proc.communicate()
 
-        chars = loading()
-        while proc.poll() is None:
-            sys.stdout.write("\r"+" "*80+"\r")
-            sys.stdout.write(f"Compiling images to video...{next(chars)}")
-            sys.stdout.flush()
-            time.sleep(0.1)
-
-        sys.stdout.write("\r"+" "*80+"\r")
         if proc.returncode == 0:
-            print(f"Finished exporting {total} frames.")
+            tracker.log(f"Finished exporting {total} frames.")
         else:
-            print(f"Video compilation failed. Rendered images are in {dir_path}.")
-            if not input("Show FFmpeg output? [Y/n] ").lower().strip() == "n":
-                while True:
-                    data = proc.stdout.read(8192)
-                    sys.stdout.buffer.write(data)
-                    if len(data) < 8192:
-                        break
+            tracker.log(f"Video compilation failed. Rendered images are in {dir_path}.")
+            if not (sys.stdin.isatty() and isinstance(tracker.sink, TerminalSink)):
+                tracker.log(out.decode(errors="replace"))
+            elif not input("Show FFmpeg output? [Y/n] ").lower().strip() == "n":
+                sys.stdout.buffer.write(out)
                 sys.stdout.buffer.flush()
+
+    async def render_async(self, path: Union[str, Sequence[Output]], vencode: str = "libx265",
+            overwrite: bool = False, executor: "Executor" = None,
+            progress: ProgressSink = None) -> AsyncIterator[RenderProgress]:
+        """
+        Exports video without blocking the event loop.
+        An async generator that yields a ``csanim.progress.RenderProgress`` after
+        each frame, and a last one with ``done`` set once encoding finishes::
+
+            async for progress in video.render_async("video.mp4"):
+                print(progress.frame, progress.total)
+
+        Frames are rendered in ``executor`` and streamed into FFmpeg, which runs as an
+        asyncio subprocess. Never prompts. Cancelling the task (or closing the
+        generator, e.g. with ``contextlib.aclosing``) kills FFmpeg.
+
+        :param path: Output video file path, or list of outputs (see ``render``).
+        :param vencode: Video encoding. Ignored if ``path`` is a list of outputs.
+        :param overwrite: Whether to overwrite existing files. If False, raises ``FileExistsError``.
+        :param executor: Thread pool to render frames in. Pass the same
+            ``concurrent.futures.ThreadPoolExecutor`` to several renders to bound
+            the threads they use together. Defaults to the event loop's default executor.
+        :param progress: Also report progress here. Defaults to a ``NullSink``.
+        """
+        import asyncio
+
+        outputs = [Output(path, vencode)] if isinstance(path, str) else list(path)
+        if not overwrite:
+            for output in outputs:
+                if os.path.exists(output.path):
+                    raise FileExistsError(f"Path {output.path} exists.")
+
+        loop = asyncio.get_running_loop()
+        self.reindex()
+        total = self.total_frames
+        scaler = Downscaler({_resolution(output, self.resolution) for output in outputs}, self.resolution)
+        buf = empty(self.resolution)
+
+        def render(scene, local):
+            img = _render_into(scene, self.resolution, local, self.fps, buf)
+            scaled = scaler.scale(img)
+            # Copies, since the pipe may hold on to the data after the buffers are reused.
+            return [scaled[_resolution(output, self.resolution)].tobytes() for output in outputs]
+
+        procs = []
+        done = False
+        try:
+            for output in outputs:
+                log = tempfile.TemporaryFile()
+                procs.append((await asyncio.create_subprocess_exec(*encoder_args(output, self.resolution, self.fps),
+                    stdin=PIPE, stdout=DEVNULL, stderr=log), log, output.path))
+
+            tracker = ProgressTracker(NullSink() if progress is None else progress, "Rendering",
+                total, self._offsets)
+            for frame, scene, local in self.iter_frames():
+                data = await loop.run_in_executor(executor, render, scene, local)
+                try:
+                    for (proc, log, out_path), frame_data in zip(procs, data):
+                        proc.stdin.write(frame_data)
+                    for proc, log, out_path in procs:
+                        await proc.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    # An encoder exited. Reported with FFmpeg's output below.
+                    break
+                tracker.update(frame+1)
+                yield tracker.progress()
+
+            for proc, log, out_path in procs:
+                proc.stdin.close()
+            for proc, log, out_path in procs:
+                await proc.wait()
+                if proc.returncode != 0:
+                    log.seek(0)
+                    raise RuntimeError(f"Encoding {out_path} failed:\n" + log.read().decode(errors="replace"))
+            done = True
+            yield tracker.finish()
+
+        finally:
+            for proc, log, out_path in procs:
+                if not done and proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                log.close()
@@ -0,0 +1,331 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Watch mode: re-render a video script whenever it changes.
+
+Each scene is fingerprinted from its definition: its class, elements,
+props, keyframes and effects, and the code of classes the script defines.
+Every scene is encoded into its own segment, named by its fingerprint,
+in a cache directory next to the output. After an edit, only scenes with
+a new fingerprint are rendered, and the preview is rebuilt by joining
+the segments with FFmpeg, without re-encoding. Editing one scene costs
+about as much as rendering that scene.
+
+Run with ``python -m csanim watch script.py preview.mp4``.
+"""
+
+__all__ = (
+    "fingerprint",
+    "render_changed",
+    "watch",
+)
+
+import os
+import re
+import time
+import types
+import hashlib
+import traceback
+import numpy as np
+from typing import Any, List, Tuple
+from .encoder import EncoderSet, Output, concat, find_ffmpeg
+from .progress import ProgressSink, ProgressTracker, TerminalSink
+from .props import Property
+from .scene import Scene
+from .utils import transient
+from .video import Video
+
+
+# Module names a video script runs as: by ``load_video``, or run directly.
+SCRIPT_MODULES = ("__csanim__", "__main__")
+
+
+class _Hasher:
+    """
+    Internal class.
+    Feeds a canonical description of an object graph into a hash.
+    """
+
+    def __init__(self) -> None:
+        self.hash = hashlib.sha256()
+        self.seen = {}
+        # Objects being hashed must stay alive, so their ids aren't reused.
+        self.alive = []
+
+    def write(self, *parts: Any) -> None:
+        self.hash.update(repr(parts).encode())
+
+    def add(self, value: Any) -> None:
+        if value is None or isinstance(value, (bool, int, float, complex, bytes)):
+            self.write(value)
+        elif isinstance(value, str):
+            self.write(value)
+            # Files the scene reads, e.g. an image's source.
+            if 0 < len(value) < 4096 and os.path.isfile(value):
+                stat = os.stat(value)
+                self.write(stat.st_mtime_ns, stat.st_size)
+        elif isinstance(value, np.generic):
+            self.write(value.item())
+        elif isinstance(value, np.ndarray):
+            self.write("ndarray", value.dtype.str, value.shape)
+            self.hash.update(np.ascontiguousarray(value).data)
+        elif isinstance(value, (list, tuple)):
+            self.write(type(value).__name__, len(value))
+            for item in value:
+                self.add(item)
+        elif isinstance(value, type):
+            self.add_class(value)
+        elif isinstance(value, types.ModuleType):
+            self.write("module", value.__name__)
+        elif id(value) in self.seen:
+            self.write("ref", self.seen[id(value)])
+        else:
+            self.seen[id(value)] = len(self.seen)
+            self.alive.append(value)
+            self.add_object(value)
+
+    def add_object(self, obj: Any) -> None:
+        if isinstance(obj, dict):
+            self.write("dict", len(obj))
+            for key, value in obj.items():
+                self.add(key)
+                self.add(value)
+        elif isinstance(obj, (set, frozenset)):
+            self.write(type(obj).__name__, sorted(map(repr, obj)))
+        elif isinstance(obj, Property):
+            self.add_class(type(obj))
+            self.add(obj.default)
+            self.write(len(obj.keyframes))
+            for key in obj.keyframes:
+                self.add(key.frame)
+                self.add(key.value)
+                self.add(key.interp)
+            # Other attributes, e.g. a driver's function and inputs.
+            skip = transient(type(obj))
+            for name, value in vars(obj).items():
+                if name not in ("default", "_keyframes", "_track") and name not in skip:
+                    self.write(name)
+                    self.add(value)
+        elif isinstance(obj, (types.FunctionType, types.MethodType)):
+            self.add_function(obj)
+        elif hasattr(obj, "__dict__") or hasattr(type(obj), "__slots__"):
+            self.add_class(type(obj))
+            attrs = dict(vars(obj)) if hasattr(obj, "__dict__") else {}
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(obj, name):
+                        attrs[name] = getattr(obj, name)
+            skip = transient(type(obj))
+            for name, value in attrs.items():
+                if name not in skip:
+                    self.write(name)
+                    self.add(value)
+        else:
+            # Unknown objects never match, so their scenes are always rendered.
+            self.write("opaque", type(obj).__qualname__, id(obj))
+
+    def add_class(self, cls: type) -> None:
+        self.write("class", cls.__module__, cls.__qualname__)
+        if id(cls) in self.seen:
+            return
+        self.seen[id(cls)] = len(self.seen)
+        # The library and Python don't change while watching, but the script's classes do.
+        for base in cls.__mro__:
+            if base.__module__ in ("builtins", "typing") or base.__module__.split(".")[0] == "csanim":
+                continue
+            for name, attr in vars(base).items():
+                if isinstance(attr, (staticmethod, classmethod)):
+                    attr = attr.__func__
+                if isinstance(attr, property):
+                    attr = attr.fget
+                if isinstance(attr, types.FunctionType):
+                    self.write(name)
+                    self.add_function(attr)
+
+    def add_function(self, func: Any) -> None:
+        if isinstance(func, types.MethodType):
+            self.add(func.__self__)
+            func = func.__func__
+        if not isinstance(func, types.FunctionType):
+            self.write("callable", getattr(func, "__module__", None), getattr(func, "__qualname__", repr(func)))
+            return
+        self.add_code(func.__code__)
+        if func.__globals__.get("__name__") in SCRIPT_MODULES:
+            self.add_globals(func.__code__, func.__globals__)
+        self.add(func.__defaults__)
+        for cell in func.__closure__ or ():
+            try:
+                self.add(cell.cell_contents)
+            except ValueError:
+                self.write("empty cell")
+
+    def add_code(self, code: types.CodeType) -> None:
+        # Not line numbers, so editing one scene doesn't change the code below it.
+        self.write("code", code.co_names, code.co_varnames)
+        self.hash.update(code.co_code)
+        for const in code.co_consts:
+            self.add_const(const)
+
+    def add_globals(self, code: types.CodeType, scope: dict) -> None:
+        """
+        Values of the script's globals the code uses, e.g. a helper function,
+        a class or a constant. Names that aren't globals (attributes) are skipped.
+        """
+        names = set()
+        codes = [code]
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+        for name in sorted(names):
+            if name in scope:
+                self.write("global", name)
+                self.add(scope[name])
+
+    def add_const(self, const: Any) -> None:
+        if isinstance(const, types.CodeType):
+            self.add_code(const)
+        elif isinstance(const, (tuple, frozenset)):
+            # Sets are ordered by hashes, which change between runs.
+            items = sorted(const, key=repr) if isinstance(const, frozenset) else const
+            self.write(type(const).__name__, len(const))
+            for item in items:
+                self.add_const(item)
+        else:
+            self.write(const)
+
+
+def fingerprint(scene: Scene, fps: float, resolution: Tuple[int, int]) -> str:
+    """
+    Hex digest that changes when anything the scene renders from changes:
+    the attributes of the scene and its elements (recursively), props and
+    keyframes, the code of classes and functions defined outside csanim,
+    the script's globals that code uses, and the modification time of
+    files named by string attributes.
+    Runtime caches are ignored.
+
+    :param scene: The scene.
+    :param fps: Frames per second it is rendered at.
+    :param resolution: (X, Y) resolution it is rendered at.
+    """
+    hasher = _Hasher()
+    hasher.write(fps, tuple(resolution))
+    hasher.add(scene)
+    return hasher.hash.hexdigest()
+
+
+def render_changed(video: Video, path: str, vencode: str = "libx264", cache_dir: str = None,
+        progress: ProgressSink = None) -> List[int]:
+    """
+    Renders the scenes whose fingerprint has no cached segment, and joins
+    all segments into ``path``. Segments of scenes that no longer exist are
+    deleted; other files in ``cache_dir`` are left alone. Returns the
+    indices of the rendered scenes.
+
+    :param video: The video.
+    :param path: Output video file path. Overwritten.
+    :param vencode: Video encoding of every segment.
+    :param cache_dir: Where to keep segments. Defaults to ``path + "_watch"``.
+    :param progress: Where to report progress. Defaults to a ``TerminalSink``.
+    """
+    # Look for FFmpeg before fingerprinting or rendering anything.
+    find_ffmpeg()
+    cache_dir = path + "_watch" if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    ext = os.path.splitext(path)[1]
+
+    video.reindex()
+    offsets = video._offsets
+    segments = []
+    changed = []
+    for i, scene in enumerate(video.scenes):
+        if offsets[i+1] == offsets[i]:
+            continue
+        segment = os.path.join(cache_dir, f"{fingerprint(scene, video.fps, video.resolution)}_{vencode}{ext}")
+        if not os.path.isfile(segment) and segment not in segments:
+            changed.append((i, segment))
+        segments.append(segment)
+
+    # Progress counts only the frames being rendered.
+    render_offsets = [0]
+    for i, segment in changed:
+        render_offsets.append(render_offsets[-1] + offsets[i+1]-offsets[i])
+    tracker = ProgressTracker(progress, "Rendering", render_offsets[-1], render_offsets)
+    for (i, segment), done in zip(changed, render_offsets):
+        # Written under another name first, so an interrupted render isn't reused.
+        partial = segment + ".partial" + ext
+        encoders = EncoderSet([Output(partial, vencode)], video.resolution, video.fps)
+        ok = False
+        try:
+            video.render_frames(lambda frame, img: encoders.write(img), offsets[i], offsets[i+1],
+                progress=lambda frame: tracker.update(done+frame-offsets[i]))
+            ok = True
+        finally:
+            encoders.close(check=ok)
+        os.replace(partial, segment)
+    tracker.update(render_offsets[-1])
+    tracker.finish()
+
+    if segments:
+        concat(segments, path)
+    # Only segments (and interrupted renders) of this encoding are deleted, the
+    # cache directory may hold other files.
+    used = {os.path.basename(segment) for segment in segments}
+    pattern = re.compile(f"[0-9a-f]{{64}}_{re.escape(vencode)}{re.escape(ext)}(\\.partial{re.escape(ext)})?")
+    for name in os.listdir(cache_dir):
+        file = os.path.join(cache_dir, name)
+        if name not in used and pattern.fullmatch(name) and os.path.isfile(file):
+            os.remove(file)
+
+    tracker.log(f"Rendered {len(changed)} of {len(segments)} scenes into {path}.")
+    return [i for i, segment in changed]
+
+
+def watch(script: str, path: str, name: str = None, vencode: str = "libx264", interval: float = 0.5,
+        progress: ProgressSink = None) -> None:
+    """
+    Renders a video script into ``path`` with ``render_changed``, then again
+    every time the script is saved, until interrupted. Errors in the script
+    are printed, and watching continues.
+
+    :param script: Path to the script that builds the video (see ``csanim.distributed.load_video``).
+    :param path: Preview video file path.
+    :param name: Name of the video variable in the script.
+    :param vencode: Video encoding.
+    :param interval: Seconds between checks for changes.
+    :param progress: Where to report progress. Defaults to a ``TerminalSink``.
+    """
+    from .distributed import load_video
+
+    sink = TerminalSink() if progress is None else progress
+    mtime = None
+    try:
+        while True:
+            new_mtime = os.stat(script).st_mtime_ns
+            if new_mtime != mtime:
+                mtime = new_mtime
+                try:
+                    render_changed(load_video(script, name), path, vencode, progress=sink)
+                except Exception:
+                    sink.log(traceback.format_exc())
+                sink.log(f"Watching {script} for changes.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,132 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Checks ``csanim.batch.render_batch`` against rendering each variant on its
+own. Needs FFmpeg. Run from the repository root after building the libraries:
+
+    make
+    python3 ./tests/batch.py
+
+Exits with 1 if a check fails.
+"""
+
+import sys
+import os
+import copy
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import cv2
+import numpy as np
+import csanim
+from csanim.batch import Variant, render_batch
+from csanim.constants import *
+from csanim.effects import Shadow
+from csanim.progress import NullSink
+from csanim.props import FloatProp, VectorProp
+
+RED = "\x1b[31m"
+GREEN = "\x1b[32m"
+RESET = "\x1b[39m"
+
+
+def template():
+    """
+    One scene with a background and a translucent group with a shadow,
+    so the group is drawn from a cached layer.
+    """
+    video = csanim.Video(10, (160, 120))
+    scene = csanim.Scene(1)
+    scene.add_element(csanim.Fill((40, 20, 10, 255)))
+    # At the top left, so a layer drawn for the template's offset would cut it off.
+    rect = csanim.Rect((255, 255, 255, 255), (0, 0), (40, 30))
+    rect.loc.key(0, (0, 0), I_LIN)
+    rect.loc.key(9, (10, 20))
+    group = csanim.Group([rect], alpha=200, offset=(-10, 0))
+    group.add_effect(Shadow())
+    scene.add_element(group)
+    video.add_scene(scene)
+    return video, group
+
+
+def decode(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    return frames
+
+
+def expected(overrides):
+    """
+    Frames of the template rendered on its own with the group's offset replaced.
+    """
+    video, group = template()
+    if overrides is not None:
+        group.offset = copy.deepcopy(overrides)
+    return [video.frame_at(frame=f)[..., :3] for f in range(video.total_frames)]
+
+
+def test_group_offset():
+    moving = VectorProp(FloatProp, 2, (0, 0))
+    moving.key(0, (-40, -20), I_LIN)
+    moving.key(9, (80, 50))
+    cases = (
+        ("template offset", None),
+        ("constant offset", VectorProp(FloatProp, 2, (60, 60))),
+        ("animated offset", moving),
+        ("template offset again", None),
+    )
+
+    video, group = template()
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [Variant(os.path.join(tmp, f"variant{i}.mkv"), {} if offset is None else {(group, "offset"): offset})
+            for i, (name, offset) in enumerate(cases)]
+        # One worker renders the variants one after another from the same template,
+        # so caches left by a variant would show in the next.
+        render_batch(video, variants, vencode="ffv1", workers=1, tmp_dir=tmp, progress=NullSink())
+
+        exitcode = 0
+        for variant, (name, offset) in zip(variants, cases):
+            frames, reference = decode(variant.path), expected(offset)
+            msg = "OK"
+            if len(frames) != len(reference):
+                msg = f"{len(frames)} frames, expected {len(reference)}"
+            else:
+                diffs = [f for f, (a, b) in enumerate(zip(frames, reference)) if not np.array_equal(a, b)]
+                if diffs:
+                    msg = f"frames {diffs[:5]} differ"
+            sys.stdout.write(GREEN if msg == "OK" else RED)
+            print(name, msg, end=RESET+"\n")
+            exitcode = max(exitcode, 0 if msg == "OK" else 1)
+    return exitcode
+
+
+def main():
+    exitcode = 0
+    exitcode = max(exitcode, test_group_offset())
+    return exitcode
+
+
+exit(main())
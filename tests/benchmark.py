@@ -0,0 +1,109 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Micro benchmarks. Run from the repository root after building the libraries:
+
+    make cpp native
+    python3 ./tests/benchmark.py
+
+Exits with 1 if a budget is exceeded.
+"""
+
+import sys
+import os
+import time
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import numpy as np
+import csanim
+from csanim.lib import draw, interp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# Seconds ``import csanim`` may take on top of interpreter startup (numpy included).
+IMPORT_BUDGET = 0.3
+
+
+def timeit(func, calls):
+    """
+    Returns seconds per call.
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter()-start) / calls
+
+
+def report(name, seconds):
+    print(f"{name:<40} {seconds*1e6:10.3f} us")
+
+
+def bench_native():
+    print("Per call cost, ctypes vs extension module:")
+    if draw.native is None or draw.lib is None:
+        print("  skipped: needs both libdraw.so/libinterp.so and the _native extension")
+        return
+
+    calls = 100000
+    report("  interp.linear ctypes", timeit(lambda: interp.lib.linear(0, 10, 0, 1, 5), calls))
+    report("  interp.linear native", timeit(lambda: interp.native.linear(0, 10, 0, 1, 5), calls))
+
+    img = csanim.empty((64, 64))
+    args = (img, 64, 64, 32, 32, 2, 0, 255, 255, 255, 255)
+    report("  draw.circle (r=2) ctypes", timeit(lambda: draw.lib.circle(*args), calls))
+    report("  draw.circle (r=2) native", timeit(lambda: draw.native.circle(*args), calls))
+
+    prop = csanim.props.FloatProp(0)
+    prop.key(0, 0)
+    prop.key(100, 1, csanim.I_LIN)
+    report("  FloatProp.value (linear)", timeit(lambda: prop.value(50), calls))
+
+
+def bench_import():
+    print("Import time (fresh interpreter, best of 5):")
+
+    def run(code):
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, stdin=subprocess.DEVNULL)
+            times.append(time.perf_counter()-start)
+        return min(times)
+
+    startup = run("pass")
+    elapse = run("import csanim") - startup
+    heavy = subprocess.run([sys.executable, "-c", "import sys, csanim; print(*sorted({'cv2', 'PIL'} & set(sys.modules)))"],
+        cwd=ROOT, check=True, stdin=subprocess.DEVNULL, capture_output=True).stdout.decode().strip()
+
+    print(f"{'  import csanim':<40} {elapse*1e3:10.3f} ms")
+    print(f"  budget {IMPORT_BUDGET*1e3:.0f} ms: " + ("OK" if elapse <= IMPORT_BUDGET else "EXCEEDED"))
+    print("  lazy dependencies imported: " + (heavy if heavy else "none"))
+    return 0 if elapse <= IMPORT_BUDGET and not heavy else 1
+
+
+def main():
+    exitcode = 0
+    bench_native()
+    exitcode = max(exitcode, bench_import())
+    return exitcode
+
+
+exit(main())
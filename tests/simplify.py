@@ -0,0 +1,150 @@
+#
+#  CS Animation
+#  A tool for creating computer science explanatory videos.
+#  Copyright Patrick Huang 2021
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Checks ``Property.simplify``. Run from the repository root after building
+the libraries:
+
+    make
+    python3 ./tests/simplify.py
+
+Exits with 1 if a check fails.
+"""
+
+import sys
+import os
+import copy
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import numpy as np
+from csanim.constants import *
+from csanim.props import BoolProp, IntProp, FloatProp, StrProp
+
+RED = "\x1b[31m"
+GREEN = "\x1b[32m"
+RESET = "\x1b[39m"
+
+
+def make(cls, default, keys):
+    prop = cls(default)
+    for key in keys:
+        prop.key(*key)
+    return prop
+
+
+def differences(prop, simplified, tolerance=0):
+    """
+    Frames (integer, keyframe, and outside the keyframes) where the simplified
+    prop's value differs from the original's.
+    """
+    key_frames = [k.frame for k in prop.keyframes]
+    if not key_frames:
+        return []
+    frames = sorted(set(range(int(min(key_frames))-2, int(max(key_frames))+3)) | set(key_frames))
+    diffs = []
+    for frame in frames:
+        value, new = prop.value(frame), simplified.value(frame)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if abs(new-value) > tolerance + 1e-9*abs(value):
+                diffs.append(frame)
+        elif new != value:
+            diffs.append(frame)
+    return diffs
+
+
+def check(name, prop, tolerance=0, keep=None):
+    """
+    Simplifies a copy of prop. Fails if a value changes by more than
+    tolerance, or if the kept keyframes (frame, value) aren't ``keep``.
+    """
+    simplified = copy.deepcopy(prop)
+    simplified.simplify(tolerance)
+    kept = [(k.frame, k.value) for k in simplified.keyframes]
+    diffs = differences(prop, simplified, tolerance)
+
+    msg = "OK"
+    if diffs:
+        msg = f"values changed at frames {diffs[:5]}"
+    elif keep is not None and kept != keep:
+        msg = f"kept {kept}, expected {keep}"
+    sys.stdout.write(GREEN if msg == "OK" else RED)
+    print(name, msg, end=RESET+"\n")
+    return 0 if msg == "OK" else 1
+
+
+def test_cases():
+    cases = (
+        ("repeated values", make(FloatProp, 0, [(f, 3, I_SINE) for f in range(0, 50, 5)]), 0,
+            [(45, 3)]),
+        ("collinear", make(FloatProp, 0, [(f, f/10, I_LIN) for f in range(0, 100, 10)]), 0,
+            [(0, 0), (90, 9)]),
+        ("only keyframe equals default", make(FloatProp, 2, [(5, 2)]), 0, []),
+        ("only keyframe", make(FloatProp, 0, [(5, 2)]), 0, [(5, 2)]),
+        ("jump after held value", make(FloatProp, 0, [(0, 1, I_CONST), (10, 1), (10, 5)]), 0,
+            [(0, 1), (10, 1), (10, 5)]),
+        ("jump before held value", make(FloatProp, 0, [(0, 1, I_LIN), (10, 1), (10, 5), (20, 5)]), 0,
+            [(0, 1), (10, 1), (10, 5)]),
+        ("jump at one frame", make(IntProp, 0, [(10, 1), (10, 5)]), 0, [(10, 1), (10, 5)]),
+        ("strings", make(StrProp, "", [(0, "a"), (0.1, "a"), (0.2, "b"), (0.3, "b")]), 0,
+            [(0.1, "a"), (0.2, "b")]),
+        ("booleans", make(BoolProp, False, [(0, False), (5, True), (6, True), (9, False)]), 0,
+            [(0, False), (5, True), (9, False)]),
+        ("tolerance", make(FloatProp, 0, [(f, 100*np.sin(f/30), I_LIN) for f in range(200)]), 0.5, None),
+    )
+    exitcode = 0
+    for name, prop, tolerance, keep in cases:
+        exitcode = max(exitcode, check(name, prop, tolerance, keep))
+    return exitcode
+
+
+def test_random():
+    # Random props with repeated values, jumps and non integer frames.
+    rng = random.Random(0)
+    types = ((FloatProp, 0.0, (0, 1, 1, 2)), (IntProp, 0, (0, 1, 1, 2)),
+        (StrProp, "", ("a", "a", "b")), (BoolProp, False, (False, True)))
+    failed = 0
+    for _ in range(1000):
+        cls, default, values = rng.choice(types)
+        interps = cls.supported_interps if cls.supported_interps != "ALL" else (I_CONST, I_LIN, I_SINE)
+        keys, frame = [], 0
+        for _ in range(rng.randint(1, 12)):
+            frame += rng.choice((0, 0, 1, 2, 5, 0.5))
+            keys.append((frame, rng.choice(values), rng.choice(interps)))
+        prop = make(cls, default, keys)
+        simplified = copy.deepcopy(prop)
+        simplified.simplify()
+        if differences(prop, simplified):
+            failed += 1
+
+    msg = "OK" if failed == 0 else f"{failed} props changed"
+    sys.stdout.write(GREEN if failed == 0 else RED)
+    print("random props", msg, end=RESET+"\n")
+    return 0 if failed == 0 else 1
+
+
+def main():
+    exitcode = 0
+    exitcode = max(exitcode, test_cases())
+    exitcode = max(exitcode, test_random())
+    return exitcode
+
+
+exit(main())